@@ -74,8 +74,26 @@ fi
 
 FILES_ARRAY=()
 send_media_group_to_telegram() {
-    output=$(python src/ice_runner/bot/telegram/helper.py $BOT_TOKEN $CHAT_ID $FILES_ARRAY "Logs backup from ${DIR_TO_WATCH}")
-    echo $output
+    # the caption is attached to the last file of the group
+    local MEDIA=()
+    local FILES_PAYLOAD=()
+    local IDX=0
+    for FILE in "${FILES_ARRAY[@]}"; do
+        IDX=$((IDX + 1))
+        if [ $IDX -eq ${#FILES_ARRAY[@]} ]; then
+            MEDIA+=("{\"type\": \"document\", \"media\": \"attach://file$IDX\", \"caption\": \"Logs backup from ${DIR_TO_WATCH}\"}")
+        else
+            MEDIA+=("{\"type\": \"document\", \"media\": \"attach://file$IDX\"}")
+        fi
+        FILES_PAYLOAD+=(-F "file$IDX=@$FILE")
+    done
+    local MEDIA_JSON=$(IFS=,; echo "[${MEDIA[*]}]")
+    if curl -sf "https://api.telegram.org/bot$BOT_TOKEN/sendMediaGroup" -F "chat_id=$CHAT_ID" \
+            -F "media=$MEDIA_JSON" "${FILES_PAYLOAD[@]}" > /dev/null; then
+        echo 0
+    else
+        echo 1
+    fi
 }
 
 add_file_to_media_group() {
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to decode candump -L logs written by the Raspberry Pi to csv tables,
+    one table per DroneCAN data type. Multi-frame transfers are reassembled and decoded
+    with the DSDL definitions of the dronecan package, so the data of the types the runner
+    was not subscribed to is recovered as well. The log is split to segments decoded by
+    the process pool, every segment is streamed line by line'''
+
+import argparse
+import csv
+import glob
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Set, Tuple
+import dronecan
+from dronecan import dsdl
+from dronecan.transport import (ArrayValue, CompoundValue, Frame, PrimitiveValue, Transfer,
+                                TransferError, TransferManager, VoidValue)
+
+SEGMENT_SIZE = 64 * 1024 * 1024 # bytes of the log decoded by one task
+OVERLAP_SIZE = 64 * 1024 # bytes read after the segment to finish its started transfers
+TIME_COLUMN = "t"
+NODE_COLUMN = "source_node_id"
+
+def parse_line(line: bytes) -> Tuple[float, int, bytes, bool] | None:
+    """The function parses the line of candump -L log: (timestamp) interface id#data.
+        Returns timestamp, CAN id, data and CAN FD flag, None for other lines
+        and standard frames, DroneCAN uses extended frames only"""
+    try:
+        timestamp, _, frame = line.split()
+        can_id, data = frame.split(b"#", 1)
+        if len(can_id) != 8:
+            return None
+        canfd = data.startswith(b"#")
+        if canfd:
+            # CAN FD frame: id##<flags><data>
+            data = data[2:]
+        return float(timestamp[1:-1]), int(can_id, 16), bytes.fromhex(data.decode()), canfd
+    except ValueError:
+        return None
+
+def flatten(value: Any, name: str, row: Dict[str, Any]) -> None:
+    """The function adds fields of the decoded value to the row, nested names are joined
+        with underscore and array items are numbered as in the csv logs of the runner"""
+    if isinstance(value, CompoundValue):
+        if dronecan.is_union(value):
+            field_name = dronecan.get_active_union_field(value)
+            fields = {field_name: getattr(value, field_name)}
+        else:
+            fields = dronecan.get_fields(value)
+        for field_name, field in fields.items():
+            flatten(field, f"{name}_{field_name}" if name else field_name, row)
+    elif isinstance(value, ArrayValue):
+        data_type = dronecan.get_dronecan_data_type(value)
+        item_type = data_type.value_type
+        if data_type.mode == dsdl.ArrayType.MODE_DYNAMIC and \
+                item_type.category == dsdl.Type.CATEGORY_PRIMITIVE and item_type.bitlen == 8:
+            data = bytes(value)
+            text = data.decode("utf-8", errors="replace")
+            row[name] = text if text.isprintable() else data.hex()
+            return
+        for i, item in enumerate(value):
+            flatten(item, f"{name}_{i}", row)
+    elif isinstance(value, PrimitiveValue):
+        row[name] = value.value
+    elif not isinstance(value, VoidValue):
+        row[name] = value
+
+def get_type_name(transfer: Transfer) -> str:
+    """The function returns the full name of the data type, services have suffixes"""
+    name = dronecan.get_dronecan_data_type(transfer.payload).full_name
+    if transfer.service_not_message:
+        name += ".request" if transfer.request_not_response else ".response"
+    return name
+
+class TableWriter:
+    """The class writes decoded transfers to csv tables of the types. The fields differ
+        between transfers of one type, e.g. items of dynamic arrays, so the new fields
+        are appended to the columns of the type and the rows are written without header.
+        The columns are written to the .columns file of the table on close"""
+    def __init__(self, directory: str, suffix: str = "") -> None:
+        self.directory = directory
+        self.suffix = suffix
+        self.files: Dict[str, Any] = {}
+        self.writers: Dict[str, Any] = {}
+        self.columns: Dict[str, Dict[str, int]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def write(self, type_name: str, row: Dict[str, Any]) -> None:
+        if type_name not in self.writers:
+            path = os.path.join(self.directory, f"{type_name}{self.suffix}.csv")
+            self.files[type_name] = open(path, "w", encoding="utf-8", newline="")
+            self.writers[type_name] = csv.writer(self.files[type_name])
+            self.columns[type_name] = {}
+        columns = self.columns[type_name]
+        for name in row:
+            columns.setdefault(name, len(columns))
+        values = [""] * len(columns)
+        for name, value in row.items():
+            values[columns[name]] = value
+        self.writers[type_name].writerow(values)
+        self.counts[type_name] = self.counts.get(type_name, 0) + 1
+
+    def close(self) -> None:
+        for type_name, file in self.files.items():
+            file.close()
+            with open(os.path.join(self.directory, f"{type_name}{self.suffix}.columns"), "w",
+                      encoding="utf-8", newline="") as columns_file:
+                csv.writer(columns_file).writerow(self.columns[type_name])
+
+def decode_segment(path: str, start: int, end: int, directory: str, index: int,
+                   types: Set[str] | None = None) -> Dict[str, int]:
+    """The function decodes transfers started in the segment [start, end) of the log.
+        Transfers started before the segment are decoded by the previous task, transfers
+        started in the segment are finished by reading up to OVERLAP_SIZE after it.
+        The tables are written to the directory with the suffix of the segment index.
+        Returns number of transfers of every type and number of errors"""
+    manager = TransferManager()
+    writer = TableWriter(directory, f".part{index:06d}")
+    stats: Dict[str, int] = {"errors": 0, "unknown": 0}
+    with open(path, "rb") as file:
+        if start > 0:
+            file.seek(start - 1)
+            # the segment starts after the end of the line crossing its start
+            file.readline()
+        position = file.tell()
+        for line in file:
+            position += len(line)
+            in_segment = position - len(line) < end
+            if not in_segment and (not manager.active_transfers or position > end + OVERLAP_SIZE):
+                break
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            timestamp, can_id, data, canfd = parsed
+            frame = Frame(can_id, data, ts_real=timestamp, canfd=canfd)
+            if not in_segment and frame.transfer_key not in manager.active_transfers:
+                continue
+            frames = manager.receive_frame(frame)
+            if not frames:
+                continue
+            transfer = Transfer()
+            try:
+                transfer.from_frames(frames)
+            except TransferError as e:
+                stats["unknown" if "Unrecognised" in str(e) else "errors"] += 1
+                continue
+            except Exception:
+                stats["errors"] += 1
+                continue
+            type_name = get_type_name(transfer)
+            if types is not None and type_name not in types:
+                continue
+            row = {TIME_COLUMN: transfer.ts_real, NODE_COLUMN: transfer.source_node_id}
+            flatten(transfer.payload, "", row)
+            writer.write(type_name, row)
+    writer.close()
+    stats.update(writer.counts)
+    return stats
+
+def read_columns(path: str) -> List[str]:
+    """The function returns the columns of the part of the table"""
+    with open(path[:-len(".csv")] + ".columns", "r", encoding="utf-8", newline="") as file:
+        return next(csv.reader(file))
+
+def merge_tables(directory: str, output_dir: str) -> None:
+    """The function joins parts of the tables in the order of the segments. The columns
+        of the table are the union of the columns of the parts in the order they appear,
+        the fields missing in the row are empty"""
+    parts: Dict[str, List[str]] = {}
+    for part in sorted(glob.glob(os.path.join(directory, "*.part*.csv"))):
+        type_name = os.path.basename(part).rsplit(".part", 1)[0]
+        parts.setdefault(type_name, []).append(part)
+    for type_name, paths in parts.items():
+        part_columns = [read_columns(path) for path in paths]
+        columns = list(dict.fromkeys(name for names in part_columns for name in names))
+        with open(os.path.join(output_dir, f"{type_name}.csv"), "w", encoding="utf-8",
+                  newline="") as output:
+            writer = csv.DictWriter(output, fieldnames=columns, restval="")
+            writer.writeheader()
+            for path, names in zip(paths, part_columns):
+                with open(path, "r", encoding="utf-8", newline="") as part_file:
+                    # rows written before the new fields appeared are shorter
+                    writer.writerows(dict(zip(names, values)) for values in csv.reader(part_file))
+
+def get_segments(path: str, segment_size: int = SEGMENT_SIZE) -> List[Tuple[int, int]]:
+    size = os.path.getsize(path)
+    return [(start, min(size, start + segment_size)) for start in range(0, size, segment_size)]
+
+def decode(path: str, output_dir: str, workers: int | None = None,
+           types: Set[str] | None = None, segment_size: int = SEGMENT_SIZE) -> Dict[str, int]:
+    """The function decodes the candump log to csv tables of the types in the output
+        directory. Returns number of transfers of every type and number of errors"""
+    os.makedirs(output_dir, exist_ok=True)
+    segments = get_segments(path, segment_size)
+    stats: Dict[str, int] = {}
+    with tempfile.TemporaryDirectory(dir=output_dir) as directory:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(decode_segment, path, start, end, directory, i, types)
+                       for i, (start, end) in enumerate(segments)]
+            for future in futures:
+                for name, count in future.result().items():
+                    stats[name] = stats.get(name, 0) + count
+        merge_tables(directory, output_dir)
+    return stats
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Decode candump -L log of the runner to csv tables of DroneCAN types')
+    parser.add_argument("--input", required=True, help="Path to candump log")
+    parser.add_argument("--output", default=None,
+                        help="Directory of the tables, default is the log name without suffix")
+    parser.add_argument("--workers", default=None, type=int,
+                        help="Number of decoding processes, default is number of CPUs")
+    parser.add_argument("--types", default=None, type=str,
+                        help="Comma separated full names of the types to decode, default is all")
+    parser.add_argument("--segment_size", default=SEGMENT_SIZE, type=int,
+                        help="Bytes of the log decoded by one task")
+    args: argparse.Namespace = parser.parse_args(args)
+    output = args.output or os.path.splitext(args.input)[0]
+    types = set(args.types.split(",")) if args.types else None
+    start_time = time.time()
+    stats = decode(args.input, output, args.workers, types, args.segment_size)
+    elapsed = time.time() - start_time
+    size = os.path.getsize(args.input) / 1024 / 1024
+    print(f"Decoded {size:.1f} MB in {elapsed:.1f} sec ({size / max(elapsed, 1e-6):.1f} MB/s)")
+    for name, count in sorted(stats.items()):
+        print(f"{name}: {count}")
+    logging.info("Tables are written to %s", output)
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to identify the engine model from the csv logs of recorded runs.
+    The status log of every run is resampled with the constant period and the first
+    order lags of RPM and the oil temperature are fitted with least squares: the normal
+    equations of every run are computed by the process pool and summed, so the runs are
+    fitted at once without keeping their samples. The fitted model is saved as json
+    with the lookup tables loaded by EngineModel of the simulator'''
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from analysis.run_statistics import STATE_COLUMN, STATUS_LOG, TIME_COLUMN
+from analysis.threshold_whatif import ACTIVE_STATES, parse_grid, read_log
+from ice_sim.EngineModel import EngineModel, get_weights
+
+RPM_COLUMN = "engine_speed_rpm"
+TEMPERATURE_COLUMN = "oil_temperature"
+GAS_COLUMN = "engine_load_percent"
+AIR_COLUMN = "throttle_position_percent"
+PERIOD = 0.1 # sec, the status is resampled with the period to fit RPM
+TEMPERATURE_PERIOD = 1 # sec, the oil temperature changes slower
+MAX_GAP = 1 # sec, samples farther from the last status are not used
+MAX_DELAY = 1 # sec
+TIME_TOLERANCE = 1e-6 # sec, samples at the same time up to the rounding are not delayed
+SMOOTHNESS = 1e-3 # weight of the differences of the neighbour cells of the tables
+THROTTLE_POINTS = "0,10,20,30,50,100"
+AIR_POINTS = "0,50,100"
+TEMPERATURE_RPM_POINTS = "0,2000,4000,6000,8000"
+
+def get_basis(axes: List[np.ndarray], inputs: List[np.ndarray]) -> np.ndarray:
+    """The function returns weights of the cells of the table in the linear
+        interpolation at the inputs, a row per sample, the table is flattened"""
+    shape = tuple(len(axis) for axis in axes)
+    size = len(inputs[0])
+    weights = [get_weights(axis, values) for axis, values in zip(axes, inputs)]
+    basis = np.zeros((size, int(np.prod(shape))))
+    rows = np.arange(size)
+    for corner in itertools.product((0, 1), repeat=len(axes)):
+        cells = np.ravel_multi_index([index + offset for (index, _), offset
+                                      in zip(weights, corner)], shape)
+        basis[rows, cells] += np.prod([weight if offset else 1 - weight for (_, weight), offset
+                                       in zip(weights, corner)], axis=0)
+    return basis
+
+class LagFit:
+    """The class accumulates the normal equations of the first order lag sampled with
+        the period: y[k + 1] = a * y[k] + sum of c * basis(u[k]). The steady values
+        of the table are c / (1 - a), the time constant is -period / ln(a)"""
+    def __init__(self, axes: List[np.ndarray], period: float) -> None:
+        self.axes = axes
+        self.period = period
+        size = int(np.prod([len(axis) for axis in axes])) + 1
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.count = 0
+
+    def add(self, values: np.ndarray, inputs: List[np.ndarray], valid: np.ndarray) -> None:
+        """The function adds the pairs of the successive samples, valid is the mask
+            of the pairs, the inputs of the pair are taken at its first sample"""
+        valid = valid & np.isfinite(values[:-1]) & np.isfinite(values[1:])
+        for item in inputs:
+            valid &= np.isfinite(item[:-1])
+        x = np.column_stack([get_basis(self.axes, [item[:-1][valid] for item in inputs]),
+                             values[:-1][valid]])
+        y = values[1:][valid]
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+        self.count += len(y)
+
+    def merge(self, other: "LagFit") -> None:
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+        self.count += other.count
+
+    def solve(self, smoothness: float = SMOOTHNESS) -> Tuple[np.ndarray, float, float]:
+        """The function returns the table of the steady values, the time constant
+            and RMS of the one step prediction. The differences of the neighbour cells
+            are penalized, so the cells without samples follow their neighbours"""
+        if self.count == 0:
+            raise ValueError("No samples to fit")
+        shape = tuple(len(axis) for axis in self.axes)
+        size = int(np.prod(shape))
+        cells = np.arange(size).reshape(shape)
+        differences = []
+        for axis in range(len(shape)):
+            left = np.delete(cells, -1, axis=axis).ravel()
+            right = np.delete(cells, 0, axis=axis).ravel()
+            difference = np.zeros((len(left), size + 1))
+            difference[np.arange(len(left)), left] = 1
+            difference[np.arange(len(left)), right] = -1
+            differences.append(difference)
+        penalty = np.concatenate(differences) if differences else np.zeros((0, size + 1))
+        scale = np.trace(self.xtx[:size, :size]) / size
+        theta = np.linalg.lstsq(self.xtx + smoothness * scale * penalty.T @ penalty,
+                                self.xty, rcond=None)[0]
+        a = theta[-1]
+        if not 0 < a < 1:
+            raise ValueError(f"The lag is not identified, y[k + 1] = {a:.3f} * y[k] + ...")
+        rss = self.yty - 2 * theta @ self.xty + theta @ self.xtx @ theta
+        return theta[:-1].reshape(shape) / (1 - a), -self.period / np.log(a), \
+            float(np.sqrt(max(rss, 0) / self.count))
+
+def get_grid(times: np.ndarray, period: float) -> Tuple[np.ndarray, np.ndarray]:
+    """The function returns the times resampled with the period and index of the last
+        sample before every time"""
+    grid = np.arange(times[0], times[-1], period)
+    index = np.searchsorted(times, grid + TIME_TOLERANCE, side="right") - 1
+    return grid, index
+
+def fit_run(path: str, throttle_points: np.ndarray, air_points: np.ndarray | None,
+            temperature_rpm_points: np.ndarray, delays: np.ndarray, period: float = PERIOD,
+            temperature_period: float = TEMPERATURE_PERIOD) -> Dict[str, Any]:
+    """The function returns the normal equations of RPM for every delay and of the oil
+        temperature accumulated from the status log of the run. RPM is fitted while
+        the engine is started, the temperature also while it cools down"""
+    axes = [throttle_points] if air_points is None else [throttle_points, air_points]
+    fits = {"rpm": [LagFit(axes, period) for _ in delays],
+            "temperature": LagFit([temperature_rpm_points], temperature_period)}
+    status = read_log(path, [TIME_COLUMN, STATE_COLUMN, RPM_COLUMN, TEMPERATURE_COLUMN,
+                             GAS_COLUMN, AIR_COLUMN])
+    order = np.argsort(status[TIME_COLUMN], kind="stable")
+    status = {column: values[order] for column, values in status.items()}
+    if len(order) < 2:
+        return fits
+    # the time from the start of the log keeps the precision of the resampling
+    times = status[TIME_COLUMN] - status[TIME_COLUMN][0]
+    active = np.isin(status[STATE_COLUMN], [state.value for state in ACTIVE_STATES])
+
+    grid, index = get_grid(times, period)
+    fresh = grid - times[index] <= MAX_GAP
+    valid = fresh & active[index]
+    rpm = np.interp(grid, times, status[RPM_COLUMN])
+    for fit, delay in zip(fits["rpm"], delays):
+        delayed = np.searchsorted(times, grid - delay + TIME_TOLERANCE, side="right") - 1
+        inputs = [np.where(delayed >= 0, status[column][np.maximum(delayed, 0)], np.nan)
+                  for column in ([GAS_COLUMN] if air_points is None else
+                                 [GAS_COLUMN, AIR_COLUMN])]
+        fit.add(rpm, inputs, valid[:-1] & valid[1:])
+
+    grid, index = get_grid(times, temperature_period)
+    fresh = grid - times[index] <= MAX_GAP
+    temperature = np.interp(grid, times, status[TEMPERATURE_COLUMN])
+    rpm = np.where(active[index], status[RPM_COLUMN][index], 0)
+    fits["temperature"].add(temperature, [rpm], fresh[:-1] & fresh[1:])
+    return fits
+
+def identify(paths: List[str], throttle_points: np.ndarray, air_points: np.ndarray | None,
+             temperature_rpm_points: np.ndarray, max_delay: float = MAX_DELAY,
+             period: float = PERIOD, smoothness: float = SMOOTHNESS,
+             workers: int | None = None) -> Tuple[EngineModel, Dict[str, Any]]:
+    """The function fits the engine model to the status logs of the runs. The delay
+        of the throttle is the one of the multiples of the period up to max_delay with
+        the least error of RPM. Returns the model and the errors of the fit"""
+    delays = np.arange(0, max_delay + period / 2, period)
+    axes = [throttle_points] if air_points is None else [throttle_points, air_points]
+    rpm_fits = [LagFit(axes, period) for _ in delays]
+    temperature_fit = LagFit([temperature_rpm_points], TEMPERATURE_PERIOD)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fit_run, path, throttle_points, air_points,
+                                   temperature_rpm_points, delays, period) for path in paths]
+        for future in futures:
+            fits = future.result()
+            for total, fit in zip(rpm_fits, fits["rpm"]):
+                total.merge(fit)
+            temperature_fit.merge(fits["temperature"])
+    solutions = []
+    for delay, fit in zip(delays, rpm_fits):
+        try:
+            solutions.append((fit.solve(smoothness), float(delay)))
+        except ValueError:
+            continue
+    if not solutions:
+        raise ValueError("RPM response is not identified from the logs")
+    (rpm_table, time_constant, rpm_rms), delay = min(solutions, key=lambda item: item[0][2])
+    temperature_table, temperature_time_constant, temperature_rms = \
+        temperature_fit.solve(smoothness)
+    model = EngineModel(throttle_points, rpm_table, float(time_constant), delay, air_points,
+                        temperature_rpm_points, temperature_table,
+                        float(temperature_time_constant))
+    return model, {"runs": len(paths), "samples": rpm_fits[0].count,
+                   "rpm_rms": rpm_rms, "temperature_rms": temperature_rms}
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Identify the engine model for the simulator from the status logs')
+    parser.add_argument("files", nargs="+",
+                        help="Csv logs of the runs, only the status logs are used")
+    parser.add_argument("--output", default="engine_model.json", help="Path of the model")
+    parser.add_argument("--throttle_points", default=THROTTLE_POINTS, type=parse_grid,
+                        help="Gas throttle points of the RPM table, %%")
+    parser.add_argument("--air_points", default=AIR_POINTS, type=str,
+                        help="Air throttle points of the RPM table, %%, "
+                             "'none' for the table of the gas throttle only")
+    parser.add_argument("--temperature_rpm_points", default=TEMPERATURE_RPM_POINTS,
+                        type=parse_grid, help="RPM points of the temperature table")
+    parser.add_argument("--max_delay", default=MAX_DELAY, type=float,
+                        help="Maximal delay of the throttle, sec")
+    parser.add_argument("--smoothness", default=SMOOTHNESS, type=float,
+                        help="Weight of the differences of the neighbour cells of the tables")
+    parser.add_argument("--workers", default=None, type=int,
+                        help="Number of processes, default is number of CPUs")
+    args: argparse.Namespace = parser.parse_args(args)
+    paths = [path for path in args.files if os.path.basename(path).startswith(STATUS_LOG)]
+    if not paths:
+        parser.error("no status logs")
+    air_points = None if args.air_points.lower() == "none" else parse_grid(args.air_points)
+    model, stats = identify(paths, args.throttle_points, air_points,
+                            args.temperature_rpm_points, args.max_delay,
+                            smoothness=args.smoothness, workers=args.workers)
+    model.to_file(args.output)
+    print(f"Runs: {stats['runs']}, samples: {stats['samples']}")
+    print(f"RPM: time constant {model.time_constant:.2f} sec, delay {model.delay:.1f} sec, "
+          f"error {stats['rpm_rms']:.0f}")
+    print(f"Temperature: time constant {model.temperature_time_constant:.0f} sec, "
+          f"error {stats['temperature_rms']:.2f} K")
+    print(f"The model is written to {args.output}")
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to tune the coefficients of the PID mode offline. The loop of
+    PIDController is simulated against the engine model from the start throttle to the
+    target RPM for every combination of the coefficients at once with numpy, the
+    combinations are ranked by the settling time, the overshoot and the throttle travel.
+    The best coefficients may be written to the runner configuration'''
+
+import argparse
+import itertools
+import json
+from typing import Any, Dict, List
+import numpy as np
+from analysis.threshold_whatif import parse_grid
+from ice_sim.EngineModel import EngineModel
+from raspberry.RunnerConfiguration import RunnerConfiguration
+
+MAX_COMMAND = 8191
+CONTROL_PERIOD = 0.2 # sec, period of the command update by ICECommander
+DURATION = 60 # sec
+TOLERANCE = 2 # %, RPM within the tolerance of the target is settled
+OVERSHOOT_WEIGHT = 1 # sec of the settling time per % of the overshoot
+EFFORT_WEIGHT = 0.05 # sec of the settling time per % of the throttle travel
+GAIN_GRIDS = {"control_pid_p": "0:0.3:20", "control_pid_i": "0:0.2:20",
+              "control_pid_d": "0:0.05:20"}
+
+def simulate(model: EngineModel, gains: np.ndarray, target: float, start_command: float,
+             min_command: float, max_command: float, duration: float = DURATION,
+             period: float = CONTROL_PERIOD, tolerance: float = TOLERANCE, air: float = 100
+             ) -> Dict[str, np.ndarray]:
+    """The function simulates PIDController with every row kp, ki, kd of the gains against
+        the engine model at the constant air throttle, %, as PIDMode keeps it. The engine
+        runs at the start command when the controller starts, as PIDMode starts from
+        the command of the starting state. The trajectories are not
+        stored, every step updates the metrics of all combinations: the overshoot, %
+        of the target, the settling time, inf if RPM leaves the tolerance at the end,
+        and the throttle travel, %"""
+    kp, ki, kd = np.asarray(gains, dtype=np.float64).T
+    size = len(kp)
+    steps = int(round(duration / period))
+    delay_steps = int(round(model.delay / period))
+    rpm = np.full(size, float(model.get_steady_rpm(start_command * 100 / MAX_COMMAND, air)))
+    direction = 1 if target >= rpm[0] else -1
+    band = target * tolerance / 100
+    prev_error = target - rpm
+    prev_command = np.full(size, float(start_command))
+    integral = np.zeros(size)
+    # commands sent, the engine responds to the command sent delay_steps before
+    sent = np.full((delay_steps + 1, size), float(int(start_command)))
+    overshoot = np.zeros(size)
+    travel = np.zeros(size)
+    last_unsettled = np.full(size, -1)
+    with np.errstate(all="ignore"):
+        for step in range(steps):
+            error = target - rpm
+            integral += ki * error * period
+            command = prev_command + kp * error + kd * (error - prev_error) / period + \
+                      ki * integral
+            command = np.clip(command, min_command, max_command)
+            prev_error = error
+            prev_command = command
+            command = np.trunc(command)
+            travel += np.abs(command - sent[(step - 1) % len(sent)])
+            sent[step % len(sent)] = command
+            rpm = model.step(rpm, sent[(step - delay_steps) % len(sent)] * 100 / MAX_COMMAND,
+                             period, air)
+            overshoot = np.maximum(overshoot, direction * (rpm - target))
+            last_unsettled[~(np.abs(rpm - target) <= band)] = step
+    settling_time = (last_unsettled + 1) * period
+    settling_time[last_unsettled == steps - 1] = np.inf
+    return {"overshoot": overshoot * 100 / target,
+            "settling_time": settling_time,
+            "effort": travel * 100 / MAX_COMMAND}
+
+def get_cost(results: Dict[str, np.ndarray], overshoot_weight: float = OVERSHOOT_WEIGHT,
+             effort_weight: float = EFFORT_WEIGHT) -> np.ndarray:
+    """The function returns the cost of every combination, the lower is better"""
+    return results["settling_time"] + overshoot_weight * results["overshoot"] + \
+        effort_weight * results["effort"]
+
+def get_gain_grid(grids: Dict[str, np.ndarray]) -> np.ndarray:
+    """The function returns all combinations of the coefficients as rows kp, ki, kd"""
+    return np.array(list(itertools.product(*grids.values())), dtype=np.float64).reshape(-1, 3)
+
+def tune(model: EngineModel, configuration: RunnerConfiguration, grids: Dict[str, np.ndarray],
+         duration: float = DURATION, overshoot_weight: float = OVERSHOOT_WEIGHT,
+         effort_weight: float = EFFORT_WEIGHT, top: int = 10) -> List[Dict[str, Any]]:
+    """The function returns the best combinations of the coefficients for the target RPM,
+        the gas throttle limits and the air throttle of the configuration, sorted by the cost"""
+    gains = get_gain_grid(grids)
+    results = simulate(model, gains, configuration.rpm,
+                       MAX_COMMAND * configuration.gas_throttle_pct / 100,
+                       MAX_COMMAND * configuration.min_gas_throttle_pct / 100,
+                       MAX_COMMAND * configuration.max_gas_throttle_pct / 100, duration,
+                       air=configuration.air_throttle_pct)
+    cost = get_cost(results, overshoot_weight, effort_weight)
+    order = np.argsort(cost, kind="stable")[:top]
+    return [{"control_pid_p": float(gains[i, 0]),
+             "control_pid_i": float(gains[i, 1]),
+             "control_pid_d": float(gains[i, 2]),
+             "overshoot": float(results["overshoot"][i]),
+             "settling_time": float(results["settling_time"][i]),
+             "effort": float(results["effort"][i]),
+             "cost": float(cost[i])} for i in order]
+
+def write_gains(configuration: RunnerConfiguration, row: Dict[str, Any]) -> None:
+    """The function writes the coefficients to the file of the configuration"""
+    for name in GAIN_GRIDS:
+        setattr(configuration, name, round(row[name], 6))
+    configuration.to_file()
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Tune PID mode coefficients against the engine model')
+    parser.add_argument("--config", default="ice_configuration.yml",
+                        help="Runner configuration with the target RPM and the gas throttle "
+                             "limits, the best coefficients are written to it with --write")
+    parser.add_argument("--model", default=None,
+                        help="Engine model json identified from the logs, "
+                             "default is the model with the default tables")
+    for name, grid in GAIN_GRIDS.items():
+        parser.add_argument(f"--{name}", default=parse_grid(grid), type=parse_grid,
+                            help=f"Comma separated values or start:stop[:number], "
+                                 f"default is {grid}")
+    parser.add_argument("--duration", default=DURATION, type=float,
+                        help="Simulated time of the run, sec")
+    parser.add_argument("--overshoot_weight", default=OVERSHOOT_WEIGHT, type=float,
+                        help="Cost of the overshoot, sec per %% of the target RPM")
+    parser.add_argument("--effort_weight", default=EFFORT_WEIGHT, type=float,
+                        help="Cost of the throttle travel, sec per %%")
+    parser.add_argument("--top", default=10, type=int, help="Number of the best combinations")
+    parser.add_argument("--write", action="store_true",
+                        help="Write the best coefficients to the configuration")
+    parser.add_argument("--json", action="store_true", help="Print the results as json")
+    args: argparse.Namespace = parser.parse_args(args)
+    configuration = RunnerConfiguration(file_path=args.config)
+    model = EngineModel.from_file(args.model) if args.model else EngineModel()
+    grids = {name: getattr(args, name) for name in GAIN_GRIDS}
+    rows = tune(model, configuration, grids, args.duration, args.overshoot_weight,
+                args.effort_weight, args.top)
+    if args.write and rows and np.isfinite(rows[0]["cost"]):
+        write_gains(configuration, rows[0])
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print("p\ti\td\tovershoot, %\tsettling, s\tthrottle travel, %")
+    for row in rows:
+        print(f"{row['control_pid_p']:g}\t{row['control_pid_i']:g}\t{row['control_pid_d']:g}\t"
+              f"{row['overshoot']:.1f}\t{row['settling_time']:.1f}\t{row['effort']:.1f}")
+
+if __name__ == "__main__":
+    start()
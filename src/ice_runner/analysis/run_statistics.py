@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to summarize the run from the csv logs written by the dronecan
+    handlers of the Raspberry Pi. Files are streamed by chunks of rows and every chunk
+    is parsed and processed with numpy, statistics of the channels are updated with
+    constant memory, so the memory does not depend on the size of the logs'''
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+import numpy as np
+from raspberry.can_control.EngineState import EngineState
+
+CHUNK_ROWS = 50000
+TIME_COLUMN = "t"
+STATUS_LOG = "uavcan.equipment.ice.reciprocating.Status"
+STATE_COLUMN = "state"
+QUANTILES = (0.05, 0.5, 0.95)
+SKETCH_ACCURACY = 0.001 # relative error of the quantiles, 0.35 K of the temperature
+# channels of the status log in the summary: label and offset of the value
+SUMMARY_CHANNELS: Dict[str, Tuple[str, float]] = {
+    "engine_speed_rpm":             ("RPM", 0),
+    "oil_temperature":              ("TEMP, °C", -273.15),
+    "engine_load_percent":          ("GAS, %", 0),
+    "throttle_position_percent":    ("AIR, %", 0),
+    "oil_pressure":                 ("VIN, V", 0),
+}
+# channels of the summary accumulated by the Raspberry Pi during the run
+RUNNER_SUMMARY_CHANNELS: Dict[str, Tuple[str, float]] = {
+    "rpm":                  ("RPM", 0),
+    "temp":                 ("TEMP, °C", -273.15),
+    "gas_throttle":         ("GAS, %", 0),
+    "air_throttle":         ("AIR, %", 0),
+    "voltage_in":           ("VIN, V", 0),
+    "vibration":            ("VIBRATION", 0),
+    "fuel_level_percent":   ("FUEL, %", 0),
+}
+# drifting metrics of the engine history: label and offset of the value
+ENGINE_DRIFT_LABELS: Dict[str, Tuple[str, float]] = {
+    "starter_engagements":  ("включений стартера", 0),
+    "max_temperature":      ("макс. TEMP, °C", -273.15),
+    "max_vibration":        ("макс. VIBRATION", 0),
+    "rpm_instability":      ("нестабильность RPM", 0),
+}
+# configuration parameters of the runner limiting the channels of the status log
+THRESHOLD_PARAMETERS: Dict[str, str] = {
+    "max_rpm": "engine_speed_rpm",
+    "max_temperature": "oil_temperature",
+}
+
+class QuantileSketch:
+    """The class estimates quantiles of the stream with relative error, values are counted
+        in buckets growing exponentially (DDSketch), so the number of buckets depends
+        only on the range of the values. Zero and negative values have own buckets"""
+    def __init__(self, relative_accuracy: float = SKETCH_ACCURACY) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def add_to_store(self, store: Dict[int, int], values: np.ndarray) -> None:
+        """The function counts the absolute values in the buckets of the store"""
+        keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def add(self, values: np.ndarray) -> None:
+        """The function adds the values to the sketch"""
+        self.add_to_store(self.positive, values[values > 0])
+        self.add_to_store(self.negative, -values[values < 0])
+        self.zero += int(np.count_nonzero(values == 0))
+        self.count += len(values)
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """The function adds the values of the other sketch with the same accuracy"""
+        for store, other_store in ((self.positive, other.positive),
+                                   (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """The function returns the estimation of the quantile, nan if the sketch is empty"""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self.get_value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self.get_value(key)
+        return self.get_value(max(self.positive))
+
+    def get_value(self, key: int) -> float:
+        """The function returns the value of the bucket with the relative error"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+class ChannelStatistics:
+    """The class accumulates statistics of one channel of the log"""
+    def __init__(self) -> None:
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        self.sketch = QuantileSketch()
+
+    def update(self, values: np.ndarray) -> None:
+        """The function adds the chunk of values, nan values are skipped"""
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.sum += float(values.sum())
+        self.sketch.add(values)
+
+    def get_mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def to_dict(self) -> Dict[str, float]:
+        result = {"count": self.count, "min": self.min, "max": self.max, "mean": self.get_mean()}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = self.sketch.quantile(q)
+        return result
+
+class RunStatistics:
+    """The class accumulates statistics of the run: statistics of every numeric channel
+        of every log, time of the engine in every state, number of start attempts and
+        time of the status channels above the thresholds"""
+    def __init__(self, thresholds: Dict[str, float] | None = None) -> None:
+        self.thresholds: Dict[str, float] = thresholds or {}
+        self.channels: Dict[str, Dict[str, ChannelStatistics]] = {}
+        self.state_time: Dict[str, float] = {}
+        self.threshold_time: Dict[str, float] = {name: 0.0 for name in self.thresholds}
+        self.start_attempts = 0
+        self.duration = 0.0
+        # the last row of the previous chunk of the status log
+        self.last_time: float | None = None
+        self.last_row: Dict[str, float] = {}
+
+    def update(self, log_name: str, columns: Dict[str, np.ndarray]) -> None:
+        """The function adds the chunk of the log"""
+        channels = self.channels.setdefault(log_name, {})
+        for name, values in columns.items():
+            if name != TIME_COLUMN:
+                channels.setdefault(name, ChannelStatistics()).update(values)
+        if log_name == STATUS_LOG and TIME_COLUMN in columns:
+            self.update_status(columns)
+
+    def update_status(self, columns: Dict[str, np.ndarray]) -> None:
+        """The function adds the chunk of the status log. The interval between two rows
+            is counted to the state and the values of the first row"""
+        times = columns[TIME_COLUMN]
+        names = [STATE_COLUMN] + list(self.thresholds)
+        if self.last_time is not None:
+            times = np.concatenate(([self.last_time], times))
+            columns = {name: np.concatenate(([self.last_row.get(name, np.nan)], columns[name]))
+                       for name in names if name in columns}
+        if len(times) < 2:
+            self.save_last_row(times, columns, names)
+            return
+        intervals = np.diff(times)
+        self.duration += float(intervals.sum())
+        if STATE_COLUMN in columns:
+            states = columns[STATE_COLUMN]
+            for state in np.unique(states[:-1][~np.isnan(states[:-1])]):
+                name = get_state_name(int(state))
+                self.state_time[name] = self.state_time.get(name, 0.0) + \
+                    float(intervals[states[:-1] == state].sum())
+            starting = states == EngineState.STARTER_RUNNING
+            self.start_attempts += int(np.count_nonzero(starting[1:] & ~starting[:-1]))
+            if self.last_time is None and starting[0]:
+                self.start_attempts += 1
+        for name, limit in self.thresholds.items():
+            if name in columns:
+                self.threshold_time[name] += float(intervals[columns[name][:-1] > limit].sum())
+        self.save_last_row(times, columns, names)
+
+    def save_last_row(self, times: np.ndarray, columns: Dict[str, np.ndarray],
+                      names: List[str]) -> None:
+        if len(times) == 0:
+            return
+        self.last_time = float(times[-1])
+        self.last_row = {name: float(columns[name][-1]) for name in names if name in columns}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "duration": self.duration,
+            "start_attempts": self.start_attempts,
+            "state_time": self.state_time,
+            "threshold_time": self.threshold_time,
+            "channels": {log_name: {name: channel.to_dict() for name, channel in channels.items()
+                                    if channel.count}
+                         for log_name, channels in self.channels.items()},
+        }
+
+    def format(self) -> str:
+        """The function returns compact summary of the run for the Telegram message"""
+        summary = f"Сводка обкатки ({self.duration / 60:.1f} мин):\n"
+        status_channels = self.channels.get(STATUS_LOG, {})
+        for name, (label, offset) in SUMMARY_CHANNELS.items():
+            channel = status_channels.get(name)
+            if channel is None or channel.count == 0:
+                continue
+            values = [channel.min, channel.get_mean(), channel.sketch.quantile(0.5),
+                      channel.sketch.quantile(0.95), channel.max]
+            summary += f"{label}: " + " / ".join(
+                f"{key} {value + offset:.0f}" for key, value in
+                zip(("min", "mean", "p50", "p95", "max"), values)) + "\n"
+        if self.state_time:
+            summary += "Состояния: " + ", ".join(
+                f"{name} {time / 60:.1f} мин" for name, time in self.state_time.items()) + "\n"
+        summary += f"Попыток запуска: {self.start_attempts}\n"
+        exceeded = {name: time for name, time in self.threshold_time.items() if time > 0}
+        if exceeded:
+            summary += "Выше порога: " + ", ".join(
+                f"{SUMMARY_CHANNELS.get(name, (name, 0))[0]} {time:.1f} сек"
+                for name, time in exceeded.items()) + "\n"
+        return summary
+
+def format_runner_summary(summary: Dict[str, Any]) -> str:
+    """The function returns compact text of the summary accumulated by the Raspberry Pi"""
+    text = f"Сводка обкатки ({summary['duration'] / 60:.1f} мин):\n"
+    for name, (label, offset) in RUNNER_SUMMARY_CHANNELS.items():
+        channel = summary["channels"].get(name)
+        if channel is None or channel["count"] == 0:
+            continue
+        text += f"{label}: min {channel['min'] + offset:.0f} / " \
+                f"mean {channel['mean'] + offset:.0f} ± {channel['std']:.0f} / " \
+                f"max {channel['max'] + offset:.0f}\n"
+    if summary["state_time"]:
+        text += "Состояния: " + ", ".join(f"{name} {time / 60:.1f} мин"
+                                          for name, time in summary["state_time"].items()) + "\n"
+    text += f"Включений стартера: {summary['starter_engagements']}, " \
+            f"попыток запуска: {summary['start_attempts']}\n"
+    return text
+
+def format_engine_history(history: Dict[str, Any]) -> str:
+    """The function returns compact text of the engine history sent with the run summary"""
+    text = f"Двигатель: обкаток {history['runs']}, " \
+           f"наработка {history['engaged_hours']:.1f} ч, " \
+           f"попыток запуска за обкатку {history['start_attempts_per_run']:.1f}\n"
+    for drift in history["drifts"]:
+        label, offset = ENGINE_DRIFT_LABELS.get(drift["metric"], (drift["metric"], 0))
+        text += f"Отклонение: {label} {drift['value'] + offset:.2f}, " \
+                f"в первых обкатках {drift['baseline'] + offset:.2f}\n"
+    return text
+
+def get_state_name(state: int) -> str:
+    try:
+        return EngineState(state).name
+    except ValueError:
+        return str(state)
+
+def parse_column(values: List[str]) -> np.ndarray:
+    """The function converts the column of the chunk to floats, values which are
+        not numbers are nan"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        return np.array([float(value) if is_number(value) else np.nan for value in values])
+
+def is_number(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def read_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+    """The function yields numeric columns of the csv log by chunks of rows. Columns
+        which are not numbers in the first row, e.g. nested messages, are skipped"""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        numeric: List[int] | None = None
+        while True:
+            rows = [row for row in itertools.islice(reader, chunk_rows) if len(row) == len(header)]
+            if not rows:
+                return
+            if numeric is None:
+                numeric = [i for i, value in enumerate(rows[0]) if is_number(value)]
+            # transposed chunk, every column is parsed at once
+            cells = list(zip(*rows))
+            yield {header[i]: parse_column(cells[i]) for i in numeric}
+
+def get_thresholds(configuration: Dict[str, Any]) -> Dict[str, float]:
+    """The function returns limits of the status channels from the runner configuration,
+        zero limits are disabled"""
+    thresholds = {}
+    for parameter, channel in THRESHOLD_PARAMETERS.items():
+        value = configuration.get(parameter)
+        if isinstance(value, (int, float)) and value != 0:
+            thresholds[channel] = float(value)
+    return thresholds
+
+def analyze_run(log_files: Dict[str, str], thresholds: Dict[str, float] | None = None,
+                chunk_rows: int = CHUNK_ROWS) -> RunStatistics:
+    """The function computes statistics of the run from its csv logs, the candump
+        and missing files are skipped"""
+    statistics = RunStatistics(thresholds)
+    for log_name, path in log_files.items():
+        if not path or not path.endswith(".csv"):
+            continue
+        try:
+            for columns in read_chunks(path, chunk_rows):
+                statistics.update(log_name, columns)
+        except OSError:
+            continue
+    return statistics
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Summary of the run from the csv logs of the Raspberry Pi')
+    parser.add_argument("files", nargs="+",
+                        help="Csv logs of the run, the name of the log is the message type "
+                             "before the first underscore of the file name")
+    parser.add_argument("--max_rpm", default=0, type=float, help="RPM threshold")
+    parser.add_argument("--max_temperature", default=0, type=float,
+                        help="Temperature threshold, K")
+    parser.add_argument("--json", action="store_true", help="Print all channels as json")
+    args: argparse.Namespace = parser.parse_args(args)
+    log_files = {os.path.basename(path).split("_")[0]: path for path in args.files}
+    statistics = analyze_run(log_files, get_thresholds(vars(args)))
+    if args.json:
+        print(json.dumps(statistics.to_dict(), indent=2))
+    else:
+        print(statistics.format())
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to evaluate stop thresholds of the runner configuration on the csv
+    logs of past runs. For every candidate threshold the script finds the runs which would
+    have been stopped and the time of the stop, with the rules of ExceedanceTracker and
+    the debounce of ICECommander.check_conditions. Every run is evaluated with numpy
+    over all samples and all candidate thresholds at once'''
+
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from analysis.run_statistics import STATE_COLUMN, STATUS_LOG, TIME_COLUMN, read_chunks
+from raspberry.can_control.EngineState import EngineState
+
+IMU_LOG = "uavcan.equipment.ahrs.RawIMU"
+DEBOUNCE_TIME = 2 # sec, conditions exceeded longer stop the run, see ICECommander
+GRID_SIZE = 100
+# the runner checks the conditions in STARTING and RUNNING states, the engine is active then
+ACTIVE_STATES = (EngineState.STARTER_RUNNING, EngineState.STARTER_WAITING)
+# configuration parameter: log, column, the flag is latched until the end of the run,
+# zero value disables the check
+WHATIF_PARAMETERS: Dict[str, Tuple[str, str, bool, bool]] = {
+    "max_temperature": (STATUS_LOG, "oil_temperature", False, True),
+    "max_rpm": (STATUS_LOG, "engine_speed_rpm", True, False),
+    "max_vibration": (IMU_LOG, "integration_interval", False, False),
+}
+
+class RunTelemetry:
+    """The class keeps channels of the run limited by the configuration parameters.
+        Samples of the stopped engine are -inf, so they never exceed the threshold"""
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start_time: float | None = None
+        self.channels: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def add_channel(self, parameter: str, times: np.ndarray, values: np.ndarray) -> None:
+        order = np.argsort(times, kind="stable")
+        values = np.where(np.isnan(values), -np.inf, values)
+        self.channels[parameter] = (times[order], values[order])
+
+def read_log(path: str, columns: List[str]) -> Dict[str, np.ndarray]:
+    """The function reads the columns of the csv log to arrays, missing columns are empty"""
+    chunks: Dict[str, List[np.ndarray]] = {column: [] for column in columns}
+    for chunk in read_chunks(path):
+        size = len(next(iter(chunk.values()), []))
+        for column in columns:
+            chunks[column].append(chunk.get(column, np.full(size, np.nan)))
+    return {column: np.concatenate(values) if values else np.empty(0)
+            for column, values in chunks.items()}
+
+def load_run(name: str, log_files: Dict[str, str]) -> RunTelemetry:
+    """The function loads the channels of the run from its csv logs. The engine state
+        of the status log marks active samples, samples of other logs take the state
+        of the last status before them"""
+    run = RunTelemetry(name)
+    if STATUS_LOG not in log_files:
+        return run
+    status_columns = [column for log, column, _, _ in WHATIF_PARAMETERS.values()
+                      if log == STATUS_LOG]
+    status = read_log(log_files[STATUS_LOG], [TIME_COLUMN, STATE_COLUMN] + status_columns)
+    order = np.argsort(status[TIME_COLUMN], kind="stable")
+    status_times = status[TIME_COLUMN][order]
+    active = np.isin(status[STATE_COLUMN][order], [state.value for state in ACTIVE_STATES])
+    if not active.any():
+        return run
+    run.start_time = float(status_times[active][0])
+    for parameter, (log, column, _, _) in WHATIF_PARAMETERS.items():
+        if log == STATUS_LOG:
+            values = np.where(active, status[column][order], -np.inf)
+            run.add_channel(parameter, status_times, values)
+        elif log in log_files:
+            data = read_log(log_files[log], [TIME_COLUMN, column])
+            index = np.searchsorted(status_times, data[TIME_COLUMN], side="right") - 1
+            log_active = (index >= 0) & active[np.maximum(index, 0)]
+            run.add_channel(parameter, data[TIME_COLUMN], np.where(log_active, data[column],
+                                                                   -np.inf))
+    return run
+
+def range_min(values: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """The function returns minimums of values[start:end + 1] for every pair of the indices.
+        The minimums of the windows of 2^level samples are computed once for every level
+        (sparse table), then every range is covered by two windows"""
+    n = len(values)
+    table = [values]
+    width = 1
+    while 2 * width <= n:
+        prev = table[-1]
+        level = np.full(n, np.inf)
+        level[:n - width] = np.minimum(prev[:n - width], prev[width:])
+        table.append(level)
+        width *= 2
+    levels = np.log2(np.maximum(end - start + 1, 1)).astype(np.int64)
+    table = np.stack(table)
+    return np.minimum(table[levels, start], table[levels, end - (1 << levels) + 1])
+
+def get_stop_times(times: np.ndarray, values: np.ndarray, thresholds: np.ndarray,
+                   latched: bool = False, debounce: float = DEBOUNCE_TIME) -> np.ndarray:
+    """The function returns the time of the stop of the run for every threshold, nan
+        if the run would not be stopped. The value exceeds the threshold if it is greater
+        and is held until the next sample. The stop happens when the threshold is exceeded
+        longer than debounce, latched flags stop the run debounce after the first exceeding.
+        The stop for the threshold is at the first sample starting such exceeding, so the
+        largest value sustained since every sample is computed once for all thresholds"""
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    stop_times = np.full(len(thresholds), np.nan)
+    if len(times) == 0:
+        return stop_times
+    if latched:
+        sustained = values
+    else:
+        # samples held till t[i] + debounce: i..last, the log must continue after it
+        last = np.searchsorted(times, times + debounce, side="right") - 1
+        sustained = range_min(values, np.arange(len(times)), last)
+        sustained[last == len(times) - 1] = -np.inf
+    peaks = np.maximum.accumulate(sustained)
+    first = np.searchsorted(peaks, thresholds, side="right")
+    stopped = first < len(times)
+    stop_times[stopped] = times[first[stopped]] + debounce
+    return stop_times
+
+def evaluate(runs: List[RunTelemetry], grids: Dict[str, np.ndarray],
+             debounce: float = DEBOUNCE_TIME) -> Dict[str, np.ndarray]:
+    """The function returns the time from the start of the run to the stop for every
+        parameter as the array of runs x thresholds, nan if the run is not stopped"""
+    results = {}
+    for parameter, grid in grids.items():
+        _, _, latched, zero_disables = WHATIF_PARAMETERS[parameter]
+        grid = np.asarray(grid, dtype=np.float64)
+        stop_times = np.full((len(runs), len(grid)), np.nan)
+        for i, run in enumerate(runs):
+            if parameter not in run.channels:
+                continue
+            times, values = run.channels[parameter]
+            stop_times[i] = get_stop_times(times, values, grid, latched, debounce) - \
+                            run.start_time
+        if zero_disables:
+            stop_times[:, grid == 0] = np.nan
+        results[parameter] = stop_times
+    return results
+
+def summarize(grid: np.ndarray, stop_times: np.ndarray) -> List[Dict[str, Any]]:
+    """The function returns number of stopped runs and time to stop for every threshold"""
+    stopped = ~np.isnan(stop_times)
+    counts = stopped.sum(axis=0)
+    rows = []
+    for j, threshold in enumerate(grid):
+        times = stop_times[stopped[:, j], j]
+        rows.append({
+            "threshold": float(threshold),
+            "stopped": int(counts[j]),
+            "min_time": float(times.min()) if counts[j] else None,
+            "median_time": float(np.median(times)) if counts[j] else None,
+        })
+    return rows
+
+def get_runs(paths: List[str]) -> Dict[str, Dict[str, str]]:
+    """The function groups csv logs to runs, the log name is {message type}_{run time}.csv"""
+    runs: Dict[str, Dict[str, str]] = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        log_name, _, run_name = name.partition("_")
+        runs.setdefault(os.path.join(os.path.dirname(path), run_name), {})[log_name] = path
+    return runs
+
+def parse_grid(value: str) -> np.ndarray:
+    """The function parses the grid: comma separated thresholds or start:stop[:number]"""
+    if ":" in value:
+        bounds = value.split(":")
+        number = int(bounds[2]) if len(bounds) > 2 else GRID_SIZE
+        return np.linspace(float(bounds[0]), float(bounds[1]), number)
+    return np.array([float(threshold) for threshold in value.split(",")])
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Number of past runs which would be stopped with candidate thresholds')
+    parser.add_argument("files", nargs="+",
+                        help="Csv logs of the runs, the logs of the run have the same time "
+                             "after the message type in the file name")
+    for parameter in WHATIF_PARAMETERS:
+        parser.add_argument(f"--{parameter}", default=None, type=parse_grid,
+                            help="Comma separated thresholds or start:stop[:number]")
+    parser.add_argument("--json", action="store_true", help="Print the results as json")
+    args: argparse.Namespace = parser.parse_args(args)
+    grids = {parameter: getattr(args, parameter) for parameter in WHATIF_PARAMETERS
+             if getattr(args, parameter) is not None}
+    if not grids:
+        parser.error("at least one threshold grid is required")
+    runs = [load_run(name, log_files) for name, log_files in sorted(get_runs(args.files).items())]
+    runs = [run for run in runs if run.start_time is not None]
+    results = {parameter: summarize(grids[parameter], stop_times)
+               for parameter, stop_times in evaluate(runs, grids).items()}
+    if args.json:
+        print(json.dumps({"runs": len(runs), "results": results}, indent=2))
+        return
+    print(f"Runs: {len(runs)}")
+    for parameter, rows in results.items():
+        print(f"\n{parameter}\tstopped\tmin, s\tmedian, s")
+        for row in rows:
+            times = [f"{row[key]:.1f}" if row[key] is not None else "-"
+                     for key in ("min_time", "median_time")]
+            print(f"{row['threshold']:g}\t{row['stopped']}\t{times[0]}\t{times[1]}")
+
+if __name__ == "__main__":
+    start()
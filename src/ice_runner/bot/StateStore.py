@@ -0,0 +1,61 @@
+"""The module defines versions of the data received by the bot with change notifications"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+import time
+from typing import Callable, Dict, Hashable
+
+class StateStore:
+    """The class counts versions of the data received for every key: runner id or
+        request id. Every change increments the version of the key and wakes up
+        coroutines waiting for it, so the bot awaits updates instead of polling.
+        The store is used only from the asyncio loop of the bot"""
+    def __init__(self) -> None:
+        self.versions: Dict[Hashable, int] = {}
+        self.changed: Dict[Hashable, asyncio.Event] = {}
+
+    def get_version(self, key: Hashable) -> int:
+        """The function returns the version of the key, 0 if nothing is received"""
+        return self.versions.get(key, 0)
+
+    def notify(self, key: Hashable) -> int:
+        """The function increments the version of the key and wakes up its waiters"""
+        self.versions[key] = self.get_version(key) + 1
+        event = self.changed.pop(key, None)
+        if event is not None:
+            event.set()
+        return self.versions[key]
+
+    def forget(self, key: Hashable) -> None:
+        """The function removes the key which is not used anymore, e.g. finished request"""
+        self.versions.pop(key, None)
+        event = self.changed.pop(key, None)
+        if event is not None:
+            event.set()
+
+    async def wait_change(self, key: Hashable, version: int, timeout: float) -> bool:
+        """The function waits until the version of the key is newer than the specified one.
+            Returns False on timeout"""
+        if self.get_version(key) > version:
+            return True
+        event = self.changed.setdefault(key, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.get_version(key) > version
+
+    async def wait_for(self, key: Hashable, predicate: Callable[[], bool],
+                       timeout: float) -> bool:
+        """The function waits until the predicate is true, the predicate is checked
+            after every change of the key. Returns False on timeout"""
+        end_time = time.time() + timeout
+        while not predicate():
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return False
+            await self.wait_change(key, self.get_version(key), remaining)
+        return True
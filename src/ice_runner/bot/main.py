@@ -19,6 +19,7 @@ from aiogram.client.default import DefaultBotProperties
 import bot.mqtt.handlers as mqtt
 import bot.telegram.handlers as telegram
 from bot.telegram.scheduler import Scheduler
+from bot.telegram.throttler import RateLimiter
 from common import logging_configurator
 
 # Global variable to store tasks for cleanup
@@ -51,6 +52,7 @@ async def start_bot() -> None:
     telegram.RUNNER_ID = int(os.getenv("RUNNER_ID"))
     telegram.ChatIdFilter.chat_id = chat_id
     bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(RateLimiter())
 
     mqtt.MqttClient.connect(server_ip=server_ip, port=server_port)
 
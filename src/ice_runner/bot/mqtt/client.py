@@ -5,11 +5,19 @@
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
 import asyncio
+import json
 import logging
 import sys
-from typing import Any, Dict
-from paho.mqtt.client import MQTTv311, Client
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+from paho.mqtt.client import MQTTv311, Client, MQTTMessage
+from bot.StateStore import StateStore
 from common.RunnerState import RunnerState
+from common.algorithms import get_config_hash
+
+REQUEST_TIMEOUT = 2 # sec
 
 class MqttClient:
     """The class is used to connect Bot to MQTT broker"""
@@ -21,7 +29,40 @@ class MqttClient:
     rp_configuration: Dict[int, Dict[str, Any]] = {}
     runner_full_configuration: Dict[int, Dict[str, Any]] = {}
     rp_stop_handlers: Dict[int, str] = {}
+    rp_run_summary: Dict[int, Dict[str, Any]] = {}
+    rp_online: Dict[int, bool] = {}
+    rp_updated: Dict[int, float] = {}
+    rp_config_hash: Dict[int, str] = {}
+    rp_configuration_hash: Dict[int, str] = {}
+    fleet: Dict[int, Dict[str, Any]] = {}
+    rp_tail: Dict[str, List[Dict[str, Any]]] = {}
+    requests: Dict[str, asyncio.Future] = {}
     server_connected = False
+    routes: List[Tuple[str, Callable]] = []
+    loop: asyncio.AbstractEventLoop | None = None
+    store: StateStore = StateStore()
+
+    @classmethod
+    def route(cls, topic_filter: str) -> Callable:
+        """The decorator registers handler of messages matching the topic filter.
+            The handler is called in the asyncio loop of the bot instead of the MQTT
+            client thread, so the bot data is changed and read only by the loop"""
+        def decorator(handler: Callable) -> Callable:
+            def callback(client: Client, userdata: Any, message: MQTTMessage) -> None:
+                cls.loop.call_soon_threadsafe(cls.handle, handler, client, userdata, message)
+            cls.client.message_callback_add(topic_filter, callback)
+            cls.routes.append((topic_filter, handler))
+            return handler
+        return decorator
+
+    @classmethod
+    def handle(cls, handler: Callable, client: Client, userdata: Any,
+               message: MQTTMessage) -> None:
+        """The function calls the handler, broken messages do not stop the bot"""
+        try:
+            handler(client, userdata, message)
+        except Exception as e:
+            logging.error(f"{message.topic}: {e}\n{traceback.format_exc()}")
 
     @classmethod
     def connect(cls, server_ip: str = "localhost", port: int = 1883) -> None:
@@ -34,6 +75,7 @@ class MqttClient:
     async def start(cls) -> None:
         """The function subscribe ServerMqttClient to commander topics
             and starts new thread to process network traffic"""
+        cls.loop = asyncio.get_running_loop()
         cls.client.subscribe("ice_runner/server/bot_commander/#")
         cls.client.loop_start()
 
@@ -46,6 +88,21 @@ class MqttClient:
             cls.client.disconnect()
             raise
 
+    @classmethod
+    def is_configuration_actual(cls, runner_id: int) -> bool:
+        """The function checks if the stored configuration matches the last known
+            configuration hash of the runner"""
+        if runner_id not in cls.rp_configuration or runner_id not in cls.rp_config_hash:
+            return False
+        return cls.rp_configuration_hash.get(runner_id) == cls.rp_config_hash[runner_id]
+
+    @classmethod
+    def get_age(cls, runner_id: int) -> float | None:
+        """The function returns seconds since the last known change of the runner"""
+        if runner_id not in cls.rp_updated:
+            return None
+        return time.time() - cls.rp_updated[runner_id]
+
     @classmethod
     def publish_who_alive(cls) -> None:
         """The function publishes who_alive message to ServerMqttClient"""
@@ -93,6 +150,81 @@ class MqttClient:
         cls.client.publish(f"ice_runner/bot/usr_cmd/status", str(runner_id))
         logging.info("Published\t| Status request for Runner %d", runner_id)
 
+    @classmethod
+    def publish_tail_request(cls, runner_id: int, request: Dict[str, Any]) -> str:
+        """The function publishes request of the log tail, returns id of the request,
+            replies are collected in rp_tail"""
+        req_id = request.get("req_id", uuid.uuid4().hex[:8])
+        request["req_id"] = req_id
+        cls.rp_tail.setdefault(req_id, [])
+        cls.client.publish(f"ice_runner/bot/usr_cmd/{runner_id}/tail", json.dumps(request))
+        logging.info("Published\t| Tail request %s for Runner %d", req_id, runner_id)
+        return req_id
+
+    @classmethod
+    async def request(cls, command: str, runner_id: int | None = None,
+                      timeout: float = REQUEST_TIMEOUT) -> Any:
+        """The function publishes request with unique id to ServerMqttClient and waits
+            for the reply with the same id. Returns data of the reply or None on timeout"""
+        req_id = uuid.uuid4().hex[:8]
+        future = asyncio.get_running_loop().create_future()
+        cls.requests[req_id] = future
+        cls.client.publish(f"ice_runner/bot/usr_cmd/{command}",
+                           json.dumps({"rp_id": runner_id, "req_id": req_id}))
+        logging.debug("Published\t| Request %s %s for Runner %s", req_id, command, runner_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logging.warning("No reply to request %s %s for Runner %s", req_id, command, runner_id)
+            return None
+        finally:
+            cls.requests.pop(req_id, None)
+
+    @classmethod
+    def resolve(cls, req_id: str, data: Any) -> None:
+        """The function passes the reply to the waiting request"""
+        future = cls.requests.get(req_id)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    @classmethod
+    async def request_config(cls, runner_id: int,
+                             timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any] | None:
+        """The function requests configuration of the runner and stores it"""
+        configuration = await cls.request("config", runner_id, timeout)
+        if configuration is not None:
+            cls.rp_configuration[runner_id] = configuration
+            cls.rp_configuration_hash[runner_id] = get_config_hash(json.dumps(configuration))
+            cls.store.notify(runner_id)
+        return configuration
+
+    @classmethod
+    async def request_full_config(cls, runner_id: int,
+                                  timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any] | None:
+        """The function requests full configuration of the runner and stores it"""
+        full_configuration = await cls.request("full_config", runner_id, timeout)
+        if full_configuration is not None:
+            cls.runner_full_configuration[runner_id] = full_configuration
+            cls.store.notify(runner_id)
+        return full_configuration
+
+    @classmethod
+    async def request_status(cls, runner_id: int,
+                             timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any] | None:
+        """The function requests status of the runner and stores it"""
+        status = await cls.request("status", runner_id, timeout)
+        if status is not None:
+            cls.rp_status[runner_id] = status
+            cls.rp_updated[runner_id] = time.time()
+            cls.store.notify(runner_id)
+        return status
+
+    @classmethod
+    async def request_server(cls, timeout: float = REQUEST_TIMEOUT) -> bool:
+        """The function checks if the server replies to the bot"""
+        cls.server_connected = await cls.request("server", None, timeout) is not None
+        return cls.server_connected
+
     @classmethod
     def on_keyboard_interrupt(cls, *args: Any) -> None:
         """The function is called when KeyboardInterrupt is received"""
@@ -6,67 +6,130 @@
 
 import json
 import logging
+import time
 from bot.mqtt.client import MqttClient
 from bot.telegram.scheduler import Scheduler
 from common.RunnerState import RunnerState
+from common.algorithms import get_config_hash
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/state")
-def handle_commander_state(client, userdata, message):
-    """The function handles state messages from Raspberry Pi to Bot mqtt client storage"""
+@MqttClient.route("ice_runner/server/bot_commander/fleet")
+def handle_commander_fleet(client, userdata, message):
+    """The function stores compact snapshot of all Raspberry Pis periodically published by server"""
     del client, userdata
-    rp_pi_id = int(message.topic.split("/")[-2])
-    if rp_pi_id not in Scheduler.jobs:
-        Scheduler.guard_runner(rp_pi_id)
-        logging.debug("GUARDING\t| RP %d", rp_pi_id)
-    state = RunnerState(int(message.payload.decode()))
-    MqttClient.rp_states[rp_pi_id] = state
-    logging.debug("received RP state from Raspberry Pi %d, state: %s", rp_pi_id, state.name)
+    fleet = json.loads(message.payload.decode())
+    # the age is counted from the local receive time, so the clock of the server
+    # does not shift the update time
+    received = time.time()
+    MqttClient.fleet = {int(rp_pi_id): record for rp_pi_id, record in fleet["runners"].items()}
+    for rp_pi_id, record in MqttClient.fleet.items():
+        if record["state"] is not None:
+            MqttClient.rp_states[rp_pi_id] = RunnerState(record["state"])
+        if record["config_hash"] is not None:
+            MqttClient.rp_config_hash[rp_pi_id] = record["config_hash"]
+        MqttClient.rp_online[rp_pi_id] = record["online"]
+        MqttClient.rp_updated[rp_pi_id] = received - record["age"]
+        MqttClient.store.notify(rp_pi_id)
+    logging.debug("received FLEET of %d Raspberry Pis", len(MqttClient.fleet))
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/status")
-def handle_commander_status(client, userdata, message):
-    """The function stores status from Raspberry Pi to Bot mqtt client storage"""
-    del client, userdata
-    rp_pi_id = int(message.topic.split("/")[-2])
-    status = json.loads(message.payload.decode("UTF-8"))
-    if status is not None:
-        MqttClient.rp_status[rp_pi_id] = status
-        logging.debug("received RP status from Raspberry Pi %d", rp_pi_id)
-
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/config")
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/config")
 def handle_commander_config(client, userdata, message):
     """The function stores configuration from Raspberry Pi to Bot mqtt client storage"""
     del client, userdata
     rp_pi_id = int(message.topic.split("/")[-2])
     logging.debug("received RP configuration from Raspberry Pi %d", rp_pi_id)
     MqttClient.rp_configuration[rp_pi_id] = json.loads(message.payload.decode())
+    MqttClient.rp_configuration_hash[rp_pi_id] = get_config_hash(message.payload.decode())
+    MqttClient.store.notify(rp_pi_id)
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/server")
+@MqttClient.route("ice_runner/server/bot_commander/server")
 def handle_commander_server(client, userdata, message):
     """The function handles server callback used to check connection"""
     del client, userdata, message
     MqttClient.server_connected = True
     logging.debug("received SERVER connection from Raspberry Pi")
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/log")
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/log")
 def handle_commander_log(client, userdata, message):
     """The function stores logs from Raspberry Pi to Bot mqtt client storage"""
     del client, userdata
     rp_pi_id = int(message.topic.split("/")[-2])
     MqttClient.rp_logs[rp_pi_id] = json.loads(message.payload.decode())
+    MqttClient.store.notify(rp_pi_id)
+    Scheduler.notify(rp_pi_id)
     logging.info("received LOG from Raspberry Pi %d", rp_pi_id)
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/stop_reason")
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/stop_reason")
 def handle_commander_stop_handlers(client, userdata, message):
     """The function stores stop reason from Raspberry Pi to Bot mqtt client storage"""
     del client, userdata
     rp_pi_id = int(message.topic.split("/")[-2])
     logging.info("received STOP_REASON from Raspberry Pi %d %s", rp_pi_id, message.payload.decode())
     MqttClient.rp_stop_handlers[rp_pi_id] = message.payload.decode()
+    MqttClient.store.notify(rp_pi_id)
+    Scheduler.notify(rp_pi_id)
+
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/run_summary")
+def handle_commander_run_summary(client, userdata, message):
+    """The function stores summary of the run published by Raspberry Pi with the stop reason"""
+    del client, userdata
+    rp_pi_id = int(message.topic.split("/")[-2])
+    logging.info("received RUN_SUMMARY from Raspberry Pi %d", rp_pi_id)
+    MqttClient.rp_run_summary[rp_pi_id] = json.loads(message.payload.decode())
+    MqttClient.store.notify(rp_pi_id)
+
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/liveness")
+def handle_commander_liveness(client, userdata, message):
+    """The function stores online/offline transitions of Raspberry Pi detected by server"""
+    del client, userdata
+    rp_pi_id = int(message.topic.split("/")[-2])
+    MqttClient.rp_online[rp_pi_id] = message.payload.decode() == "online"
+    MqttClient.store.notify(rp_pi_id)
+    logging.info("received LIVENESS from server: Raspberry Pi %d %s",
+                 rp_pi_id, message.payload.decode())
+
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/snapshot")
+def handle_commander_snapshot(client, userdata, message):
+    """The function stores retained last known state of Raspberry Pi published by server"""
+    del client, userdata
+    rp_pi_id = int(message.topic.split("/")[-2])
+    snapshot = json.loads(message.payload.decode())
+    if snapshot["state"] is not None:
+        MqttClient.rp_states[rp_pi_id] = RunnerState(snapshot["state"])
+    if snapshot["status"] is not None:
+        MqttClient.rp_status[rp_pi_id] = snapshot["status"]
+    if snapshot["config_hash"] is not None:
+        MqttClient.rp_config_hash[rp_pi_id] = snapshot["config_hash"]
+    MqttClient.rp_online[rp_pi_id] = snapshot["online"]
+    if snapshot.get("age") is not None:
+        # as in the fleet, the age is counted from the local receive time
+        MqttClient.rp_updated[rp_pi_id] = time.time() - snapshot["age"]
+    MqttClient.store.notify(rp_pi_id)
+    logging.debug("received SNAPSHOT of Raspberry Pi %d", rp_pi_id)
+
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/tail/+")
+def handle_commander_tail(client, userdata, message):
+    """The function stores replies to the log tail requests"""
+    del client, userdata
+    req_id = message.topic.split("/")[-1]
+    if req_id not in MqttClient.rp_tail:
+        return
+    MqttClient.rp_tail[req_id].append(json.loads(message.payload.decode()))
+    MqttClient.store.notify(req_id)
+    logging.debug("received TAIL %s", req_id)
+
+@MqttClient.route("ice_runner/server/bot_commander/reply/+")
+def handle_commander_reply(client, userdata, message):
+    """The function passes the reply of the server to the waiting request"""
+    del client, userdata
+    reply = json.loads(message.payload.decode())
+    logging.debug("received REPLY %s", reply["req_id"])
+    MqttClient.resolve(reply["req_id"], reply["data"])
 
-@MqttClient.client.topic_callback("ice_runner/server/bot_commander/rp_states/+/full_config")
+@MqttClient.route("ice_runner/server/bot_commander/rp_states/+/full_config")
 def handle_commander_full_config(client, userdata, message):
     """The function stores full configuration from Raspberry Pi to Bot mqtt client storage"""
     del client, userdata
     rp_pi_id = int(message.topic.split("/")[-2])
     logging.info("received FULL_CONFIG from Raspberry Pi %d", rp_pi_id)
     MqttClient.runner_full_configuration[rp_pi_id] = json.loads(message.payload.decode())
+    MqttClient.store.notify(rp_pi_id)
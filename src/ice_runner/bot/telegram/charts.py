@@ -0,0 +1,110 @@
+"""The module defines summary charts of the runs rendered from the run logs"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import csv
+import io
+import logging
+from array import array
+from typing import Dict, List, Tuple
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+
+STATUS_LOG = "uavcan.equipment.ice.reciprocating.Status"
+TIME_COLUMN = "t"
+# column of the status log: label of the line, number of the subplot and offset of the value
+SERIES: Dict[str, Tuple[str, int, float]] = {
+    "engine_speed_rpm":             ("RPM", 0, 0),
+    "oil_temperature":              ("TEMP, °C", 1, -273.15),
+    "engine_load_percent":          ("GAS, %", 2, 0),
+    "throttle_position_percent":    ("AIR, %", 2, 0),
+}
+AXES_LABELS = ["RPM", "°C", "%"]
+CHART_POINTS = 1000 # points of every line, enough for the phone screen
+CHART_SIZE = (8, 7) # inches
+CHART_DPI = 100
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The function downsamples the line to n_out points with Largest-Triangle-Three-Buckets
+        algorithm, so peaks of the line are kept. The first and the last points are kept,
+        other points are split to n_out - 2 buckets and the point of the bucket forming
+        the largest triangle with the previous selected point and the mean of the next
+        bucket is selected. Only the loop over buckets is in Python"""
+    n_points = len(x)
+    if n_out >= n_points or n_out < 3:
+        return x, y
+    # bucket i contains points edges[i]:edges[i + 1], the last bucket is the last point
+    edges = (np.arange(n_out - 1) * (n_points - 2) // (n_out - 2)).astype(np.int64) + 1
+    sizes = np.diff(np.append(edges, n_points))
+    mean_x = np.add.reduceat(x, edges) / sizes
+    mean_y = np.add.reduceat(y, edges) / sizes
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n_points - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        # doubled area of the triangle, the constant factor does not change the maximum
+        area = np.abs((x[a] - mean_x[i + 1]) * (bucket_y - y[a])
+                      - (x[a] - bucket_x) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+def read_columns(path: str, columns: List[str]) -> Dict[str, np.ndarray]:
+    """The function reads the columns of the csv log. Rows are parsed one by one to compact
+        arrays, so only the requested columns are kept in memory. Missing columns and rows
+        with values which are not numbers are skipped"""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        indices = {name: header.index(name) for name in columns if name in header}
+        values = {name: array("d") for name in indices}
+        for row in reader:
+            try:
+                parsed = {name: float(row[index]) for name, index in indices.items()}
+            except (ValueError, IndexError):
+                continue
+            for name, value in parsed.items():
+                values[name].append(value)
+    return {name: np.frombuffer(value, dtype=np.float64) for name, value in values.items()}
+
+def render_run_chart(log_files: Dict[str, str]) -> bytes | None:
+    """The function renders RPM, temperature and throttles of the run to PNG image.
+        Returns None if the run has no status log or the log is empty"""
+    if not log_files.get(STATUS_LOG):
+        return None
+    try:
+        data = read_columns(log_files[STATUS_LOG], [TIME_COLUMN] + list(SERIES))
+    except OSError as e:
+        logging.warning("Failed to read status log: %s", e)
+        return None
+    if TIME_COLUMN not in data or len(data[TIME_COLUMN]) < 2:
+        return None
+    minutes = (data[TIME_COLUMN] - data[TIME_COLUMN][0]) / 60
+
+    figure = Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+    axes = figure.subplots(len(AXES_LABELS), 1, sharex=True)
+    for column, (label, index, offset) in SERIES.items():
+        if column not in data:
+            continue
+        x, y = lttb(minutes, data[column] + offset, CHART_POINTS)
+        axes[index].plot(x, y, linewidth=1, label=label)
+    for ax, label in zip(axes, AXES_LABELS):
+        ax.set_ylabel(label)
+        ax.grid(True, alpha=0.3)
+    if axes[-1].get_legend_handles_labels()[0]:
+        axes[-1].legend(loc="upper right")
+    axes[-1].set_xlabel("min")
+    # fixed margins, automatic layout takes more time than drawing of the lines
+    figure.subplots_adjust(left=0.1, right=0.97, top=0.98, bottom=0.07, hspace=0.08)
+    image = io.BytesIO()
+    figure.savefig(image, format="png")
+    return image.getvalue()
@@ -18,7 +18,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.strategy import FSMStrategy
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.methods.send_message import SendMessage
 from aiogram.types import (
     Message,
@@ -27,6 +27,7 @@ from aiogram.types import (
 
 from bot.mqtt.client import MqttClient
 from bot.telegram.filters import ChatIdFilter
+from bot.telegram.throttler import MessageEditor
 from common.algorithms import get_type_from_str, is_float
 from common.RunnerState import RunnerState
 
@@ -35,6 +36,7 @@ COMMANDS_DESCRIPTION : Dict[str, str] = {
     "/choose_rp":   "Выбрать ID обкатчика.",
     "/config":      "Изменить настройки.",
     "/log":         "Прислать логи.",
+    "/tail":        "Последние строки лога: /tail [файл] [строк] [follow].",
     "/run":         "Запустить обкатку.",
     "/server":      "Проверить работу сервера.",
     "/show_all":    "Показать все состояния.",
@@ -44,6 +46,15 @@ COMMANDS_DESCRIPTION : Dict[str, str] = {
 }
 MAX_COMMAND_LENGTH = max(len(command) for command in COMMANDS_DESCRIPTION)
 WAIT_BEFORE_RUN_TIME = 5
+START_TIMEOUT = 2 # sec, the runner should report STARTING state
+STOP_RETRY_PERIOD = 1 # sec
+SHOW_ALL_TIMEOUT = 3 # sec, deadline of replies of all runners
+CONFIG_CHANGE_ATTEMPTS = 3
+FULL_CONFIG_ATTEMPTS = 5
+TAIL_LINES = 10
+TAIL_REPLY_TIMEOUT = 3 # sec
+TAIL_FOLLOW_TIME = 30 # sec
+TAIL_MAX_LENGTH = 3500 # symbols, telegram message is limited by 4096
 RUNNER_ID = None
 dp = Dispatcher(storage=MemoryStorage(), fsm_strategy=FSMStrategy.CHAT)
 form_router = Router()
@@ -72,16 +83,14 @@ async def command_stop_handler(message: Message, state: FSMContext) -> None:
     if RUNNER_ID is None:
         await show_options(message)
         return
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/stop", str(RUNNER_ID))
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/stop", str(RUNNER_ID))
-    while True:
-        rp_status = MqttClient.rp_states[RUNNER_ID]
-        if rp_status != RunnerState.RUNNING:
-            break
-        await message.answer(
-            f"Команда отправленна на обкатчик {RUNNER_ID}.\nТекущий статус: {rp_status.name}")
-        MqttClient.client.publish("ice_runner/bot/usr_cmd/stop", str(RUNNER_ID))
-        await asyncio.sleep(1)
+    runner_id = RUNNER_ID
+    MqttClient.publish_stop(runner_id)
+    while not await MqttClient.store.wait_for(
+            runner_id, lambda: MqttClient.rp_states.get(runner_id) != RunnerState.RUNNING,
+            STOP_RETRY_PERIOD):
+        await message.answer(f"Команда отправленна на обкатчик {runner_id}.\n"
+                             f"Текущий статус: {MqttClient.rp_states[runner_id].name}")
+        MqttClient.publish_stop(runner_id)
     await message.answer(f"Остановлено")
 
 @form_router.message(Command(commands=["run", "запустить"], ignore_case=True), ChatIdFilter())
@@ -115,36 +124,38 @@ async def command_run_handler(message: Message, state: FSMContext) -> None:
             logging.info("CMD START aborted by user")
             return
         counter_message = f"Запуск через {WAIT_BEFORE_RUN_TIME-i}\n"
-        await res.edit_text(counter_message, parse_mode=ParseMode.MARKDOWN)
+        MessageEditor.edit(res, counter_message, parse_mode=ParseMode.MARKDOWN)
 
     if (await state.get_state()) != BotState.starting_state:
         logging.info("CMD START aborted by user")
         return
 
     MqttClient.publish_start(runner_id)
-    await asyncio.sleep(1)
+    await MqttClient.store.wait_for(
+        runner_id, lambda: MqttClient.rp_states.get(runner_id) != RunnerState.STOPPED,
+        START_TIMEOUT)
     await state.set_state()
 
     if runner_id not in MqttClient.rp_states:
-        await res.edit_text(counter_message+"Ошибка: Raspberry Pi отключился")
+        MessageEditor.edit(res, counter_message+"Ошибка: Raspberry Pi отключился")
         MqttClient.publish_stop(runner_id)
         return
     rp_state = MqttClient.rp_states[runner_id].name
     if rp_state == "STARTING":
-        await res.edit_text(counter_message+"Запущено")
+        MessageEditor.edit(res, counter_message+"Запущено")
         return
     if rp_state == "RUNNING":
-        await res.edit_text(counter_message+"Ошибка: двигатель завелся слишком быстро, останавливаем его")
+        MessageEditor.edit(res, counter_message+"Ошибка: двигатель завелся слишком быстро, останавливаем его")
     elif rp_state == "FAULT":
-        await res.edit_text(counter_message+"Фатальная ошибка, останавливаем двигатель")
+        MessageEditor.edit(res, counter_message+"Фатальная ошибка, останавливаем двигатель")
     elif rp_state == "NOT_CONNECTED":
-        await res.edit_text(counter_message+"Ошибка: Двигатель отключился")
+        MessageEditor.edit(res, counter_message+"Ошибка: Двигатель отключился")
     elif rp_state == "STOPPED":
-        await res.edit_text(counter_message+"Ошибка: Двигатель не запустился")
+        MessageEditor.edit(res, counter_message+"Ошибка: Двигатель не запустился")
     else:
-        await res.edit_text(counter_message+"Ошибка: неизвестное состояние")
+        MessageEditor.edit(res, counter_message+"Ошибка: неизвестное состояние")
     MqttClient.publish_stop(runner_id)
-    await res.edit_text(counter_message+f"Ошибка: {rp_state}")
+    MessageEditor.edit(res, counter_message+f"Ошибка: {rp_state}")
 
 @form_router.message(Command(commands=["status", "статус"]), ChatIdFilter())
 async def command_status_handler(message: Message, state: FSMContext) -> None:
@@ -158,11 +169,12 @@ async def command_status_handler(message: Message, state: FSMContext) -> None:
         await show_options(message)
         return
     runner_id = RUNNER_ID
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/config", str(runner_id))
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/state", str(runner_id))
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/status", str(runner_id))
-    await asyncio.sleep(0.5)
+    requests = [MqttClient.request_status(runner_id)]
+    if not MqttClient.is_configuration_actual(runner_id):
+        requests.append(MqttClient.request_config(runner_id))
+    await asyncio.gather(*requests)
     upd_state = await set_report_period(runner_id, state)
+    version = MqttClient.store.get_version(runner_id)
     status_str, _ = await get_rp_status(runner_id, upd_state)
 
     last_status_update = time.time()
@@ -172,18 +184,19 @@ async def command_status_handler(message: Message, state: FSMContext) -> None:
 
     res: SendMessage = await message.answer(status_str, parse_mode=ParseMode.MARKDOWN)
     report_period = data["report_period"]
-    await asyncio.sleep(report_period)
 
     while ((await state.get_state()) == BotState.status_state):
+        # the status is rendered again only when the data of the runner is changed,
+        # the state is checked at least every report period
+        if not await MqttClient.store.wait_change(runner_id, version, report_period):
+            continue
+        version = MqttClient.store.get_version(runner_id)
         logging.info("Updating status")
-        MqttClient.client.publish("ice_runner/bot/usr_cmd/state", str(runner_id))
-        MqttClient.client.publish("ice_runner/bot/usr_cmd/status", str(runner_id))
         status_str, _ = await get_rp_status(runner_id, state)
         last_status_update = time.time()
         data["last_status_update"] = last_status_update
         await state.set_data(data)
-        await res.edit_text(status_str, parse_mode=ParseMode.MARKDOWN)
-        await asyncio.sleep(report_period)
+        MessageEditor.edit(res, status_str, parse_mode=ParseMode.MARKDOWN)
 
 @form_router.message(Command(commands=["config", "изменить_настройки"]), ChatIdFilter())
 async def change_config(message: types.Message, state: FSMContext) -> None:
@@ -193,11 +206,9 @@ async def change_config(message: types.Message, state: FSMContext) -> None:
         return
     runner_id = RUNNER_ID
     logging.debug("Send conf command to rpi %d", runner_id)
-    MqttClient.publish_config_request(runner_id)
-    await asyncio.sleep(0.5)
-    rp_state = MqttClient.rp_states[runner_id].name
+    await MqttClient.request_config(runner_id)
     await message.answer("Настройки обкатки:\n" + (await get_configuration_str(runner_id)))
-    rp_config = MqttClient.rp_configuration[runner_id]
+    rp_config = MqttClient.rp_configuration.get(runner_id, {})
     if len(rp_config) == 0:
         await message.answer("Ошибка, нет настроек обкатки")
         logging.error("No configuration for %d", runner_id)
@@ -292,21 +303,25 @@ async def config_change_handler(message: Message, state: FSMContext) -> None:
             f"ice_runner/bot/usr_cmd/{runner_id}/change_config/{param_name}", param_value_str)
         reply_text += f"Новое значение параметра {param_name} отправлено {param_value_str}\n"
     reply_message: Message = await message.answer(reply_text)
-    await asyncio.sleep(0.5)
-    MqttClient.publish_config_request(runner_id)
-    await asyncio.sleep(2)
     if full_conf is None:
-        reply_message.edit_text(reply_text + "Ошибка, нет настроек обкатки")
+        MessageEditor.edit(reply_message, reply_text + "Ошибка, нет настроек обкатки")
         return
+    # Changes and the request are forwarded by different server routes,
+    # so the configuration is requested again until the changes are applied
+    for _ in range(CONFIG_CHANGE_ATTEMPTS):
+        rp_config = await MqttClient.request_config(runner_id)
+        if rp_config is not None and all(rp_config.get(param_name) == param_value
+                                         for param_name, param_value in params_dict.items()):
+            break
+    n_success = 0
     for param_name, param_value in params_dict.items():
         type_of_param = get_type_from_str(full_conf[param_name]["type"])
-        n_success = 0
         if MqttClient.rp_configuration[runner_id][param_name] == type_of_param(param_value):
             reply_text += f"Параметр {param_name} установлен в нужное значение\n"
             n_success += 1
         else:
             reply_text += f"Параметр {param_name} не обновлен\n"
-        reply_message.edit_text(reply_text + "Ошибка, нет настроек обкатки")
+        MessageEditor.edit(reply_message, reply_text)
     await message.answer(f"{n_success} параметров успешно обновлено\n" +
                                 (await get_configuration_str(runner_id)))
 
@@ -323,6 +338,43 @@ async def command_log_handler(message: Message, state: FSMContext) -> None:
     MqttClient.client.publish("ice_runner/bot/usr_cmd/log", str(runner_id))
     await message.answer("Пожалуйста, подождите")
 
+@form_router.message(Command(commands=["tail", "хвост"]), ChatIdFilter())
+async def command_tail_handler(message: Message, command: CommandObject) -> None:
+    """
+    This handler receives messages with `/tail [file] [lines] [follow]` command
+    """
+    if RUNNER_ID is None:
+        await show_options(message)
+        return
+    runner_id = RUNNER_ID
+    args = (command.args or "").split()
+    file_name = args[0] if args else "candump"
+    n_lines = int(args[1]) if len(args) > 1 and args[1].isdigit() else TAIL_LINES
+    follow = "follow" in args
+    req_id = MqttClient.publish_tail_request(runner_id, {"file": file_name, "lines": n_lines,
+                                             "mode": "follow" if follow else "lines"})
+    text = await wait_tail_replies(req_id, TAIL_REPLY_TIMEOUT, first_only=True)
+    if text is None:
+        MqttClient.rp_tail.pop(req_id, None)
+        MqttClient.store.forget(req_id)
+        await message.answer("Обкатчик не ответил")
+        return
+    reply = await message.answer(format_tail(text, n_lines), parse_mode=ParseMode.HTML)
+    if not follow:
+        MqttClient.rp_tail.pop(req_id, None)
+        MqttClient.store.forget(req_id)
+        return
+    end_time = time.time() + TAIL_FOLLOW_TIME
+    while time.time() < end_time:
+        new_text = await wait_tail_replies(req_id, end_time - time.time())
+        if new_text is None:
+            break
+        text += new_text
+        MessageEditor.edit(reply, format_tail(text, n_lines), parse_mode=ParseMode.HTML)
+    MqttClient.publish_tail_request(runner_id, {"req_id": req_id, "mode": "unfollow"})
+    MqttClient.rp_tail.pop(req_id, None)
+    MqttClient.store.forget(req_id)
+
 @form_router.message(Command(commands=["cancel", "отмена"]), ChatIdFilter())
 async def cancel_handler(message: Message, state: FSMContext) -> None:
     """
@@ -359,13 +411,10 @@ async def command_server(message: Message) -> None:
     This handler receives messages with `/server` command
     """
     await message.answer("Проверяем работу сервера")
-    MqttClient.client.publish("ice_runner/bot/usr_cmd/server", "server")
-    await asyncio.sleep(1)
-    if MqttClient.server_connected:
+    if await MqttClient.request_server():
         await message.answer("Сервер подключен")
     else:
         await message.answer("Сервер не подключен")
-    MqttClient.server_connected = False
 
 @form_router.message(F.text.lower().not_in(COMMANDS_DESCRIPTION.keys()), ChatIdFilter())
 async def unknown_message(msg: types.Message):
@@ -391,42 +440,40 @@ async def command_show_all_handler(message: Message, state: FSMContext) -> None:
     """
     This handler receives messages with `/show_all` command
     """
-    MqttClient.publish_who_alive()
     await state.set_state(BotState.show_all_state)
-    await asyncio.sleep(1)
-    messages: List[Dict[str, Any]] = []
     message_text = ""
-    connected_nodes = MqttClient.rp_status.keys()
+    connected_nodes = [runner_id for runner_id, online in MqttClient.rp_online.items() if online]
     await message.answer(f"Количество подключенных обкатчиков: {len(connected_nodes)}")
-    if len(connected_nodes) == 0:
+    if len(MqttClient.fleet) == 0:
         return
-
-    for runner_id in list(MqttClient.rp_states.keys()):
-        conf_str = ""
-        logging.info("Sending status cmd for %d", runner_id)
-        MqttClient.client.publish(f"ice_runner/bot/usr_cmd/status", str(runner_id))
-        await asyncio.sleep(0.5)
+    # Outdated configurations of all online runners are requested at once,
+    # so the command takes no longer than one request for any fleet size
+    outdated = [runner_id for runner_id, record in MqttClient.fleet.items()
+                if record["online"] and not MqttClient.is_configuration_actual(runner_id)]
+    configurations = await asyncio.gather(*[MqttClient.request_config(runner_id,
+                                                                       SHOW_ALL_TIMEOUT)
+                                            for runner_id in outdated])
+    missing = {runner_id for runner_id, configuration in zip(outdated, configurations)
+               if configuration is None}
+
+    for runner_id, record in sorted(MqttClient.fleet.items()):
         header_str = html.bold(f"ID обкатчика: {runner_id}\n\tСтатус:" )
-        data = await state.get_data()
-        logging.info("Send conf command to rpi %d", runner_id)
-        MqttClient.client.publish("ice_runner/bot/usr_cmd/config", str(runner_id))
-        await asyncio.sleep(1)
-
-        logging.info("Config %s", MqttClient.rp_configuration)
-        if MqttClient.rp_configuration[int(runner_id)] is None:
-            conf_str = html.bold("\tНет настроек обкатки\n")
+        status_str = ""
+        if record["state"] is not None:
+            status_str += f"\t{RunnerState(record['state']).name}\n"
+        if not record["online"]:
+            status_str += "\tОбкатчик не в сети\n"
+        for name, value in record["metrics"].items():
+            status_str += f"{name}:\t{value}\n"
+        age = int(MqttClient.get_age(runner_id) or 0)
+        status_str += f"время обновления: {age} сек назад\n"
+        if runner_id in missing:
+            conf_str = "\tНастройки обкатки не получены\n"
+        elif runner_id in outdated or MqttClient.is_configuration_actual(runner_id):
+            conf_str = html.bold("\tНастройки обкатки:\n") + format_configuration(runner_id)
         else:
-            conf_str = html.bold("\tНастройки обкатки:\n") +\
-                                        (await get_configuration_str(runner_id))
-        await state.set_data(data)
-        status_str, _ = await get_rp_status(int(runner_id), state)
+            conf_str = ""
         message_text += (header_str + status_str + conf_str)
-
-        messages.append({"runner_id": runner_id,
-                         "header": header_str,
-                         "status": status_str,
-                         "conf": conf_str})
-        await asyncio.sleep(0.3)
     await message.answer(message_text, parse_mode=ParseMode.HTML)
     await state.set_data({})
 
@@ -457,10 +504,15 @@ async def set_report_period(runner_id: int, state: FSMContext):
     return state
 
 async def get_configuration_str(runner_id: int) -> str:
+    """The function returns the configuration string for the specified RP id
+        stored in MQTT client, requests the configuration if the stored one is outdated"""
+    if not MqttClient.is_configuration_actual(runner_id):
+        await MqttClient.request_config(runner_id)
+    return format_configuration(runner_id)
+
+def format_configuration(runner_id: int) -> str:
     """The function returns the configuration string for the specified RP id
         stored in MQTT client"""
-    MqttClient.publish_config_request(runner_id)
-    await asyncio.sleep(0.5)
     if runner_id not in MqttClient.rp_configuration:
         return "Нет настроек обкатки для обкатчика " + str(runner_id)
     conf = MqttClient.rp_configuration[int(runner_id)]
@@ -473,49 +525,65 @@ async def get_configuration_str(runner_id: int) -> str:
 async def get_full_configuration(runner_id: int) -> Dict[str, Any]:
     """The function returns the full configuration dictionary for the specified RPi
         stored in MQTT client"""
-    i = 0
-    while runner_id not in MqttClient.runner_full_configuration:
-        MqttClient.publish_full_config_request(runner_id)
-        await asyncio.sleep(2)
-        i += 1
-        if i > 5:
-            logging.error("No configuration for %d", runner_id)
-            return None
-    return MqttClient.runner_full_configuration[runner_id]
+    if runner_id in MqttClient.runner_full_configuration:
+        return MqttClient.runner_full_configuration[runner_id]
+    for _ in range(FULL_CONFIG_ATTEMPTS):
+        full_configuration = await MqttClient.request_full_config(runner_id)
+        if full_configuration is not None:
+            return full_configuration
+    logging.error("No configuration for %d", runner_id)
+    return None
+
+async def wait_tail_replies(req_id: str, timeout: float, first_only: bool = False) -> str | None:
+    """The function waits for replies to the tail request and returns their text,
+        None is returned if no replies received or the tail is finished"""
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        version = MqttClient.store.get_version(req_id)
+        replies = MqttClient.rp_tail.get(req_id, [])
+        if replies:
+            replies = [replies.pop(0)] if first_only else\
+                      [replies.pop(0) for _ in range(len(replies))]
+            if any("error" in reply for reply in replies):
+                return "\n".join(reply.get("error", "") + " " + str(reply.get("files", ""))
+                                 for reply in replies)
+            text = "".join(reply.get("data", "") for reply in replies)
+            if any(reply.get("done") for reply in replies) and not text:
+                return None
+            return text
+        await MqttClient.store.wait_change(req_id, version, end_time - time.time())
+    return None
+
+def format_tail(text: str, n_lines: int) -> str:
+    """The function returns last lines of the text formatted for telegram"""
+    lines = text.rstrip("\n").split("\n")[-n_lines:]
+    return html.pre(html.quote("\n".join(lines)[-TAIL_MAX_LENGTH:]))
 
 async def get_rp_status(runner_id: int, state: FSMContext) -> Tuple[str, bool]:
-    """The function sets the status of the Raspberry Pi,
-        returns the status string and the state of the info was is updated"""
-    await asyncio.sleep(0.4)
+    """The function returns the last known status string of the Raspberry Pi with its age
+        and the state of the info was is updated"""
     data = await state.get_data()
-    await asyncio.sleep(0.5)
-    status = MqttClient.rp_status[runner_id]
-    rp_state = MqttClient.rp_states[runner_id]
-    MqttClient.rp_status[runner_id] = None
-    MqttClient.rp_states[runner_id] = None
+    status = MqttClient.rp_status.get(runner_id)
     status_str = ""
-    if rp_state is None:
-        MqttClient.rp_status.pop(runner_id)
-        MqttClient.rp_states.pop(runner_id)
+    if runner_id not in MqttClient.rp_states:
         status_str = "\tОбкатчик молчит\n"
     else:
+        if not MqttClient.rp_online.get(runner_id, False):
+            status_str = "\tОбкатчик не в сети, последний известный статус:\n"
         if status is None:
-            status_str = "\tОбкатчик не шлет свой статус\n"
-            print("status is None")
+            status_str += "\tОбкатчик не шлет свой статус\n"
         else:
             for name, value in status.items():
-                print(name, value)
                 status_str += f"{name}:\t{value}\n"
-    last_status_update = time.time()
+    last_status_update = MqttClient.rp_updated.get(runner_id, time.time())
     data["last_status_update"] = last_status_update
     await state.update_data(data)
-    update_time = datetime.fromtimestamp(last_status_update).strftime('%Y-%m-%d %H:%M:%S') + '\n'
-    return status_str + "\nвремя обновления: " + update_time, True
+    update_time = datetime.fromtimestamp(last_status_update).strftime('%Y-%m-%d %H:%M:%S')
+    age = int(time.time() - last_status_update)
+    return status_str + f"\nвремя обновления: {update_time} ({age} сек назад)\n", True
 
 async def show_options(message: types.Message) -> None:
     """The function creates set of buttons of available RPis"""
-    MqttClient.publish_who_alive()
-    await asyncio.sleep(0.5)
     available_rps = list(MqttClient.rp_states.keys())
     if len(available_rps) == 0:
         await message.answer("Нет доступных обкатчиков")
@@ -523,8 +591,11 @@ async def show_options(message: types.Message) -> None:
     builder = InlineKeyboardBuilder()
 
     for runner_id in available_rps:
+        age_str = ""
+        if not MqttClient.rp_online.get(runner_id, False):
+            age_str = f" (offline, {int(MqttClient.get_age(runner_id) or 0)} sec ago)"
         builder.add(types.InlineKeyboardButton(
-            text= f"{runner_id}\tStatus: { MqttClient.rp_states[runner_id].name}",
+            text= f"{runner_id}\tStatus: { MqttClient.rp_states[runner_id].name}{age_str}",
             callback_data=str(runner_id))
         )
     await message.answer(
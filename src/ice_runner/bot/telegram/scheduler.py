@@ -7,58 +7,133 @@
 import asyncio
 import logging
 import os
-from typing import Dict
+from typing import Dict, Set, Tuple
 from aiogram import Bot
-from apscheduler.job import Job
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from aiogram.types import BufferedInputFile
+from analysis.run_statistics import (analyze_run, format_engine_history,
+                                     format_runner_summary, get_thresholds)
 from bot.mqtt.client import MqttClient
-from bot.telegram.helper import send_media_group
+from bot.telegram.charts import render_run_chart
+from bot.telegram.throttler import MessageEditor
+from bot.telegram.uploader import Progress, TelegramUploader
+
+PROGRESS_PERIOD = 3 # sec, period of the upload progress message update
+LOGS_TIMEOUT = 10 # sec, the stop reason without the runner summary waits for the logs
 
 class Scheduler:
-    """The class is used to schedule tasks for the Telegram Bot"""
+    """The class sends results of the runs to the Telegram chat. MQTT handlers
+        notify the dispatcher when logs or stop reason of the runner are received,
+        so idle runners cost nothing and results are sent as soon as they arrive"""
     bot: Bot
-    scheduler: AsyncIOScheduler
     CHAT_ID: int
-    jobs: Dict[int, Job] = {}
+    events: asyncio.Queue = asyncio.Queue()
+    locks: Dict[int, asyncio.Lock] = {}
+    charts: Dict[int, bytes] = {}
+    summaries: Dict[int, str] = {}
+    tasks: Set[asyncio.Task] = set()
 
     @classmethod
     async def start(cls, bot: Bot, chat_id: int):
-        """The function starts the scheduler"""
+        """The function starts the dispatcher of the run results"""
         cls.bot: Bot = bot
-        cls.scheduler: AsyncIOScheduler = AsyncIOScheduler(timezone='Europe/Moscow')
         cls.CHAT_ID = chat_id
-        cls.scheduler.start()
         while True:
-            await asyncio.sleep(1)
+            runner_id = await cls.events.get()
+            # the loop keeps only weak references to the tasks
+            task = asyncio.create_task(cls.dispatch(runner_id))
+            cls.tasks.add(task)
+            task.add_done_callback(cls.tasks.discard)
 
     @classmethod
-    def guard_runner(cls, runner_id: int):
-        """The function guards the RP state and waits until it stops"""
-        if runner_id in cls.scheduler.get_jobs():
-            return
-        cls.jobs[runner_id] = cls.scheduler.add_job(cls.check_rp_state, 'interval',
-                                                seconds=1, kwargs={"runner_id": runner_id}).id
-        logging.info("Waiting for RP %d to stop", runner_id)
+    async def dispatch(cls, runner_id: int) -> None:
+        """The function sends results of the runner, results of different runners
+            are sent concurrently and results of one runner one by one"""
+        async with cls.locks.setdefault(runner_id, asyncio.Lock()):
+            try:
+                await cls.check_rp_state(runner_id)
+            except Exception as e:
+                logging.error("Failed to send results of RP %d: %s", runner_id, e)
+
+    @classmethod
+    def notify(cls, runner_id: int) -> None:
+        """The function wakes up the dispatcher to send new results of the runner"""
+        cls.events.put_nowait(runner_id)
 
     @classmethod
     async def check_rp_state(cls, runner_id: int):
-        """The function checks the RP state and sends logs and stop reason
-            if runner stops"""
-        if runner_id not in MqttClient.rp_logs:
-            return
-        await cls._send_logs(runner_id=runner_id)
-        MqttClient.rp_logs.pop(runner_id)
-        if runner_id not in MqttClient.rp_stop_handlers:
-            return
-        await cls.send_stop_reason(runner_id=runner_id)
-        cls.scheduler.remove_job(cls.jobs[runner_id])
-        cls.jobs.pop(runner_id)
-        MqttClient.rp_states.pop(runner_id)
+        """The function sends received logs and stop reason of the runner,
+            the logs are sent first if both are received. If the upload of the logs
+            fails, their paths on the server are sent instead. The stop reason is sent at once
+            with the summary accumulated by the runner, otherwise it waits for the logs
+            up to LOGS_TIMEOUT to be sent with the chart and the summary of the logs"""
+        if MqttClient.rp_stop_handlers.get(runner_id) and not MqttClient.rp_logs.get(runner_id)\
+                and runner_id not in MqttClient.rp_run_summary:
+            # the summary of the runner may arrive after the stop reason, then it is not
+            # waited for the logs any longer
+            await MqttClient.store.wait_for(
+                runner_id, lambda: bool(MqttClient.rp_logs.get(runner_id)) or
+                runner_id in MqttClient.rp_run_summary, LOGS_TIMEOUT)
+        if MqttClient.rp_logs.get(runner_id):
+            log_files = MqttClient.rp_logs.pop(runner_id)
+            thresholds = get_thresholds(MqttClient.rp_configuration.get(runner_id, {}))
+            chart, summary = await asyncio.to_thread(cls.summarize_run, log_files, thresholds)
+            if chart is not None:
+                cls.charts[runner_id] = chart
+            if summary is not None:
+                cls.summaries[runner_id] = summary
+            try:
+                await cls._send_logs(runner_id, log_files)
+            except Exception as e:
+                # the logs are kept by the server, the stop reason is sent anyway
+                logging.error("Failed to send logs of RP %d: %s", runner_id, e)
+                await cls.bot.send_message(
+                    cls.CHAT_ID, f"Не удалось отправить логи обкатчика {runner_id}: {e}\n"
+                                 "Логи на сервере:\n" + "\n".join(log_files.values()))
+        if MqttClient.rp_stop_handlers.get(runner_id):
+            await cls.send_stop_reason(runner_id=runner_id)
+        elif runner_id in cls.charts:
+            await cls.send_chart(runner_id, cls.get_text(runner_id, "Графики обкатки"))
+        elif runner_id in cls.summaries:
+            await cls.bot.send_message(cls.CHAT_ID, cls.get_text(runner_id, ""))
+
+    @staticmethod
+    def summarize_run(log_files: Dict[str, str],
+                      thresholds: Dict[str, float]) -> Tuple[bytes | None, str | None]:
+        """The function renders the chart and computes the summary of the run,
+            the errors do not stop the logs sending"""
+        chart, summary = None, None
+        try:
+            chart = render_run_chart(log_files)
+        except Exception as e:
+            logging.error("Failed to render the run chart: %s", e)
+        try:
+            statistics = analyze_run(log_files, thresholds)
+            if statistics.channels:
+                summary = statistics.format()
+        except Exception as e:
+            logging.error("Failed to compute the run summary: %s", e)
+        return chart, summary
+
+    @classmethod
+    def get_text(cls, runner_id: int, text: str) -> str:
+        """The function appends the summary of the last run of the RPi to the text,
+            the summary of the logs is preferred to the summary sent by the RPi.
+            The history of the engine added by the server is appended to the summary"""
+        summary = cls.summaries.pop(runner_id, None)
+        runner_summary = MqttClient.rp_run_summary.pop(runner_id, None)
+        if summary is None and runner_summary is not None:
+            summary = format_runner_summary(runner_summary)
+        if runner_summary is not None and "history" in runner_summary:
+            history = format_engine_history(runner_summary["history"])
+            summary = history if summary is None else f"{summary.rstrip()}\n{history}"
+        if summary is None:
+            return text
+        return f"{text}\n\n{summary}".strip()
 
     @classmethod
-    async def _send_logs(cls, runner_id: int):
-        """The function sends logs to the specified RPi"""
-        log_files: Dict = MqttClient.rp_logs[runner_id]
+    async def _send_logs(cls, runner_id: int, log_files: Dict[str, str]):
+        """The function sends logs of the specified RPi, the progress of the upload
+            is shown in the message updated with PROGRESS_PERIOD"""
         if not log_files:
             return
 
@@ -73,43 +148,55 @@ class Scheduler:
         else:
             caption = "Обкатка завершена. Запись следующих логов не удалась:\n"
 
-        files = []
+        files = {}
         for name, log_file in log_files.items():
             if os.stat(log_file).st_size > 0:
-                files.append(log_file)
+                files[name] = log_file
             else:
                 caption += f"- {name}\n"
+        if not files:
+            await cls.bot.send_message(cls.CHAT_ID, caption)
+            return
 
-        send_media_group(
-            telegram_bot_token=os.getenv("BOT_TOKEN"),
-            telegram_chat_id=os.getenv("CHAT_ID"),
-            files=files,
-            caption=caption
-        )
-
-        MqttClient.rp_logs[runner_id] = {}
+        progress = Progress(sum(os.path.getsize(path) for path in files.values()))
+        text = f"Загрузка логов обкатчика {runner_id}"
+        message = await cls.bot.send_message(cls.CHAT_ID, f"{text}: 0%")
+        upload = asyncio.create_task(
+            TelegramUploader.send_files(cls.bot, cls.CHAT_ID, files, caption, progress))
+        edit = None
+        while not upload.done():
+            await asyncio.wait([upload], timeout=PROGRESS_PERIOD)
+            if not upload.done():
+                edit = MessageEditor.edit(message, f"{text}: {progress.get_percent()}%") or edit
+        if upload.exception() is not None:
+            MessageEditor.edit(message, f"{text}: ошибка {upload.exception()}")
+            raise upload.exception()
+        if edit is not None:
+            await edit
+        await message.delete()
 
     @classmethod
     async def send_stop_reason(cls, runner_id: int):
-        """The function sends stop reason to the specified RPi"""
+        """The function sends stop reason of the specified RPi with the chart of the run"""
         if runner_id not in MqttClient.rp_stop_handlers:
             logging.debug("No stop reason to send")
             return
         stop_reason = MqttClient.rp_stop_handlers[runner_id]
-        await cls.bot.send_message(cls.CHAT_ID, f"Остановлено по причине: {stop_reason}")
-        MqttClient.rp_stop_handlers[runner_id] = {}
+        text = cls.get_text(runner_id, f"Остановлено по причине: {stop_reason}")
+        if runner_id in cls.charts:
+            await cls.send_chart(runner_id, text)
+        else:
+            await cls.bot.send_message(cls.CHAT_ID, text)
+        MqttClient.rp_stop_handlers.pop(runner_id)
+
+    @classmethod
+    async def send_chart(cls, runner_id: int, caption: str):
+        """The function sends the chart of the last run of the specified RPi"""
+        chart = BufferedInputFile(cls.charts.pop(runner_id), f"run_{runner_id}.png")
+        await cls.bot.send_photo(cls.CHAT_ID, chart, caption=caption)
 
     @classmethod
     def on_keyboard_interrupt(cls, task: asyncio.Task):
         """The function is called when KeyboardInterrupt is received"""
+        del task
         logging.info("Scheduler shutting down...")
-        cls.scheduler.shutdown()
-
-        # Try to send exit message, but don't fail if bot is already down
-        for job in cls.jobs.values():
-            try:
-                cls.scheduler.remove_job(job)
-                logging.info(f"Removed job {job.id}")
-            except Exception as e:
-                logging.debug(f"Error removing job: {e}")
-        cls.jobs.clear()
@@ -0,0 +1,154 @@
+"""The module defines rate limiting of the Telegram Bot requests and coalescing of
+    the message edits"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Tuple
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (BaseRequestMiddleware,
+                                                     NextRequestMiddlewareType)
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import Message
+
+GLOBAL_RATE = 30 # requests per second of the bot to all chats
+GLOBAL_BURST = 30
+CHAT_RATE = 1 # requests per second to one chat
+CHAT_BURST = 3
+MAX_RETRIES = 5 # 429 replies of one request before the error is raised
+MAX_TRACKED_MESSAGES = 1000 # last texts of the edited messages
+
+class TokenBucket:
+    """The class limits the rate of the requests, the bucket is refilled with the rate
+        tokens per second up to the capacity. Waiters take tokens in the order of arrival"""
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self) -> None:
+        """The function adds tokens for the time passed since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def get_delay(self) -> float:
+        """The function returns time in seconds until the token is available"""
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def block(self, delay: float) -> None:
+        """The function empties the bucket for the delay requested by Telegram"""
+        self.refill()
+        self.tokens = min(self.tokens, 0) - delay * self.rate
+
+    async def wait(self) -> None:
+        """The function waits until the token is available without taking it"""
+        while self.get_delay() > 0:
+            await asyncio.sleep(self.get_delay())
+
+    async def acquire(self) -> None:
+        """The function waits for the token and takes it"""
+        async with self.lock:
+            await self.wait()
+            self.tokens -= 1
+
+class RateLimiter(BaseRequestMiddleware):
+    """The class is the middleware of the bot session, every request waits for tokens
+        of the global and the chat buckets. Requests rejected with 429 are repeated after
+        the time requested by Telegram, so blocked requests are queued instead of failing"""
+    global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+    chat_buckets: Dict[Any, TokenBucket] = {}
+
+    @classmethod
+    def get_bucket(cls, chat_id: Any) -> TokenBucket:
+        """The function returns the bucket of the chat"""
+        if chat_id not in cls.chat_buckets:
+            cls.chat_buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return cls.chat_buckets[chat_id]
+
+    @classmethod
+    async def wait(cls, chat_id: Any) -> None:
+        """The function waits until the request to the chat may be sent"""
+        await cls.get_bucket(chat_id).wait()
+        await cls.global_bucket.wait()
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(MAX_RETRIES):
+            if chat_id is not None:
+                await self.get_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                logging.warning("Flood limit of chat %s, retry in %d sec", chat_id, e.retry_after)
+                if chat_id is not None:
+                    self.get_bucket(chat_id).block(e.retry_after)
+                else:
+                    self.global_bucket.block(e.retry_after)
+
+class MessageEditor:
+    """The class edits messages in the background. Edits with the text already shown are
+        skipped, and while the chat is blocked by the rate limit only the latest text
+        of the message is kept, so periodic updates never pile up"""
+    texts: Dict[Tuple[int, int], Tuple[str, Dict[str, Any]]] = {}
+    pending: Dict[Tuple[int, int], Tuple[str, Dict[str, Any]]] = {}
+    tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    @classmethod
+    def edit(cls, message: Message, text: str, **kwargs) -> asyncio.Task | None:
+        """The function schedules the edit of the message. Returns the task which
+            finishes when the latest text is shown, None if there is nothing to change"""
+        key = (message.chat.id, message.message_id)
+        content = (text, kwargs)
+        task = cls.tasks.get(key)
+        if task is None and cls.texts.get(key) == content:
+            return None
+        cls.pending[key] = content
+        if task is None:
+            task = asyncio.create_task(cls.flush(message, key))
+            cls.tasks[key] = task
+        return task
+
+    @classmethod
+    async def flush(cls, message: Message, key: Tuple[int, int]) -> None:
+        """The function sends pending edits of the message until the latest one is sent"""
+        try:
+            while key in cls.pending:
+                await RateLimiter.wait(key[0])
+                content = cls.pending.pop(key)
+                if cls.texts.get(key) == content:
+                    continue
+                text, kwargs = content
+                try:
+                    await message.edit_text(text, **kwargs)
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in str(e):
+                        logging.error("Failed to edit message: %s", e)
+                        continue
+                except Exception as e:
+                    logging.error("Failed to edit message: %s", e)
+                    continue
+                cls.remember(key, content)
+        finally:
+            cls.tasks.pop(key, None)
+
+    @classmethod
+    def remember(cls, key: Tuple[int, int], content: Tuple[str, Dict[str, Any]]) -> None:
+        """The function saves the text shown in the message, the oldest messages
+            are forgotten after MAX_TRACKED_MESSAGES"""
+        cls.texts.pop(key, None)
+        cls.texts[key] = content
+        if len(cls.texts) > MAX_TRACKED_MESSAGES:
+            cls.texts.pop(next(iter(cls.texts)))
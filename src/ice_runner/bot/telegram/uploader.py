@@ -0,0 +1,130 @@
+"""The module defines asynchronous upload of the run log files to the Telegram chat"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+import logging
+import os
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List
+import aiofiles
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.types import InputFile, InputMediaDocument
+
+MAX_FILE_SIZE = 50 * 1024 * 1024 # bytes, bots can not upload larger files
+MAX_GROUP_SIZE = MAX_FILE_SIZE # bytes, all files of one request
+MAX_GROUP_FILES = 10
+CHUNK_SIZE = 64 * 1024 # bytes, files are read and sent by chunks
+MAX_CONCURRENT_UPLOADS = 2
+MAX_RETRIES = 5
+RETRY_DELAY = 1 # sec, doubled after every failed attempt
+
+class Progress:
+    """The class counts bytes sent of all files of the upload"""
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.sent = 0
+
+    def get_percent(self) -> int:
+        """The function returns sent part of the upload in percents"""
+        return 100 * self.sent // self.total if self.total else 100
+
+class FilePart(InputFile):
+    """The class streams the part of the file to Telegram by chunks, so neither the file
+        nor the part is loaded to the memory. The part is read again on every retry"""
+    def __init__(self, path: str, filename: str, offset: int, length: int,
+                 progress: Progress | None = None) -> None:
+        super().__init__(filename=filename, chunk_size=CHUNK_SIZE)
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.progress = progress
+        self.sent = 0
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        if self.progress is not None:
+            # The previous attempt is not counted
+            self.progress.sent -= self.sent
+        self.sent = 0
+        async with aiofiles.open(self.path, "rb") as file:
+            await file.seek(self.offset)
+            while self.sent < self.length:
+                chunk = await file.read(min(self.chunk_size, self.length - self.sent))
+                if not chunk:
+                    break
+                self.sent += len(chunk)
+                if self.progress is not None:
+                    self.progress.sent += len(chunk)
+                yield chunk
+
+def split_files(files: Dict[str, str], progress: Progress | None = None) -> List[List[FilePart]]:
+    """The function splits the files into groups which may be sent in one message.
+        Files larger than MAX_FILE_SIZE are sent by parts named file.partNofM"""
+    groups: List[List[FilePart]] = [[]]
+    group_size = 0
+    for path in files.values():
+        size = os.path.getsize(path)
+        n_parts = max(1, -(-size // MAX_FILE_SIZE))
+        for i in range(n_parts):
+            filename = os.path.basename(path)
+            if n_parts > 1:
+                filename += f".part{i + 1}of{n_parts}"
+            length = min(MAX_FILE_SIZE, size - i * MAX_FILE_SIZE)
+            if len(groups[-1]) == MAX_GROUP_FILES or group_size + length > MAX_GROUP_SIZE:
+                groups.append([])
+                group_size = 0
+            groups[-1].append(FilePart(path, filename, i * MAX_FILE_SIZE, length, progress))
+            group_size += length
+    return [group for group in groups if group]
+
+class TelegramUploader:
+    """The class uploads files to the Telegram chat with the bot session. Uploads are
+        limited by MAX_CONCURRENT_UPLOADS, failed requests are retried with backoff"""
+    semaphore: asyncio.Semaphore | None = None
+
+    @classmethod
+    def get_semaphore(cls) -> asyncio.Semaphore:
+        """The function returns semaphore limiting concurrent uploads"""
+        if cls.semaphore is None:
+            cls.semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        return cls.semaphore
+
+    @classmethod
+    async def retry(cls, request: Callable[[], Awaitable]) -> None:
+        """The function sends the request, it is repeated with exponential backoff
+            on server or network errors. Flood limits are waited for by RateLimiter
+            of the bot session, so they are not retried here"""
+        for attempt in range(MAX_RETRIES):
+            try:
+                await request()
+                return
+            except (TelegramServerError, TelegramNetworkError) as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                delay = RETRY_DELAY * 2 ** attempt
+                logging.warning("Upload failed: %s, retry in %d sec", e, delay)
+            await asyncio.sleep(delay)
+
+    @classmethod
+    async def send_group(cls, bot: Bot, chat_id: int, group: List[FilePart],
+                         caption: str) -> None:
+        """The function sends files of the group as one message with the caption"""
+        async with cls.get_semaphore():
+            if len(group) == 1:
+                await cls.retry(lambda: bot.send_document(chat_id, group[0], caption=caption))
+                return
+            media = [InputMediaDocument(media=part) for part in group[:-1]]
+            media.append(InputMediaDocument(media=group[-1], caption=caption))
+            await cls.retry(lambda: bot.send_media_group(chat_id, media))
+
+    @classmethod
+    async def send_files(cls, bot: Bot, chat_id: int, files: Dict[str, str], caption: str,
+                         progress: Progress | None = None) -> None:
+        """The function sends the files with the caption. Groups are sent one by one,
+            so the parts of the files keep their order in the chat"""
+        groups = split_files(files, progress)
+        for i, group in enumerate(groups):
+            await cls.send_group(bot, chat_id, group, caption if len(groups) == 1
+                                 else f"{caption} ({i + 1}/{len(groups)})")
@@ -1,5 +1,7 @@
 """This module contains common algorithms"""
 import ast
+import hashlib
+import json
 import math
 from typing import Any
 
@@ -36,3 +38,8 @@ def get_type_from_str(type_str: str) -> Any:
     if type_str == "str":
         return str
     raise ValueError(f"No type for {type_str}")
+
+def get_config_hash(configuration: str) -> str:
+    """The function returns short hash of JSON configuration independent of keys order"""
+    canonical = json.dumps(json.loads(configuration), sort_keys=True)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:12]
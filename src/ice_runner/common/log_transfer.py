@@ -0,0 +1,48 @@
+"""The module defines chunks format of log files transfer from Raspberry Pi to server.
+    Raspberry Pi offers every file of the run with its size and sha256, the server replies
+    with acknowledgement containing the offset of received data and the window, number
+    of chunks which may be sent after the offset. Chunks contain their offset and crc32,
+    so the lost and broken ones are sent again from the acknowledged offset"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import hashlib
+import struct
+import zlib
+from typing import Tuple
+
+CHUNK_SIZE = 32 * 1024 # bytes
+LOG_WINDOW = 8 # chunks
+CHUNK_HEADER = struct.Struct("<QI") # offset, crc32 of data
+
+def pack_chunk(offset: int, data: bytes) -> bytes:
+    """The function returns chunk payload with header"""
+    return CHUNK_HEADER.pack(offset, zlib.crc32(data)) + data
+
+def unpack_chunk(payload: bytes) -> Tuple[int, bytes]:
+    """The function returns offset and data of the chunk, raises ValueError
+        if the data is broken"""
+    offset, crc = CHUNK_HEADER.unpack_from(payload)
+    data = payload[CHUNK_HEADER.size:]
+    if zlib.crc32(data) != crc:
+        raise ValueError(f"Chunk at {offset} has wrong crc32")
+    return offset, data
+
+def get_transfer_id(file_name: str) -> str:
+    """The function returns transfer id of the file, the same file always has the same id,
+        so the transfer is resumed after restart of any side"""
+    return hashlib.sha1(file_name.encode()).hexdigest()[:12]
+
+def get_file_sha256(path: str, size: int) -> str:
+    """The function returns sha256 of the first size bytes of the file"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        while size > 0:
+            data = file.read(min(CHUNK_SIZE, size))
+            if not data:
+                break
+            hasher.update(data)
+            size -= len(data)
+    return hasher.hexdigest()
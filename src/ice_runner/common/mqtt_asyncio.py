@@ -0,0 +1,56 @@
+"""The module is used to run paho MQTT client network traffic inside asyncio event loop"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+from typing import Any
+from paho.mqtt.client import Client, MQTT_ERR_SUCCESS
+
+MISC_LOOP_PERIOD = 1 # sec, period of keep alive and retry processing
+
+class AsyncioHelper:
+    """The class registers paho client sockets in asyncio event loop, so all client
+        callbacks are called from the loop thread and no loop_start thread is needed.
+        Based on paho-mqtt examples/loop_asyncio.py"""
+    def __init__(self, loop: asyncio.AbstractEventLoop, client: Client) -> None:
+        self.loop = loop
+        self.client = client
+        self.misc: asyncio.Task | None = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client: Client, userdata: Any, sock) -> None:
+        """The callback starts reading the socket and processing keep alive"""
+        del userdata
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client: Client, userdata: Any, sock) -> None:
+        """The callback stops reading the socket"""
+        del client, userdata
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client: Client, userdata: Any, sock) -> None:
+        """The callback is called when client has data to write"""
+        del userdata
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client: Client, userdata: Any, sock) -> None:
+        """The callback is called when all client data is written"""
+        del client, userdata
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self) -> None:
+        """The function processes keep alive pings and message retries"""
+        while self.client.loop_misc() == MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(MISC_LOOP_PERIOD)
+            except asyncio.CancelledError:
+                break
@@ -0,0 +1,117 @@
+"""The module defines the model of the engine RPM and temperature response to the throttles"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import json
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+# steady RPM of the engine at the gas throttle, %
+THROTTLE_POINTS = [0, 10, 20, 30, 50, 100]
+RPM_POINTS = [1500, 2800, 4000, 5000, 6300, 7500]
+TIME_CONSTANT = 0.8 # sec, RPM reaches 63% of the steady RPM change
+DELAY = 0.2 # sec, the throttle change starts changing RPM after the delay
+# steady oil temperature, K, at RPM
+TEMPERATURE_RPM_POINTS = [0, 3000, 5000, 7500]
+TEMPERATURE_POINTS = [293.15, 333.15, 363.15, 393.15]
+TEMPERATURE_TIME_CONSTANT = 120 # sec
+
+def get_weights(points: np.ndarray, values: np.ndarray | float
+                ) -> Tuple[np.ndarray | int, np.ndarray | float]:
+    """The function returns the index of the segment of the points containing the value
+        and the weight of its right point, values outside the points are clipped"""
+    values = np.clip(values, points[0], points[-1])
+    index = np.clip(np.searchsorted(points, values, side="right") - 1, 0, len(points) - 2)
+    return index, (values - points[index]) / (points[index + 1] - points[index])
+
+class EngineModel:
+    """The class defines the response of the engine to the throttles: the steady RPM
+        is interpolated from the table of the gas throttle, % (and the air throttle, %,
+        if the table has its axis) and reached with the first order lag after the delay.
+        The oil temperature follows the steady temperature of RPM with its own lag.
+        The functions accept arrays, so many engines are stepped at once"""
+    def __init__(self, throttle_points: List[float] = THROTTLE_POINTS,
+                 rpm_points: List[float] | List[List[float]] = RPM_POINTS,
+                 time_constant: float = TIME_CONSTANT, delay: float = DELAY,
+                 air_points: List[float] | None = None,
+                 temperature_rpm_points: List[float] = TEMPERATURE_RPM_POINTS,
+                 temperature_points: List[float] = TEMPERATURE_POINTS,
+                 temperature_time_constant: float = TEMPERATURE_TIME_CONSTANT) -> None:
+        self.throttle_points = np.asarray(throttle_points, dtype=np.float64)
+        self.rpm_points = np.asarray(rpm_points, dtype=np.float64)
+        self.time_constant = time_constant
+        self.delay = delay
+        self.air_points = np.asarray(air_points, dtype=np.float64) \
+            if air_points is not None else None
+        self.temperature_rpm_points = np.asarray(temperature_rpm_points, dtype=np.float64)
+        self.temperature_points = np.asarray(temperature_points, dtype=np.float64)
+        self.temperature_time_constant = temperature_time_constant
+        expected_shape = (len(self.throttle_points),) if self.air_points is None \
+            else (len(self.throttle_points), len(self.air_points))
+        if self.rpm_points.shape != expected_shape:
+            raise ValueError(f"RPM table shape {self.rpm_points.shape}, "
+                             f"expected {expected_shape}")
+
+    def get_steady_rpm(self, throttle: np.ndarray | float,
+                       air: np.ndarray | float = 100) -> np.ndarray | float:
+        """The function returns RPM the engine reaches at the constant throttles, %"""
+        if self.air_points is None:
+            return np.interp(throttle, self.throttle_points, self.rpm_points)
+        i, throttle_weight = get_weights(self.throttle_points, throttle)
+        j, air_weight = get_weights(self.air_points, air)
+        table = self.rpm_points
+        return (table[i, j] * (1 - throttle_weight) + table[i + 1, j] * throttle_weight) * \
+            (1 - air_weight) + \
+            (table[i, j + 1] * (1 - throttle_weight) + table[i + 1, j + 1] * throttle_weight) * \
+            air_weight
+
+    def step(self, rpm: np.ndarray | float, throttle: np.ndarray | float, dt: float,
+             air: np.ndarray | float = 100) -> np.ndarray | float:
+        """The function returns RPM after dt with the throttles, %, applied
+            at the start of the step. The lag is integrated exactly, so the step is not
+            limited by the time constant"""
+        alpha = 1 - np.exp(-dt / self.time_constant)
+        return rpm + (self.get_steady_rpm(throttle, air) - rpm) * alpha
+
+    def get_steady_temperature(self, rpm: np.ndarray | float) -> np.ndarray | float:
+        """The function returns oil temperature, K, the engine reaches at the constant RPM"""
+        return np.interp(rpm, self.temperature_rpm_points, self.temperature_points)
+
+    def step_temperature(self, temperature: np.ndarray | float, rpm: np.ndarray | float,
+                         dt: float) -> np.ndarray | float:
+        """The function returns oil temperature, K, after dt at RPM"""
+        alpha = 1 - np.exp(-dt / self.temperature_time_constant)
+        return temperature + (self.get_steady_temperature(rpm) - temperature) * alpha
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"throttle_points": self.throttle_points.tolist(),
+                "rpm_points": self.rpm_points.tolist(),
+                "time_constant": self.time_constant,
+                "delay": self.delay,
+                "air_points": self.air_points.tolist() if self.air_points is not None else None,
+                "temperature_rpm_points": self.temperature_rpm_points.tolist(),
+                "temperature_points": self.temperature_points.tolist(),
+                "temperature_time_constant": self.temperature_time_constant}
+
+    @classmethod
+    def from_dict(cls, model: Dict[str, Any]) -> "EngineModel":
+        """The function creates the model from the dictionary, the temperature
+            and the air throttle axis are optional"""
+        return cls(model["throttle_points"], model["rpm_points"], model["time_constant"],
+                   model["delay"], model.get("air_points"),
+                   model.get("temperature_rpm_points", TEMPERATURE_RPM_POINTS),
+                   model.get("temperature_points", TEMPERATURE_POINTS),
+                   model.get("temperature_time_constant", TEMPERATURE_TIME_CONSTANT))
+
+    @classmethod
+    def from_file(cls, path: str) -> "EngineModel":
+        """The function loads the model from json file"""
+        with open(path, "r", encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+    def to_file(self, path: str) -> None:
+        """The function saves the model to json file"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script replays candump -L logs of the runner to the DroneCAN node of CanNode,
+    so the real ICECommander runs on the recorded engine data without CAN interface.
+    The control loop runs on the virtual clock, the log is replayed with the recorded
+    timing, accelerated or as fast as possible. The commands sent by the commander
+    are captured and compared with the commands recorded in the log'''
+
+import argparse
+import asyncio
+import bisect
+import contextlib
+import itertools
+import logging
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+import dronecan
+from dronecan.driver.common import AbstractDriver, CANFrame
+from dronecan.node import Node
+from dronecan.transport import Frame, Transfer, TransferManager
+from paho.mqtt.client import MQTTMessageInfo
+from analysis.candump_decoder import parse_line
+from raspberry import RunSummary
+from raspberry.can_control import (ExceedanceTracker, IceCommander, RunnerStateController,
+                                   modes, node)
+from raspberry.can_control.IceCommander import ICECommander
+from raspberry.can_control.node import (ICE_AIR_CHANNEL, ICE_THR_CHANNEL, NODE_ID, CanNode,
+                                        start_dronecan_handlers, stop_dronecan_handlers)
+from raspberry.mqtt import client as mqtt_client
+from raspberry.mqtt.handlers import MqttClient
+from raspberry.RunnerConfiguration import RunnerConfiguration
+
+# modules of the Raspberry Pi taking the time from the virtual clock while replaying
+CLOCK_MODULES = [node, IceCommander, ExceedanceTracker, RunnerStateController, modes,
+                 RunSummary, mqtt_client]
+MIN_COMMAND_DIFFERENCE = 1 # throttle commands closer than it are equal
+
+# recorded or replayed command: time, throttle of ICE_THR_CHANNEL, air of ICE_AIR_CHANNEL
+Command = Tuple[float, int, float]
+
+class VirtualClock:
+    """The class is the clock of the replayed control loop. The time starts at the first
+        frame of the log and goes forward by sleeps of the loop. With the speed above zero
+        the sleeps wait for the real time of the speed, speed 0 does not wait at all"""
+    def __init__(self, start_time: float, speed: float = 1) -> None:
+        self.start_time = start_time
+        self.crnt_time = start_time
+        self.speed = speed
+        self.real_start_time = time.monotonic()
+
+    def time(self) -> float:
+        return self.crnt_time
+
+    def monotonic(self) -> float:
+        return self.crnt_time - self.start_time
+
+    async def sleep(self, delay: float) -> None:
+        """The function moves the clock forward, the waiting time is counted from the start
+            of the replay, so the processing time does not slow the replay down"""
+        self.crnt_time += delay
+        if self.speed <= 0:
+            await asyncio.sleep(0)
+            return
+        real_time = self.real_start_time + (self.crnt_time - self.start_time) / self.speed
+        await asyncio.sleep(max(0, real_time - time.monotonic()))
+
+class ModuleProxy:
+    """The class replaces the module in the namespace of other modules, the given attributes
+        are used instead of the attributes of the module"""
+    def __init__(self, module: Any, **attributes: Any) -> None:
+        self.module = module
+        self.__dict__.update(attributes)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.module, name)
+
+@contextlib.contextmanager
+def use_clock(clock: VirtualClock) -> Iterator[None]:
+    """The context manager makes the Raspberry Pi modules use the virtual clock"""
+    time_proxy = ModuleProxy(time, time=clock.time, monotonic=clock.monotonic)
+    for module in CLOCK_MODULES:
+        module.time = time_proxy
+    IceCommander.asyncio = ModuleProxy(asyncio, sleep=clock.sleep)
+    try:
+        yield
+    finally:
+        for module in CLOCK_MODULES:
+            module.time = time
+        IceCommander.asyncio = asyncio
+
+def read_frames(path: str) -> Iterator[Tuple[float, int, bytes, bool]]:
+    """The function yields frames of the candump log line by line"""
+    with open(path, "rb") as file:
+        for line in file:
+            parsed = parse_line(line)
+            if parsed is not None:
+                yield parsed
+
+class CommandRecorder:
+    """The class keeps commands of the engine from the transfers of the runner node.
+        The air command is sent after the throttle command, so the throttle command
+        is recorded with the last air command"""
+    def __init__(self) -> None:
+        self.commands: List[Command] = []
+        self.air: float = 0
+        self.transfer_manager = TransferManager()
+
+    def add_transfer(self, transfer: Transfer) -> None:
+        payload = transfer.payload
+        data_type = dronecan.get_dronecan_data_type(payload).full_name
+        if data_type == "uavcan.equipment.esc.RawCommand" and len(payload.cmd) > ICE_THR_CHANNEL:
+            self.commands.append((transfer.ts_real, payload.cmd[ICE_THR_CHANNEL], self.air))
+        elif data_type == "uavcan.equipment.actuator.ArrayCommand":
+            for command in payload.commands:
+                if command.actuator_id == ICE_AIR_CHANNEL:
+                    self.air = command.command_value
+
+    def add_frame(self, frame: Frame) -> None:
+        """The function reassembles the transfer of the recorded frames"""
+        frames = self.transfer_manager.receive_frame(frame)
+        if not frames:
+            return
+        transfer = Transfer()
+        try:
+            transfer.from_frames(frames)
+        except Exception as e:
+            logging.debug("Failed to decode recorded transfer: %s", e)
+            return
+        self.add_transfer(transfer)
+
+class ReplayDriver(AbstractDriver):
+    """The CAN driver of the DroneCAN node reading frames from the candump log. The frame
+        is received when the virtual clock reaches its timestamp. The frames of the runner
+        node are not received, they are the recorded commands, the sent frames are
+        the replayed commands"""
+    def __init__(self, frames: Iterator[Tuple[float, int, bytes, bool]], clock: VirtualClock,
+                 node_id: int = NODE_ID) -> None:
+        super().__init__()
+        self.frames = frames
+        self.clock = clock
+        self.node_id = node_id
+        self.next_frame: Tuple[float, int, bytes, bool] | None = None
+        self.finished = False
+        self.received = 0
+        self.recorded = CommandRecorder()
+        self.replayed = CommandRecorder()
+
+    def peek(self) -> Tuple[float, int, bytes, bool] | None:
+        """The function returns the next frame of other nodes without taking it"""
+        while self.next_frame is None and not self.finished:
+            frame = next(self.frames, None)
+            if frame is None:
+                self.finished = True
+            elif frame[1] & 0x7F == self.node_id:
+                timestamp, can_id, data, canfd = frame
+                self.recorded.add_frame(Frame(can_id, data, ts_real=timestamp, canfd=canfd))
+            else:
+                self.next_frame = frame
+        return self.next_frame
+
+    def receive(self, timeout: float | None = None) -> CANFrame | None:
+        del timeout
+        frame = self.peek()
+        if frame is None or frame[0] > self.clock.time():
+            return None
+        self.next_frame = None
+        self.received += 1
+        timestamp, can_id, data, canfd = frame
+        return CANFrame(can_id, data, True, ts_monotonic=self.clock.monotonic(),
+                        ts_real=timestamp, canfd=canfd)
+
+    def send(self, message_id: int, message: bytes, extended: bool = False,
+             canfd: bool = False) -> None:
+        del extended
+        self.replayed.add_frame(Frame(message_id, message, ts_real=self.clock.time(),
+                                      canfd=canfd))
+
+    def close(self) -> None:
+        pass
+
+class ReplayMqttClient:
+    """The client records publishes of the runner instead of sending them to the broker,
+        every publish is acknowledged at once"""
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.published: List[Tuple[float, str, Any]] = []
+
+    def publish(self, topic: str, payload: Any = None, *args, **kwargs) -> MQTTMessageInfo:
+        del args, kwargs
+        self.published.append((self.clock.time(), topic, payload))
+        info = MQTTMessageInfo(len(self.published))
+        info.rc = 0
+        info._set_as_published()
+        mqtt_client.on_publish(self, None, info.mid, 0, None)
+        return info
+
+    def reconnect(self) -> None:
+        pass
+
+    def get_stop_reasons(self) -> List[Tuple[float, str]]:
+        return [(timestamp, payload) for timestamp, topic, payload in self.published
+                if topic.endswith("/stop_reason")]
+
+def get_run_times(commands: List[Command]) -> List[float]:
+    """The function returns times of the run commands given to the recorded runner, they are
+        the times when the throttle command became positive"""
+    run_times = []
+    prev_throttle = 0
+    for timestamp, throttle, _ in commands:
+        if throttle > 0 >= prev_throttle:
+            run_times.append(timestamp)
+        prev_throttle = throttle
+    return run_times
+
+def compare_commands(recorded: List[Command], replayed: List[Command]) -> Dict[str, float]:
+    """The function compares every recorded throttle command with the last command replayed
+        before it. Returns number of compared commands, number of mismatches and the largest
+        difference of the throttle"""
+    replayed_times = [command[0] for command in replayed]
+    compared = mismatches = 0
+    max_difference = 0
+    for timestamp, throttle, _ in recorded:
+        index = bisect.bisect_right(replayed_times, timestamp) - 1
+        if index < 0:
+            continue
+        difference = abs(replayed[index][1] - throttle)
+        compared += 1
+        mismatches += difference >= MIN_COMMAND_DIFFERENCE
+        max_difference = max(max_difference, difference)
+    return {"compared": compared, "mismatches": mismatches, "max_difference": max_difference}
+
+class CandumpReplay:
+    """The class runs ICECommander on the candump log. The run commands are given
+        at the run times, by default at the times of the run commands of the recorded runner"""
+    def __init__(self, path: str, configuration: RunnerConfiguration, speed: float = 0,
+                 run_times: List[float] | None = None, log_dir: str | None = None) -> None:
+        self.path = path
+        self.configuration = configuration
+        self.speed = speed
+        self.run_times = run_times
+        self.log_dir = log_dir
+        self.state_changes: List[Tuple[float, str]] = []
+        self.clock: VirtualClock | None = None
+        self.driver: ReplayDriver | None = None
+        self.mqtt_client: ReplayMqttClient | None = None
+
+    def get_run_times(self) -> List[float]:
+        """The function returns the given run times or reads the run times of the recorded
+            runner from the log"""
+        if self.run_times is not None:
+            return sorted(self.run_times)
+        recorder = CommandRecorder()
+        for timestamp, can_id, data, canfd in read_frames(self.path):
+            if can_id & 0x7F == NODE_ID:
+                recorder.add_frame(Frame(can_id, data, ts_real=timestamp, canfd=canfd))
+        return get_run_times(recorder.commands)
+
+    async def run(self) -> Dict[str, Any]:
+        """The function replays the whole log and returns the results of the replay"""
+        frames = read_frames(self.path)
+        first_frame = next(frames, None)
+        if first_frame is None:
+            raise ValueError(f"{self.path} has no CAN frames")
+        run_times = self.get_run_times()
+        self.clock = VirtualClock(first_frame[0], self.speed)
+        self.driver = ReplayDriver(itertools.chain([first_frame], frames), self.clock)
+        dronecan_node = Node(self.driver, node_id=NODE_ID)
+        self.mqtt_client = ReplayMqttClient(self.clock)
+        backup = (MqttClient.client, MqttClient.run_summary, CanNode.log_dir)
+        MqttClient.client = self.mqtt_client
+        MqttClient.run_summary = CanNode.run_summary
+        MqttClient.configuration = self.configuration
+        if self.log_dir is not None:
+            CanNode.log_dir = self.log_dir
+        start_time = time.monotonic()
+        spins = 0
+        try:
+            with use_clock(self.clock):
+                CanNode.connect(dronecan_node)
+                start_dronecan_handlers()
+                CanNode.change_files()
+                commander = ICECommander(self.configuration)
+                state = None
+                while self.driver.peek() is not None:
+                    if run_times and run_times[0] <= self.clock.time():
+                        run_times.pop(0)
+                        MqttClient.to_run = 1
+                    await commander.spin()
+                    spins += 1
+                    if commander.state_controller.state != state:
+                        state = commander.state_controller.state
+                        self.state_changes.append((self.clock.time(), state.name))
+                stop_dronecan_handlers()
+        finally:
+            MqttClient.client, MqttClient.run_summary, CanNode.log_dir = backup
+        elapsed = time.monotonic() - start_time
+        duration = self.clock.time() - self.clock.start_time
+        return {
+            "duration": duration,
+            "elapsed": elapsed,
+            "speed": duration / elapsed if elapsed else 0,
+            "spins": spins,
+            "frames": self.driver.received,
+            "replayed_commands": self.driver.replayed.commands,
+            "recorded_commands": self.driver.recorded.commands,
+            "comparison": compare_commands(self.driver.recorded.commands,
+                                           self.driver.replayed.commands),
+            "state_changes": self.state_changes,
+            "stop_reasons": self.mqtt_client.get_stop_reasons(),
+        }
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Replay of candump log to ICECommander with the virtual clock')
+    parser.add_argument("--input", required=True, help="Path to candump -L log")
+    parser.add_argument("--config", default="ice_configuration.yml",
+                        help="Path to ICE runner configuration file")
+    parser.add_argument("--speed", default=0, type=float,
+                        help="Speed relative to the recorded timing, 0 is as fast as possible")
+    parser.add_argument("--run_at", default=None, type=str,
+                        help="Comma separated seconds from the log start to give run commands, "
+                             "default is the times of the run commands of the recorded runner")
+    parser.add_argument("--log_dir", default=None,
+                        help="Directory of the logs written by CanNode, default is temporary")
+    args: argparse.Namespace = parser.parse_args(args)
+    configuration = RunnerConfiguration(file_path=args.config)
+    run_times = None
+    if args.run_at:
+        start_time = next(read_frames(args.input))[0]
+        run_times = [start_time + float(offset) for offset in args.run_at.split(",")]
+    with tempfile.TemporaryDirectory() as log_dir:
+        replay = CandumpReplay(args.input, configuration, args.speed, run_times,
+                               args.log_dir or log_dir)
+        result = asyncio.run(replay.run())
+    start_time = replay.clock.start_time
+    print(f"Replayed {result['duration']:.1f} sec of the log in {result['elapsed']:.1f} sec "
+          f"(x{result['speed']:.1f}), {result['frames']} frames, {result['spins']} spins")
+    for timestamp, state in result["state_changes"]:
+        print(f"{timestamp - start_time:8.1f}\t{state}")
+    for timestamp, reason in result["stop_reasons"]:
+        print(f"{timestamp - start_time:8.1f}\tstop: {reason}")
+    comparison = result["comparison"]
+    print(f"Commands: {len(result['replayed_commands'])} replayed, "
+          f"{len(result['recorded_commands'])} recorded, {comparison['mismatches']} of "
+          f"{comparison['compared']} differ, max difference {comparison['max_difference']}")
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script is used to load the server and the bot with fleet of virtual runners.
+    Every virtual runner speaks the Raspberry Pi MQTT protocol: it replies to the
+    heartbeat and commands, reports its state, status and dronecan messages.
+    The fleet is grown by steps and every step reports the server throughput,
+    latency of the runner reports and bot requests, and memory usage'''
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from paho.mqtt.client import Client, MQTTMessage
+from paho.mqtt.enums import CallbackAPIVersion
+from common.mqtt_asyncio import AsyncioHelper
+from common.RunnerState import RunnerState
+from raspberry.RunnerConfiguration import RunnerConfiguration
+
+FIRST_RUNNER_ID = 1000
+CONNECT_BATCH = 20 # runners connected at once
+RUN_TIME = 30 # sec, virtual run duration after start command
+
+class VirtualRunner:
+    """The class emulates Raspberry Pi client with running engine"""
+    def __init__(self, run_id: int, report_period: float, configuration: Dict[str, Any]) -> None:
+        self.run_id = run_id
+        self.report_period = report_period
+        self.configuration = configuration
+        self.state = RunnerState.STOPPED
+        self.start_time = 0
+        self.published = 0
+        self.task: asyncio.Task | None = None
+        self.client = Client(CallbackAPIVersion.VERSION2, client_id=f"virtual_runner_{run_id}",
+                             clean_session=True)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def publish(self, topic: str, payload: Any) -> None:
+        """The function publishes message of the runner"""
+        self.client.publish(f"ice_runner/raspberry_pi/{self.run_id}/{topic}", payload)
+        self.published += 1
+
+    def on_connect(self, client: Client, userdata: Any, flags, reason_code, properties) -> None:
+        """The callback subscribes to the server commands as Raspberry Pi does"""
+        del userdata, flags, reason_code, properties
+        client.subscribe("ice_runner/server/rp_commander/#")
+
+    def on_message(self, client: Client, userdata: Any, msg: MQTTMessage) -> None:
+        """The callback reacts to the server commands"""
+        del client, userdata
+        if msg.topic == "ice_runner/server/rp_commander/heartbeat":
+            self.publish("heartbeat", msg.payload)
+        elif msg.topic == "ice_runner/server/rp_commander/who_alive":
+            self.publish("state", self.state.value)
+        elif msg.topic == f"ice_runner/server/rp_commander/{self.run_id}/command":
+            self.handle_command(msg.payload.decode())
+
+    def handle_command(self, command: str) -> None:
+        """The function changes the virtual runner state or replies to the request"""
+        if command == "start" and self.state == RunnerState.STOPPED:
+            self.state = RunnerState.STARTING
+            self.start_time = time.time()
+        elif command == "stop" and self.state != RunnerState.STOPPED:
+            self.stop("Stopped by command")
+        elif command == "status":
+            self.publish("status", json.dumps(self.get_status()))
+        elif command == "config":
+            self.publish("config", json.dumps(self.configuration))
+        elif command == "full_config":
+            self.publish("full_config", json.dumps(self.configuration))
+        self.publish("state", self.state.value)
+
+    def stop(self, reason: str) -> None:
+        """The function stops the virtual run"""
+        self.state = RunnerState.STOPPED
+        self.start_time = 0
+        self.publish("stop_reason", reason)
+
+    def get_rpm(self) -> int:
+        """The function returns engine speed of the virtual run"""
+        if self.state == RunnerState.STOPPED:
+            return 0
+        return int(self.configuration.get("rpm", 4500) + random.gauss(0, 100))
+
+    def get_status(self) -> Dict[str, Any]:
+        """The function returns status like EngineState description with send time"""
+        rpm = self.get_rpm()
+        return {"RPM": f"{rpm}",
+                "GAS/AIR": f"{50 if rpm else 0}% {50 if rpm else 0}%",
+                "TEMP": f"{round(random.uniform(60, 90), 2)} °C",
+                "FUEL level": f"{random.randint(20, 100)}%",
+                "Time left": f"{int(RUN_TIME - (time.time() - self.start_time))} sec"
+                             if self.start_time else "not started",
+                "Report period": f"{self.report_period} sec",
+                "Sent": time.time()}
+
+    def get_messages(self) -> Dict[str, Dict[str, Any]]:
+        """The function returns dronecan messages with string values as yaml BaseLoader does"""
+        rpm = self.get_rpm()
+        return {"uavcan.equipment.ice.reciprocating.Status": {
+                    "state": str(2 if rpm else 0),
+                    "engine_speed_rpm": str(rpm),
+                    "oil_temperature": str(round(random.uniform(330, 360), 2)),
+                    "fuel_pressure": str(round(random.uniform(100, 120), 2))},
+                "uavcan.protocol.NodeStatus": {
+                    "uptime_sec": str(int(time.time())),
+                    "health": "0",
+                    "mode": "0"},
+                "uavcan.equipment.ice.FuelTankStatus": {
+                    "available_fuel_volume_percent": str(random.randint(20, 100))}}
+
+    def report(self) -> None:
+        """The function publishes state, status and dronecan messages of the runner"""
+        if self.state == RunnerState.STARTING and time.time() - self.start_time > 2:
+            self.state = RunnerState.RUNNING
+        if self.state == RunnerState.RUNNING and time.time() - self.start_time > RUN_TIME:
+            self.stop("Run finished")
+        self.publish("state", self.state.value)
+        self.publish("status", json.dumps(self.get_status()))
+        for message_type, message in self.get_messages().items():
+            self.publish(f"dronecan/{message_type}", json.dumps(message))
+
+    async def run(self, server_ip: str, port: int) -> None:
+        """The function connects the runner and reports with the period"""
+        AsyncioHelper(asyncio.get_running_loop(), self.client)
+        self.client.connect(server_ip, port, 60)
+        await asyncio.sleep(random.uniform(0, self.report_period))
+        try:
+            while True:
+                self.report()
+                await asyncio.sleep(self.report_period)
+        finally:
+            self.client.disconnect()
+
+class Observer:
+    """The class acts as the bot: it receives runner snapshots and server statistics
+        and sends configuration requests to measure the request round trip"""
+    def __init__(self) -> None:
+        self.client = Client(CallbackAPIVersion.VERSION2, client_id="load_observer",
+                             clean_session=True)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.report_latencies: List[float] = []
+        self.request_latencies: List[float] = []
+        self.requests: Dict[int, float] = {}
+        self.received = 0
+        self.server_stats: List[Tuple[float, Dict[str, Any]]] = []
+
+    def on_connect(self, client: Client, userdata: Any, flags, reason_code, properties) -> None:
+        """The callback subscribes to the bot topics and server statistics"""
+        del userdata, flags, reason_code, properties
+        client.subscribe("ice_runner/server/bot_commander/#")
+        client.subscribe("ice_runner/server/stats")
+
+    def on_message(self, client: Client, userdata: Any, msg: MQTTMessage) -> None:
+        """The callback measures latencies of received messages"""
+        del client, userdata
+        self.received += 1
+        if msg.topic == "ice_runner/server/stats":
+            self.server_stats.append((time.time(), json.loads(msg.payload)))
+            return
+        if msg.retain:
+            return
+        if msg.topic.endswith("/snapshot"):
+            status = json.loads(msg.payload)["status"]
+            if status is not None and "Sent" in status:
+                self.report_latencies.append(time.time() - status["Sent"])
+        elif msg.topic.endswith("/config"):
+            rp_id = int(msg.topic.split("/")[-2])
+            request_time = self.requests.pop(rp_id, None)
+            if request_time is not None:
+                self.request_latencies.append(time.time() - request_time)
+
+    def request_config(self, rp_id: int) -> None:
+        """The function sends configuration request as the bot does"""
+        self.requests[rp_id] = time.time()
+        self.client.publish("ice_runner/bot/usr_cmd/config", str(rp_id))
+
+    def reset(self) -> None:
+        """The function clears measurements of the previous step"""
+        self.report_latencies = []
+        self.request_latencies = []
+        self.requests = {}
+        self.received = 0
+        # The last statistics of the previous step is the start of the next one
+        self.server_stats = self.server_stats[-1:]
+
+def get_rss(pid: int | str = "self") -> float:
+    """The function returns resident memory of the process in MB,
+        0 if the process is not found"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmRSS"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        logging.warning("LOAD\t-\tprocess %s is not found", pid)
+    return 0
+
+def get_percentiles(values: List[float]) -> str:
+    """The function returns p50/p95/p99 of the latencies in ms"""
+    if not values:
+        return "-"
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"{p50:.0f}/{p95:.0f}/{p99:.0f}"
+
+def get_server_throughput(stats: List[Tuple[float, Dict[str, Any]]]) -> Dict[str, float]:
+    """The function returns handled messages rate and dropped messages of all server routes
+        between the first and the last statistics"""
+    if len(stats) < 2:
+        return {"handled": 0, "dropped": 0, "max_depth": 0}
+    (start_time, first), (end_time, last) = stats[0], stats[-1]
+    handled = sum(route["handled"] for route in last.values()) -\
+              sum(route["handled"] for route in first.values())
+    dropped = sum(route["dropped"] for route in last.values()) -\
+              sum(route["dropped"] for route in first.values())
+    max_depth = max(route["max_depth"] for _, step in stats[1:] for route in step.values())
+    return {"handled": handled / (end_time - start_time), "dropped": dropped,
+            "max_depth": max_depth}
+
+async def run_step(runners: List[VirtualRunner], observer: Observer,
+                   duration: float, request_rate: float) -> Dict[str, Any]:
+    """The function measures the fleet during the step"""
+    observer.reset()
+    published = sum(runner.published for runner in runners)
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        observer.request_config(random.choice(runners).run_id)
+        await asyncio.sleep(1 / request_rate)
+    elapsed = time.time() - start_time
+    return {"published": (sum(runner.published for runner in runners) - published) / elapsed,
+            "received": observer.received / elapsed,
+            "server": get_server_throughput(observer.server_stats),
+            "report_latency": get_percentiles(observer.report_latencies),
+            "request_latency": get_percentiles(observer.request_latencies),
+            "lost_requests": len(observer.requests)}
+
+async def main(args: argparse.Namespace) -> None:
+    """The function grows the fleet by steps and prints measurements of every step"""
+    load_dotenv()
+    server_ip = args.ip or os.getenv("SERVER_IP", "localhost")
+    port = args.port or int(os.getenv("SERVER_PORT", "1883"))
+    configuration = RunnerConfiguration(file_path=args.config).to_dict()
+    loop = asyncio.get_running_loop()
+    observer = Observer()
+    AsyncioHelper(loop, observer.client)
+    observer.client.connect(server_ip, port, 60)
+    runners: List[VirtualRunner] = []
+    print("runners\tpub msg/s\tsrv msg/s\tdropped\tmax depth\tbot msg/s"
+          "\treport p50/95/99 ms\trequest p50/95/99 ms\tlost\tsrv MB\tload MB")
+    try:
+        for n_runners in args.runners:
+            while len(runners) < n_runners:
+                for _ in range(min(CONNECT_BATCH, n_runners - len(runners))):
+                    runner = VirtualRunner(FIRST_RUNNER_ID + len(runners), args.report_period,
+                                           configuration)
+                    runner.task = asyncio.create_task(runner.run(server_ip, port))
+                    runners.append(runner)
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(args.warmup)
+            result = await run_step(runners, observer, args.duration, args.request_rate)
+            server_rss = f"{get_rss(args.server_pid):.1f}" if args.server_pid else "-"
+            print(f"{n_runners}\t{result['published']:.0f}\t\t{result['server']['handled']:.0f}"
+                  f"\t\t{result['server']['dropped']}\t{result['server']['max_depth']}"
+                  f"\t\t{result['received']:.0f}\t\t{result['report_latency']}"
+                  f"\t\t{result['request_latency']}\t\t{result['lost_requests']}"
+                  f"\t{server_rss}\t{get_rss():.1f}", flush=True)
+    finally:
+        for runner in runners:
+            runner.task.cancel()
+        await asyncio.gather(*[runner.task for runner in runners], return_exceptions=True)
+        observer.client.disconnect()
+
+def start(args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Load test of the server and the bot with virtual runners')
+    parser.add_argument("--runners", default="10,50,100,200", type=str,
+                        help="Comma separated fleet sizes of the steps")
+    parser.add_argument("--duration", default=30, type=float,
+                        help="Duration of the measurement of every step, sec. The server "
+                             "publishes its statistics every 10 sec, so it should be longer")
+    parser.add_argument("--warmup", default=5, type=float,
+                        help="Time after the fleet is grown before the measurement, sec")
+    parser.add_argument("--report_period", default=1, type=float,
+                        help="Report period of the virtual runners, sec")
+    parser.add_argument("--request_rate", default=2, type=float,
+                        help="Configuration requests per second sent as the bot")
+    parser.add_argument("--config", default="ice_configuration.yml",
+                        help="Path to ICE runner configuration file")
+    parser.add_argument("--server_pid", default=None, type=int,
+                        help="Server process id to report its memory")
+    parser.add_argument("--ip", default=None, type=str, help="MQTT broker address")
+    parser.add_argument("--port", default=None, type=int, help="MQTT broker port")
+    args: argparse.Namespace = parser.parse_args(args)
+    args.runners = [int(n_runners) for n_runners in args.runners.split(",")]
+    asyncio.run(main(args))
+
+if __name__ == "__main__":
+    start()
@@ -10,20 +10,34 @@ import os
 import pathlib
 import sys
 import time
+from collections import deque
 import dronecan
 from raccoonlab_tools.dronecan.global_node import DronecanNode
 from raspberry.can_control.node import ICE_AIR_CHANNEL
 from raspberry.can_control.EngineState import Health, Mode, EngineState
+from raspberry.can_control.modes import MAX_AIR_CMD, MIN_AIR_CMD
+from ice_sim.EngineModel import EngineModel
+
+MAX_COMMAND = 8191
+STARTER_TIME = 1 # sec, the engine with the model cranks with the starter after the command
 
 class Engine:
-    def __init__(self, max_n_tries: int = 3):
+    def __init__(self, max_n_tries: int = 3, model: EngineModel | None = None):
         self.state = EngineState.STOPPED
         self.rpm = 0
         self.n_tries = 0
         self.prev_time = 0 
         self.max_n_tries = max_n_tries
+        self.model = model
+        self.temperature = float(model.get_steady_temperature(0)) if model is not None else 0
+        self.update_time = 0
+        self.start_time = 0
+        self.throttles: deque = deque()
 
     def update(self, cmd: int, air_cmd: int) -> None:
+        if self.model is not None:
+            self.update_with_model(cmd, air_cmd)
+            return
         del air_cmd
         if cmd <= 0:
             self.state = EngineState.STOPPED
@@ -51,6 +65,31 @@ class Engine:
             self.prev_time = time.time()
             print("RUNNING")
 
+    def update_with_model(self, cmd: int, air_cmd: int) -> None:
+        """The function steps RPM and the temperature of the engine model from the last
+            update. The engine starts with the first command, the throttles change RPM
+            after the delay of the model"""
+        now = time.time()
+        dt = now - self.update_time if self.update_time > 0 else 0
+        self.update_time = now
+        air = (air_cmd - MIN_AIR_CMD) * 100 / (MAX_AIR_CMD - MIN_AIR_CMD)
+        self.throttles.append((now, cmd * 100 / MAX_COMMAND, min(100, max(0, air))))
+        while len(self.throttles) > 1 and self.throttles[1][0] <= now - self.model.delay:
+            self.throttles.popleft()
+        if cmd <= 0:
+            self.state = EngineState.STOPPED
+            self.rpm = 0
+        else:
+            if self.state == EngineState.STOPPED:
+                self.state = EngineState.STARTER_RUNNING
+                self.start_time = now
+                self.n_tries += 1
+            if self.state == EngineState.STARTER_RUNNING and now - self.start_time > STARTER_TIME:
+                self.state = EngineState.STARTER_WAITING
+            _, throttle, air = self.throttles[0]
+            self.rpm = float(self.model.step(self.rpm, throttle, dt, air))
+        self.temperature = float(self.model.step_temperature(self.temperature, self.rpm, dt))
+
 class ICENODE:
     min_command: int = 2000
     status_timeout: float = 0.5
@@ -59,7 +98,7 @@ class ICENODE:
     gas_throttle: int = 0
     air_throttle: int = 0
 
-    def __init__(self, max_n_tries: int = 3) -> None:
+    def __init__(self, max_n_tries: int = 3, model: EngineModel | None = None) -> None:
         self.node = DronecanNode(node_id= 101)
         self.dt = 0.05
         self.rpm = 0
@@ -78,7 +117,7 @@ class ICENODE:
         self.node.node.mode = Mode.MODE_OPERATIONAL
         self.node.node.health = Health.HEALTH_OK
         self.prev_broadcast_time = 0
-        self.engine = Engine(max_n_tries=max_n_tries)
+        self.engine = Engine(max_n_tries=max_n_tries, model=model)
 
     def create_ice_reciprocating_status(self) -> dronecan.uavcan.equipment.ice.reciprocating.Status:
         return dronecan.uavcan.equipment.ice.reciprocating.Status(
@@ -105,6 +144,8 @@ class ICENODE:
         self.node.node.spin(0)
 
         self.engine.update(cmd=self.command, air_cmd=self.air_cmd)
+        if self.engine.model is not None:
+            self.temp = self.engine.temperature
         if time.time() - self.prev_broadcast_time > self.status_timeout:
             self.prev_broadcast_time = time.time()
             self.node.publish(self.create_ice_reciprocating_status())
@@ -145,6 +186,11 @@ def start(args: list['str'] = None) -> None:
                         default=None,
                         type=str,
                         help="If vcan creatino is needed, pass the vcan interface name")
+    parser.add_argument("--model",
+                        default=None,
+                        type=str,
+                        help="Path to engine model identified from the logs, RPM and "
+                             "temperature follow the model if it is specified")
     args: argparse.Namespace = parser.parse_args(args)
 
     if args.vcan is not None:
@@ -156,7 +202,8 @@ def start(args: list['str'] = None) -> None:
             sys.exit(1)
         print(f"VCAN\t-\tInterface {args.vcan} created")
 
-    node = ICENODE(max_n_tries=args.n_tries)
+    model = EngineModel.from_file(args.model) if args.model is not None else None
+    node = ICENODE(max_n_tries=args.n_tries, model=model)
     node.node.node.add_handler(dronecan.uavcan.equipment.esc.RawCommand, get_raw_command)
     node.node.node.add_handler(dronecan.uavcan.equipment.actuator.ArrayCommand, get_air_cmd)
     while True:
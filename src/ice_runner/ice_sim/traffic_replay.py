@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+'''The script captures MQTT traffic of the ice_runner system to a compact binary file
+    and replays it with the captured timing, accelerated or as fast as possible.
+    The traffic is replayed to the broker or directly to the handler functions
+    of the server or the bot, so real sessions are used as reproducible benchmarks
+    and regression tests'''
+
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import struct
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Tuple
+from dotenv import load_dotenv
+from paho.mqtt.client import Client, MQTTMessage, topic_matches_sub
+from paho.mqtt.enums import CallbackAPIVersion
+from common.mqtt_asyncio import AsyncioHelper
+
+MAGIC = b"ICETRAF1"
+FILE_HEADER = struct.Struct("<8sd") # magic, capture start time
+TOPIC_RECORD = struct.Struct("<BHH") # kind, topic id, topic length
+MESSAGE_RECORD = struct.Struct("<BdHBI") # kind, time offset, topic id, flags, payload length
+TOPIC_KIND = 0
+MESSAGE_KIND = 1
+RETAIN_FLAG = 0x4
+MAX_SPEED_BATCH = 100 # messages published before the event loop is released
+
+def open_file(path: str, mode: str) -> BinaryIO:
+    """The function opens the capture file, files with .gz suffix are compressed"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+class TrafficWriter:
+    """The class writes captured messages to the file. Every topic is written once
+        and messages refer to it by id, so repeated telemetry topics take 2 bytes"""
+    def __init__(self, path: str, start_time: float | None = None) -> None:
+        self.file = open_file(path, "wb")
+        self.start_time = time.time() if start_time is None else start_time
+        self.topics: Dict[str, int] = {}
+        self.count = 0
+        self.file.write(FILE_HEADER.pack(MAGIC, self.start_time))
+
+    def write(self, msg: MQTTMessage, timestamp: float | None = None) -> None:
+        """The function writes the message received at the timestamp"""
+        timestamp = time.time() if timestamp is None else timestamp
+        topic_id = self.topics.get(msg.topic)
+        if topic_id is None:
+            topic_id = len(self.topics)
+            self.topics[msg.topic] = topic_id
+            topic = msg.topic.encode()
+            self.file.write(TOPIC_RECORD.pack(TOPIC_KIND, topic_id, len(topic)) + topic)
+        flags = msg.qos | (RETAIN_FLAG if msg.retain else 0)
+        self.file.write(MESSAGE_RECORD.pack(MESSAGE_KIND, timestamp - self.start_time,
+                                            topic_id, flags, len(msg.payload)))
+        self.file.write(msg.payload)
+        self.count += 1
+
+    def close(self) -> None:
+        """The function closes the file"""
+        self.file.close()
+
+def read_traffic(path: str) -> Iterator[Tuple[float, MQTTMessage]]:
+    """The function yields time offsets from the capture start and messages of the file"""
+    with open_file(path, "rb") as file:
+        magic, _ = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        topics: List[str] = []
+        while True:
+            kind = file.read(1)
+            if not kind:
+                return
+            if kind[0] == TOPIC_KIND:
+                _, topic_id, length = TOPIC_RECORD.unpack(kind + file.read(TOPIC_RECORD.size - 1))
+                topics.append(file.read(length).decode())
+                assert topic_id == len(topics) - 1
+                continue
+            _, offset, topic_id, flags, length = MESSAGE_RECORD.unpack(
+                                                kind + file.read(MESSAGE_RECORD.size - 1))
+            msg = MQTTMessage(topic=topics[topic_id].encode())
+            msg.payload = file.read(length)
+            msg.qos = flags & 0x3
+            msg.retain = bool(flags & RETAIN_FLAG)
+            yield offset, msg
+
+class HandlerStats:
+    """The class accumulates number of calls, errors and latency of the handler"""
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def add(self, latency: float) -> None:
+        """The function adds latency of the handler call"""
+        self.calls += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+class HandlerTarget:
+    """The class passes replayed messages directly to the handler functions of the server
+        or the bot in the captured order, without broker and route queues. Messages the
+        target is not subscribed to are skipped"""
+    def __init__(self, name: str) -> None:
+        self.stats: Dict[str, HandlerStats] = {}
+        if name == "server":
+            # Routes are registered on import of the handlers module
+            import server.mqtt.handlers # pylint: disable=import-outside-toplevel,unused-import
+            from server.mqtt.client import ServerMqttClient # pylint: disable=import-outside-toplevel
+            self.client = ServerMqttClient.client
+            self.get_handlers = lambda topic: [route.handler for route in ServerMqttClient.routes
+                                               if topic_matches_sub(route.topic_filter, topic)]
+        elif name == "bot":
+            import bot.mqtt.handlers # pylint: disable=import-outside-toplevel,unused-import
+            from bot.mqtt.client import MqttClient # pylint: disable=import-outside-toplevel
+            self.client = MqttClient.client
+            self.get_handlers = lambda topic: [handler
+                                               for topic_filter, handler in MqttClient.routes
+                                               if topic_matches_sub(topic_filter, topic)]
+        else:
+            raise ValueError(f"Unknown target {name}")
+
+    def publish(self, msg: MQTTMessage) -> None:
+        """The function calls all handlers matching the message topic"""
+        for handler in self.get_handlers(msg.topic):
+            stats = self.stats.setdefault(handler.__name__, HandlerStats())
+            start_time = time.perf_counter()
+            try:
+                handler(self.client, None, msg)
+            except Exception as e:
+                stats.errors += 1
+                logging.error("REPLAY\t-\t%s: %s", msg.topic, e)
+            stats.add(time.perf_counter() - start_time)
+
+    async def flush(self) -> None:
+        """The function waits until replayed messages are processed"""
+
+class BrokerTarget:
+    """The class publishes replayed messages to the broker"""
+    def __init__(self, server_ip: str, port: int) -> None:
+        self.server_ip = server_ip
+        self.port = port
+        self.client = Client(CallbackAPIVersion.VERSION2, client_id=f"replay_{os.getpid()}",
+                             clean_session=True)
+        self.client.on_connect = self.on_connect
+        self.connected = asyncio.Event()
+        self.last_info = None
+
+    def on_connect(self, client: Client, userdata: Any, flags, reason_code, properties) -> None:
+        """The callback allows replay after the connection"""
+        del client, userdata, flags, properties
+        if reason_code.is_failure:
+            logging.error("REPLAY\t-\tconnection refused: %s", reason_code)
+            return
+        self.connected.set()
+
+    async def connect(self) -> None:
+        """The function connects the client in the running event loop"""
+        AsyncioHelper(asyncio.get_running_loop(), self.client)
+        self.client.connect(self.server_ip, self.port, 60)
+        await self.connected.wait()
+
+    def publish(self, msg: MQTTMessage) -> None:
+        """The function publishes the message with its captured qos and retain flag"""
+        self.last_info = self.client.publish(msg.topic, msg.payload, msg.qos, msg.retain)
+
+    async def flush(self) -> None:
+        """The function waits until all messages are sent and disconnects"""
+        while self.last_info is not None and not self.last_info.is_published():
+            await asyncio.sleep(0.01)
+        self.client.disconnect()
+
+async def replay(messages: Iterator[Tuple[float, MQTTMessage]], publish: Callable,
+                 speed: float = 1) -> Dict[str, float]:
+    """The function passes messages to publish at their captured time divided by speed,
+        speed 0 replays as fast as possible. Returns number of messages, elapsed time,
+        rate and the largest lag behind the captured timing"""
+    start_time = time.time()
+    first_offset = None
+    count = 0
+    max_lag = 0
+    for offset, msg in messages:
+        if first_offset is None:
+            first_offset = offset
+        if speed > 0:
+            delay = (offset - first_offset) / speed - (time.time() - start_time)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        elif count % MAX_SPEED_BATCH == 0:
+            await asyncio.sleep(0)
+        publish(msg)
+        count += 1
+    elapsed = time.time() - start_time
+    return {"messages": count, "elapsed": elapsed,
+            "rate": count / elapsed if elapsed else 0, "max_lag": max_lag}
+
+def filter_messages(messages: Iterator[Tuple[float, MQTTMessage]],
+                    topic_filter: str) -> Iterator[Tuple[float, MQTTMessage]]:
+    """The function yields only messages matching the topic filter"""
+    for offset, msg in messages:
+        if topic_matches_sub(topic_filter, msg.topic):
+            yield offset, msg
+
+def get_broker_address(args: argparse.Namespace) -> Tuple[str, int]:
+    """The function returns broker address from arguments or environment"""
+    load_dotenv()
+    return (args.ip or os.getenv("SERVER_IP", "localhost"),
+            args.port or int(os.getenv("SERVER_PORT", "1883")))
+
+def capture(args: argparse.Namespace) -> None:
+    """The function writes all messages matching the topic filter to the file
+        until the duration is over or the script is interrupted"""
+    server_ip, port = get_broker_address(args)
+    writer = TrafficWriter(args.output)
+    client = Client(CallbackAPIVersion.VERSION2, client_id=f"capture_{os.getpid()}",
+                    clean_session=True)
+    client.on_connect = lambda client, *_: client.subscribe(args.topic)
+    client.on_message = lambda client, userdata, msg: writer.write(msg)
+    client.connect(server_ip, port, 60)
+    client.loop_start()
+    print(f"Capturing {args.topic} from {server_ip}:{port} to {args.output}")
+    try:
+        while args.duration == 0 or time.time() - writer.start_time < args.duration:
+            time.sleep(1)
+            print(f"\r{writer.count} messages, {len(writer.topics)} topics", end="", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"\nCaptured {writer.count} messages")
+
+async def run_replay(args: argparse.Namespace) -> None:
+    """The function replays the file to the target and prints the measurements"""
+    if args.target == "broker":
+        target = BrokerTarget(*get_broker_address(args))
+        await target.connect()
+    else:
+        target = HandlerTarget(args.target)
+    messages = filter_messages(read_traffic(args.input), args.topic)
+    for _ in range(args.repeat):
+        result = await replay(messages, target.publish, args.speed)
+        print(f"Replayed {result['messages']} messages in {result['elapsed']:.2f} sec, "
+              f"{result['rate']:.0f} msg/s, max lag {result['max_lag'] * 1000:.1f} ms")
+        messages = filter_messages(read_traffic(args.input), args.topic)
+    await target.flush()
+    if isinstance(target, HandlerTarget):
+        print("handler\tcalls\terrors\tmean ms\tmax ms")
+        for name, stats in sorted(target.stats.items()):
+            print(f"{name}\t{stats.calls}\t{stats.errors}"
+                  f"\t{stats.total_latency / stats.calls * 1000:.3f}"
+                  f"\t{stats.max_latency * 1000:.3f}")
+
+def start(command: str, args: list['str'] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Capture and replay of ice_runner MQTT traffic')
+    if command == "capture":
+        parser.add_argument("--output", required=True,
+                            help="Path to the capture file, .gz suffix enables compression")
+        parser.add_argument("--duration", default=0, type=float,
+                            help="Capture duration, sec. 0 captures until interrupted")
+    else:
+        parser.add_argument("--input", required=True, help="Path to the capture file")
+        parser.add_argument("--speed", default=1, type=float,
+                            help="Replay speed relative to the captured timing, 0 is max")
+        parser.add_argument("--target", default="broker", choices=["broker", "server", "bot"],
+                            help="Replay to the broker or directly to the server or bot handlers")
+        parser.add_argument("--repeat", default=1, type=int, help="Number of replays")
+    parser.add_argument("--topic", default="ice_runner/#", help="Topic filter of the messages")
+    parser.add_argument("--ip", default=None, type=str, help="MQTT broker address")
+    parser.add_argument("--port", default=None, type=int, help="MQTT broker port")
+    args: argparse.Namespace = parser.parse_args(args)
+    if command == "capture":
+        capture(args)
+    else:
+        asyncio.run(run_replay(args))
@@ -9,7 +9,9 @@ import os.path
 script_dir = os.path.dirname(os.path.realpath(__file__))
 
 parser = argparse.ArgumentParser()
-parser.add_argument('command', choices=['bot', 'sim', 'client', 'srv'])
+parser.add_argument('command', choices=['bot', 'sim', 'client', 'srv', 'load', 'capture', 'replay',
+                                        'analyze', 'decode', 'replay_can',
+                                        'whatif', 'tune', 'identify'])
 parser.add_argument('--log_dir', default=script_dir)
 command, rem = parser.parse_known_args()
 
@@ -28,3 +30,35 @@ elif command.command == 'client':
 elif command.command == 'srv':
     from server.main import start
     start(command.log_dir, rem)
+
+elif command.command == 'load':
+    from ice_sim.fleet_load import start
+    start(rem)
+
+elif command.command in ('capture', 'replay'):
+    from ice_sim.traffic_replay import start
+    start(command.command, rem)
+
+elif command.command == 'analyze':
+    from analysis.run_statistics import start
+    start(rem)
+
+elif command.command == 'decode':
+    from analysis.candump_decoder import start
+    start(rem)
+
+elif command.command == 'replay_can':
+    from ice_sim.candump_replay import start
+    start(rem)
+
+elif command.command == 'whatif':
+    from analysis.threshold_whatif import start
+    start(rem)
+
+elif command.command == 'tune':
+    from analysis.pid_tuning import start
+    start(rem)
+
+elif command.command == 'identify':
+    from analysis.engine_identification import start
+    start(rem)
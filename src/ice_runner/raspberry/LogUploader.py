@@ -0,0 +1,126 @@
+"""The module defines uploader of the run log files from Raspberry Pi to server"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict
+from paho.mqtt.client import Client
+from common.log_transfer import (CHUNK_SIZE, LOG_WINDOW, get_file_sha256,
+                                 get_transfer_id, pack_chunk)
+
+ACK_TIMEOUT = 5 # sec, the transfer is offered again if no acknowledgement received
+
+def read_chunk(path: str, offset: int, size: int) -> bytes:
+    """The function reads the chunk of the file"""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return file.read(size)
+
+class Upload:
+    """The class stores sender state of the single file transfer"""
+    def __init__(self, name: str, path: str, bundle: str, bundle_size: int) -> None:
+        self.name = name
+        self.path = path
+        self.transfer_id = get_transfer_id(os.path.basename(path))
+        self.bundle = bundle
+        self.bundle_size = bundle_size
+        self.size: int = 0
+        self.sha256: str = ""
+        self.acked: int = 0
+        self.next_offset: int | None = None
+        self.window: int = LOG_WINDOW
+        self.done = False
+        self.acknowledged = asyncio.Event()
+
+    def get_offer(self) -> Dict[str, Any]:
+        """The function returns offer of the file"""
+        return {"name": self.name,
+                "file": os.path.basename(self.path),
+                "size": self.size,
+                "sha256": self.sha256,
+                "bundle": self.bundle,
+                "bundle_size": self.bundle_size}
+
+class LogUploader:
+    """The class uploads bundles of the run log files one by one. Files are read in worker
+        threads and the uploader waits for acknowledgements asynchronously, so the control
+        loop is not blocked. If acknowledgement does not come in ACK_TIMEOUT, the file is
+        offered again and the transfer continues from the offset received by server"""
+    def __init__(self, client: Client, run_id: int) -> None:
+        self.client = client
+        self.run_id = run_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.upload: Upload | None = None
+
+    def add(self, logs: Dict[str, str]) -> None:
+        """The function adds the bundle of log files to the upload queue,
+            may be called from any thread"""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, dict(logs))
+
+    def on_ack(self, transfer_id: str, ack: Dict[str, Any]) -> None:
+        """The function passes acknowledgement of the server to the upload,
+            may be called from any thread"""
+        self.loop.call_soon_threadsafe(self.handle_ack, transfer_id, ack)
+
+    def handle_ack(self, transfer_id: str, ack: Dict[str, Any]) -> None:
+        """The function updates the upload state by acknowledgement"""
+        upload = self.upload
+        if upload is None or upload.transfer_id != transfer_id:
+            return
+        if upload.next_offset is None or ack["offset"] < upload.acked:
+            upload.next_offset = ack["offset"]
+        upload.acked = ack["offset"]
+        upload.window = ack["window"]
+        upload.done = ack["done"]
+        upload.acknowledged.set()
+
+    async def run(self) -> None:
+        """The function uploads bundles from the queue"""
+        while True:
+            logs: Dict[str, str] = await self.queue.get()
+            bundle = str(int(time.time() * 1000))
+            logs = {name: path for name, path in logs.items()
+                    if path is not None and os.path.exists(path)}
+            for name, path in logs.items():
+                try:
+                    await self.send_file(Upload(name, path, bundle, len(logs)))
+                except OSError as e:
+                    logging.error("UPLOAD\t-\t%s failed: %s", path, e)
+            self.upload = None
+
+    async def send_file(self, upload: Upload) -> None:
+        """The function sends chunks of the file in the window after acknowledged offset"""
+        upload.size = os.path.getsize(upload.path)
+        upload.sha256 = await asyncio.to_thread(get_file_sha256, upload.path, upload.size)
+        self.upload = upload
+        topic = f"ice_runner/raspberry_pi/{self.run_id}/log_transfer/{upload.transfer_id}"
+        logging.info("UPLOAD\t-\t%s %d bytes", upload.path, upload.size)
+        while not upload.done:
+            upload.acknowledged.clear()
+            if upload.next_offset is None:
+                self.client.publish(f"{topic}/offer", json.dumps(upload.get_offer()), qos=1)
+            else:
+                window_end = min(upload.size, upload.acked + upload.window * CHUNK_SIZE)
+                while upload.next_offset < window_end:
+                    size = min(CHUNK_SIZE, window_end - upload.next_offset)
+                    data = await asyncio.to_thread(read_chunk, upload.path,
+                                                   upload.next_offset, size)
+                    if not data:
+                        raise OSError(f"{upload.path} is truncated")
+                    self.client.publish(f"{topic}/chunk",
+                                        pack_chunk(upload.next_offset, data), qos=1)
+                    upload.next_offset += len(data)
+            try:
+                await asyncio.wait_for(upload.acknowledged.wait(), ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning("UPLOAD\t-\t%s no acknowledgement at %d",
+                                upload.path, upload.acked)
+                upload.next_offset = None
+        logging.info("UPLOAD\t-\t%s done", upload.path)
@@ -0,0 +1,109 @@
+"""The module defines the summary of the run accumulated while the run goes"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import math
+import time
+from typing import Any, Dict, List
+from common.RunnerState import RunnerState
+from raspberry.can_control.EngineState import EngineState, EngineStatus
+
+# attributes of the engine status updated by the dronecan message of the type
+SUMMARY_CHANNELS: Dict[str, List[str]] = {
+    "uavcan.equipment.ice.reciprocating.Status": ["rpm", "temp", "gas_throttle",
+                                                  "air_throttle", "current", "voltage_in"],
+    "uavcan.equipment.ahrs.RawIMU": ["vibration"],
+    "uavcan.equipment.ice.FuelTankStatus": ["fuel_level_percent"],
+}
+# states of the runner with the engine started or starting
+ACTIVE_STATES = (RunnerState.STARTING, RunnerState.RUNNING)
+
+class ChannelAccumulator:
+    """The class accumulates count, mean, variance (Welford algorithm) and peaks
+        of the channel sample by sample"""
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        """The function adds the sample"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def get_std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "mean": self.mean, "std": self.get_std(),
+                "min": self.min, "max": self.max}
+
+class RunSummary:
+    """The class accumulates the summary of the run from the dronecan handlers and
+        the runner state updates: statistics of the status channels, time of the runner
+        in every state and starter engagements. The summary is kept in memory,
+        so it is ready to be published as soon as the run is stopped"""
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self, crnt_time: float | None = None) -> None:
+        """The function starts the summary of the new run"""
+        self.start_time: float = time.time() if crnt_time is None else crnt_time
+        self.channels: Dict[str, ChannelAccumulator] = {}
+        self.state_time: Dict[str, float] = {}
+        self.starter_engagements = 0
+        self.start_attempts = 0
+        self.state: RunnerState | None = None
+        self.engine_state: EngineState | None = None
+        self.last_update_time: float = self.start_time
+        self.engaged_time: float | None = None
+
+    def update_with_status(self, can_type: str, status: EngineStatus) -> None:
+        """The function adds the values of the status updated by the dronecan message"""
+        if status.engaged_time:
+            # engaged time of the engine itself, kept in the engine history of the server
+            self.engaged_time = float(status.engaged_time)
+        for name in SUMMARY_CHANNELS.get(can_type, []):
+            value = getattr(status, name)
+            if isinstance(value, (int, float)):
+                self.channels.setdefault(name, ChannelAccumulator()).add(float(value))
+
+    def update_state(self, state: RunnerState, engine_state: EngineState, start_attempts: int,
+                     crnt_time: float | None = None) -> None:
+        """The function counts the time since the last update to the previous state
+            of the runner and the engagements of the starter"""
+        crnt_time = time.time() if crnt_time is None else crnt_time
+        if self.state is not None:
+            self.state_time[self.state.name] = self.state_time.get(self.state.name, 0) + \
+                                               crnt_time - self.last_update_time
+        if engine_state == EngineState.STARTER_RUNNING and \
+                self.engine_state != EngineState.STARTER_RUNNING:
+            self.starter_engagements += 1
+        self.start_attempts = max(self.start_attempts, start_attempts)
+        self.state = state
+        self.engine_state = engine_state
+        self.last_update_time = crnt_time
+
+    def get_active_time(self) -> float:
+        """The function returns the time of the runner in the active states"""
+        return sum(self.state_time.get(state.name, 0) for state in ACTIVE_STATES)
+
+    def to_dict(self, crnt_time: float | None = None) -> Dict[str, Any]:
+        """The function returns the summary of the run until now"""
+        crnt_time = time.time() if crnt_time is None else crnt_time
+        return {
+            "duration": crnt_time - self.start_time,
+            "state_time": self.state_time,
+            "starter_engagements": self.starter_engagements,
+            "start_attempts": self.start_attempts,
+            "engaged_time": self.engaged_time,
+            "channels": {name: channel.to_dict() for name, channel in self.channels.items()},
+        }
@@ -0,0 +1,183 @@
+"""The module defines service reading tails of the current run log files on request"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Set, Tuple
+from paho.mqtt.client import Client
+
+MAX_READ_SIZE = 16 * 1024 # bytes, the largest part of the file sent in one reply
+MAX_LINES = 200
+BLOCK_SIZE = 4096 # bytes, lines are searched from the end of the file by blocks
+MIN_FOLLOW_PERIOD = 1 # sec
+FOLLOW_TIMEOUT = 60 # sec, follow is stopped if not renewed
+MAX_FOLLOWS = 4 # follow subscriptions served at once by the runner
+
+def read_range(path: str, offset: int, length: int) -> Tuple[int, bytes, int]:
+    """The function reads bytes of the file, negative offset is counted from the end.
+        Returns offset of the read bytes, the bytes and the size of the file"""
+    with open(path, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        if offset < 0:
+            offset = max(0, size + offset)
+        offset = min(offset, size)
+        file.seek(offset)
+        return offset, file.read(min(length, MAX_READ_SIZE)), size
+
+def read_last_lines(path: str, n_lines: int) -> Tuple[int, bytes, int]:
+    """The function reads last lines of the file by blocks from the end, so only the tail
+        of the file is read. Returns offset of the read bytes, the bytes
+        and the size of the file"""
+    with open(path, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        offset = size
+        data = b""
+        # The last line may be not finished, so one more newline is needed
+        while offset > 0 and data.count(b"\n") <= n_lines and len(data) < MAX_READ_SIZE:
+            block_size = min(BLOCK_SIZE, offset)
+            offset -= block_size
+            file.seek(offset)
+            data = file.read(block_size) + data
+        lines = data.split(b"\n")
+        if len(lines) > n_lines + 1:
+            lines = lines[-n_lines - 1:]
+        tail = b"\n".join(lines)[-MAX_READ_SIZE:]
+        return size - len(tail), tail, size
+
+class Follow:
+    """The class stores state of the follow subscription"""
+    def __init__(self, req_id: str, name: str, position: int, period: float) -> None:
+        self.req_id = req_id
+        self.name = name
+        self.position = position
+        self.period = max(period, MIN_FOLLOW_PERIOD)
+        self.deadline = time.time() + FOLLOW_TIMEOUT
+        self.path: str | None = None
+        self.task: asyncio.Task | None = None
+
+class TailService:
+    """The class serves reads of the run log files. Requests contain req_id, file name
+        from the run logs and mode: "range" with offset and length, "lines" with number
+        of lines or "follow" with period to receive lines appended to the file.
+        Follow reads only new bytes from the last position, no more than MAX_READ_SIZE
+        per period, so the rate of replies and their size are limited. No more than
+        MAX_FOLLOWS subscriptions are served at once"""
+    def __init__(self, client: Client, run_id: int,
+                 get_files: Callable[[], Dict[str, str]]) -> None:
+        self.client = client
+        self.run_id = run_id
+        self.get_files = get_files
+        self.loop = asyncio.get_running_loop()
+        self.follows: Dict[str, Follow] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def on_request(self, request: Dict[str, Any]) -> None:
+        """The function passes request to the service, may be called from any thread"""
+        self.loop.call_soon_threadsafe(self.run_request, request)
+
+    def run_request(self, request: Dict[str, Any]) -> None:
+        """The function answers the request in the task kept until it is done"""
+        task = asyncio.create_task(self.handle_request(request))
+        self.tasks.add(task)
+        task.add_done_callback(self.on_task_done)
+
+    def on_task_done(self, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("TAIL\t-\tRequest failed: %s", task.exception())
+
+    def is_follow_allowed(self, req_id: str) -> bool:
+        """The function checks if the follow may be started or renewed"""
+        return req_id in self.follows or len(self.follows) < MAX_FOLLOWS
+
+    def reply(self, req_id: str, reply: Dict[str, Any]) -> None:
+        """The function publishes reply to the request"""
+        reply["req_id"] = req_id
+        self.client.publish(f"ice_runner/raspberry_pi/{self.run_id}/tail/{req_id}",
+                            json.dumps(reply))
+
+    def get_path(self, name: str) -> str | None:
+        """The function returns path of the current run log file"""
+        path = self.get_files().get(name)
+        if path is None or not os.path.exists(path):
+            return None
+        return path
+
+    async def handle_request(self, request: Dict[str, Any]) -> None:
+        """The function answers the request"""
+        req_id = str(request["req_id"])
+        mode = request.get("mode", "lines")
+        if mode == "unfollow":
+            follow = self.follows.pop(req_id, None)
+            if follow is not None:
+                follow.task.cancel()
+            return
+        if mode == "follow" and not self.is_follow_allowed(req_id):
+            self.reply(req_id, {"error": f"No more than {MAX_FOLLOWS} follows", "done": True})
+            return
+        name = request.get("file", "candump")
+        path = self.get_path(name)
+        if path is None:
+            self.reply(req_id, {"error": f"No file {name}",
+                                "files": list(self.get_files().keys())})
+            return
+        if mode == "range":
+            offset, data, size = await asyncio.to_thread(
+                read_range, path, int(request.get("offset", 0)),
+                int(request.get("length", MAX_READ_SIZE)))
+        else:
+            offset, data, size = await asyncio.to_thread(
+                read_last_lines, path, min(int(request.get("lines", 10)), MAX_LINES))
+        self.reply(req_id, {"file": name, "offset": offset, "size": size,
+                            "data": data.decode(errors="replace")})
+        if mode == "follow":
+            self.start_follow(req_id, name, size, float(request.get("period", 1)))
+
+    def start_follow(self, req_id: str, name: str, position: int, period: float) -> None:
+        """The function starts or renews the follow subscription"""
+        follow = self.follows.get(req_id)
+        if follow is not None:
+            follow.deadline = time.time() + FOLLOW_TIMEOUT
+            return
+        if not self.is_follow_allowed(req_id):
+            # other follows are started while the file was read
+            self.reply(req_id, {"error": f"No more than {MAX_FOLLOWS} follows", "done": True})
+            return
+        follow = Follow(req_id, name, position, period)
+        follow.path = self.get_path(name)
+        follow.task = asyncio.create_task(self.follow(follow))
+        self.follows[req_id] = follow
+
+    async def follow(self, follow: Follow) -> None:
+        """The function sends bytes appended to the file since the previous period.
+            If the run is changed, the new file is followed from its beginning"""
+        try:
+            while time.time() < follow.deadline:
+                await asyncio.sleep(follow.period)
+                path = self.get_path(follow.name)
+                if path is None:
+                    continue
+                if path != follow.path:
+                    follow.path = path
+                    follow.position = 0
+                offset, data, size = await asyncio.to_thread(
+                                        read_range, path, follow.position, MAX_READ_SIZE)
+                if size < follow.position:
+                    follow.position = 0
+                    continue
+                if not data:
+                    continue
+                follow.position = offset + len(data)
+                self.reply(follow.req_id, {"file": follow.name, "offset": offset, "size": size,
+                                           "data": data.decode(errors="replace")})
+        except OSError as e:
+            logging.error("TAIL\t-\t%s: %s", follow.path, e)
+        finally:
+            self.follows.pop(follow.req_id, None)
+            self.reply(follow.req_id, {"file": follow.name, "done": True})
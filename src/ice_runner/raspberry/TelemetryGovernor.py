@@ -0,0 +1,75 @@
+"""The module defines the governor of the telemetry publish rate of the ICE runner"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import logging
+from common.RunnerState import RunnerState
+from raspberry.can_control.EngineState import EngineStatus
+from raspberry.RunnerConfiguration import RunnerConfiguration
+
+MIN_REPORT_PERIOD = 0.5 # sec
+MAX_REPORT_PERIOD = 60 # sec
+FAST_PERIOD_DIVIDER = 5 # STARTING or fault is approaching
+IDLE_PERIOD_MULTIPLIER = 3 # STOPPED, NOT_CONNECTED
+FAULT_APPROACH_RATIO = 0.9 # part of the rpm and vibration limits treated as approaching fault
+TEMP_APPROACH_MARGIN = 10 # K, distance to the temperature limit treated as approaching fault
+
+LATENCY_LIMIT = 0.5 # sec, publish latency treated as saturated uplink
+QUEUE_DEPTH_LIMIT = 20 # unacknowledged publishes treated as saturated uplink
+LATENCY_SMOOTHING = 0.2
+MAX_BACKOFF = 16
+BACKOFF_INCREASE = 2 # multiplicative increase on saturation
+BACKOFF_DECREASE = 0.25 # additive decrease when the uplink is healthy
+
+class TelemetryGovernor:
+    """The class is used to choose the period of status, state and dronecan messages reports.
+        The period is shortened when the runner is starting or a fault is approaching,
+        prolonged when the runner is idle and backs off when the uplink is saturated"""
+    def __init__(self) -> None:
+        self.latency: float = 0
+        self.queue_depth: int = 0
+        self.backoff: float = 1
+        self.period: float = 0
+
+    def update_link(self, latency: float, queue_depth: int, failures: int = 0) -> None:
+        """The function updates uplink measurements: latency of the last acknowledged publish,
+            number of publishes waiting for acknowledgement and number of failed publishes,
+            the failed publishes mean the uplink is down"""
+        self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        self.queue_depth = queue_depth
+        if self.latency > LATENCY_LIMIT or self.queue_depth > QUEUE_DEPTH_LIMIT or failures:
+            if self.backoff < MAX_BACKOFF:
+                logging.warning("GOVERNOR\t-\tUplink saturated: latency %.2f sec, queue %d, "
+                                "failed %d", self.latency, self.queue_depth, failures)
+            self.backoff = min(MAX_BACKOFF, self.backoff * BACKOFF_INCREASE)
+            return
+        self.backoff = max(1, self.backoff - BACKOFF_DECREASE)
+
+    def get_period(self, base_period: float, runner_state: RunnerState,
+                   fault_approaching: bool = False) -> float:
+        """The function returns the effective report period in seconds"""
+        period = base_period
+        if runner_state == RunnerState.STARTING or fault_approaching:
+            period = base_period / FAST_PERIOD_DIVIDER
+        elif runner_state in (RunnerState.STOPPED, RunnerState.NOT_CONNECTED):
+            period = base_period * IDLE_PERIOD_MULTIPLIER
+        period = min(MAX_REPORT_PERIOD, max(MIN_REPORT_PERIOD, period * self.backoff))
+        if period != self.period:
+            logging.debug("GOVERNOR\t-\tReport period changed to %.1f sec", period)
+        self.period = period
+        return period
+
+def is_fault_approaching(status: EngineStatus, configuration: RunnerConfiguration) -> bool:
+    """The function checks if any of the stop conditions is close to its limit"""
+    if configuration.max_rpm != 0 and \
+            status.rpm > FAULT_APPROACH_RATIO * configuration.max_rpm:
+        return True
+    if configuration.max_temperature != 0 and \
+            status.temp > configuration.max_temperature - TEMP_APPROACH_MARGIN:
+        return True
+    if configuration.max_vibration != 0 and status.rec_imu and \
+            status.vibration > FAULT_APPROACH_RATIO * configuration.max_vibration:
+        return True
+    return False
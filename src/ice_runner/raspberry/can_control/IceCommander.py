@@ -20,6 +20,7 @@ from raspberry.can_control.EngineState import EngineState
 from raspberry.can_control.RunnerStateController import RunnerStateController
 from common.RunnerState import RunnerState
 from raspberry.RunnerConfiguration import RunnerConfiguration
+from raspberry.TelemetryGovernor import TelemetryGovernor, is_fault_approaching
 if os.path.exists("/proc/device-tree/model"):
     from RPi import GPIO # Import Raspberry Pi GPIO library
 
@@ -47,6 +48,7 @@ class ICECommander:
         self.state_controller = RunnerStateController()
         self.start_bad_state_time: float = 0
         self.bad_cond_flag = False
+        self.telemetry_governor = TelemetryGovernor()
 
     async def run(self) -> None:
         """The function starts the ICE runner"""
@@ -58,6 +60,7 @@ class ICECommander:
 
         MqttClient.run_logs["candump"] = CanNode.candump_filename
         MqttClient.publish_full_configuration(self.configuration.get_original_dict())
+        MqttClient.publish_configuration()
         while True:
             try:
                 await self.spin()
@@ -157,6 +160,8 @@ class ICECommander:
 
         self.state_controller.update(CanNode.status.state)
         CanNode.status.start_attempts = self.state_controller.start_attempts
+        CanNode.run_summary.update_state(self.state_controller.state, CanNode.status.state,
+                                         self.state_controller.start_attempts)
         if self.state_controller.state == RunnerState.STOPPED\
             and self.state_controller.prev_state == RunnerState.STOPPING:
             CanNode.stop_dump()
@@ -170,9 +175,20 @@ class ICECommander:
             self.prev_state_report_time = time.time()
             # logging.info(f"CMD\t-\t{list(CanNode.cmd.cmd)}")
 
+    def get_report_period(self) -> float:
+        """The function returns report period chosen by the telemetry governor according to
+            the runner state, closeness of stop conditions and the uplink load"""
+        fault_approaching = self.start_bad_state_time > 0 or\
+                            is_fault_approaching(CanNode.status, self.configuration)
+        return self.telemetry_governor.get_period(self.configuration.report_period,
+                                                  self.state_controller.state,
+                                                  fault_approaching)
+
     def report_status(self) -> None:
         """The function reports status to MQTT broker"""
-        if self.prev_report_time + self.configuration.report_period < time.time():
+        report_period = self.get_report_period()
+        if self.prev_report_time + report_period < time.time():
+            self.telemetry_governor.update_link(*MqttClient.get_link_measurements())
             status_dict = CanNode.status.get_description_dict()
             time_left = self.configuration.time + self.start_time - time.time()
             if self.start_time > 0:
@@ -183,6 +199,7 @@ class ICECommander:
                             f"{int(time_left / 60)} min {int(time_left % 60)} sec"
             else:
                 status_dict["Time left"] = "not started"
+            status_dict["Report period"] = f"{round(report_period, 1)} sec"
             MqttClient.publish_state(self.state_controller.state)
             MqttClient.publish_status(status_dict)
             MqttClient.publish_messages(CanNode.messages)
@@ -204,6 +221,7 @@ class ICECommander:
             if self.state_controller.state > RunnerState.STARTING:
                 self.state_controller.state = RunnerState.STARTING
                 self.start_time = time.time()
+                CanNode.run_summary.reset(self.start_time)
             logging.info("MQTT\t-\tCOMMAND\t run, state: %s", {self.state_controller.state.name})
             MqttClient.to_run = 0
         if MqttClient.conf_updated:
@@ -217,6 +235,7 @@ class ICECommander:
             else:
                 self.mode.update_configuration(self.configuration)
             MqttClient.conf_updated = False
+            MqttClient.publish_configuration()
             logging.info("MQTT\t-\tCOMMAND\t configuration updated")
 
     def send_log(self) -> None:
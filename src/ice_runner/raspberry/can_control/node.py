@@ -19,12 +19,14 @@ from raccoonlab_tools.common.device_manager import DeviceManager
 import yaml
 
 from raspberry.can_control.EngineState import Health, EngineStatus, Mode
+from raspberry.RunSummary import RunSummary
 
 # logger = logging.getLogger(__name__)
 
 ICE_THR_CHANNEL = 7
 ICE_AIR_CHANNEL = 10
 MAX_AIR_OPEN = 8191
+NODE_ID = 100
 
 def safely_write_to_file(filename: str) -> float:
     """The function writes to file and syncs it with disk"""
@@ -43,15 +45,22 @@ class CanNode:
     messages: Dict[str, Any] = {}
     candump_task: asyncio.Task| None = None
     candump_filename: str| None = None
+    transport: str | None = None
     last_sync_time: float = 0
     last_message_receive_time: float = 0
+    run_summary: RunSummary = RunSummary()
 
     @classmethod
-    def connect(cls) -> None:
-        """The function establishes dronecan node and starts candump"""
+    def connect(cls, node: Node | None = None) -> None:
+        """The function establishes dronecan node and starts candump. The node may be given,
+            for example the node of the candump replay, then candump is not started"""
         cls.status: EngineStatus = EngineStatus()
-        cls.node: Node = DronecanNode(node_id=100).node
-        cls.transport = DeviceManager.get_device_port()
+        if node is None:
+            cls.node: Node = DronecanNode(node_id=NODE_ID).node
+            cls.transport = DeviceManager.get_device_port()
+        else:
+            cls.node = node
+            cls.transport = None
         cls.air_cmd = dronecan.uavcan.equipment.actuator.Command(
                                             actuator_id=ICE_AIR_CHANNEL, command_value=0)
         cls.cmd = dronecan.uavcan.equipment.esc.RawCommand(cmd=[0]*(ICE_THR_CHANNEL + 1))
@@ -100,6 +109,7 @@ class CanNode:
                 for can_type in cls.can_output_filenames:
                     safely_write_to_file(cls.can_output_filenames[can_type])
                 safely_write_to_file(cls.candump_filename)
+                cls.last_sync_time = time.time()
         except OSError as e:
             if e.errno == 9:  # Bad file descriptor
                 logging.error("Bad file descriptor.")
@@ -124,6 +134,8 @@ class CanNode:
     @classmethod
     def run_candump(cls) -> None:
         """The function runs candump, used to save dronecan messages"""
+        if cls.transport is None:
+            return
         assert cls.candump_filename
         with open(cls.candump_filename, "wb", buffering=0) as cls.candump_file:
             # filter NodeStatus messages
@@ -183,12 +195,14 @@ def fuel_tank_status_handler(msg: dronecan.node.TransferEvent) -> None:
     CanNode.messages['uavcan.equipment.ice.FuelTankStatus'] = yaml.load(
                                                 dronecan.to_yaml(msg.message), yaml.BaseLoader)
     CanNode.status.update_with_fuel_tank_status(msg)
+    CanNode.run_summary.update_with_status("uavcan.equipment.ice.FuelTankStatus", CanNode.status)
     dump_msg(msg, "uavcan.equipment.ice.FuelTankStatus")
     logging.debug("MES\t-\tReceived fuel tank status")
 
 def raw_imu_handler(msg: dronecan.node.TransferEvent) -> None:
     """The function handles uavcan.equipment.ahrs.RawIMU"""
     CanNode.status.update_with_raw_imu(msg)
+    CanNode.run_summary.update_with_status("uavcan.equipment.ahrs.RawIMU", CanNode.status)
     CanNode.messages['uavcan.equipment.ahrs.RawIMU'] = yaml.load(dronecan.to_yaml(msg.message),
                                                                 yaml.BaseLoader)
     CanNode.has_imu = True
@@ -211,6 +225,8 @@ def node_status_handler(msg: dronecan.node.TransferEvent) -> None:
 def ice_reciprocating_status_handler(msg: dronecan.node.TransferEvent) -> None:
     """The function handles uavcan.equipment.ice.reciprocating.Status"""
     CanNode.status.update_with_resiprocating_status(msg)
+    CanNode.run_summary.update_with_status("uavcan.equipment.ice.reciprocating.Status",
+                                           CanNode.status)
     CanNode.messages['uavcan.equipment.ice.reciprocating.Status'] = yaml.load(
                                                 dronecan.to_yaml(msg.message), yaml.BaseLoader)
     dump_msg(msg, "uavcan.equipment.ice.reciprocating.Status")
@@ -9,11 +9,14 @@
 import os
 import sys
 import time
+from typing import Dict
 
 import asyncio
 import argparse
 from dotenv import load_dotenv
 from raspberry.mqtt.handlers import MqttClient, add_handlers
+from raspberry.LogUploader import LogUploader
+from raspberry.TailService import TailService
 from raspberry.can_control.IceCommander import ICECommander
 from raspberry.RunnerConfiguration import RunnerConfiguration
 from raspberry.can_control.node import CanNode
@@ -21,6 +24,12 @@ from common import logging_configurator
 
 last_sync_time = time.time()
 
+def get_run_files() -> Dict[str, str]:
+    """The function returns log files of the current run"""
+    files = dict(CanNode.can_output_filenames)
+    files["candump"] = CanNode.candump_filename
+    return files
+
 async def main(run_id: int, configuration: RunnerConfiguration, log_dir: str) -> None:
     """The function starts the ICE runner"""
     print(f"RP\t-\tStarting raspberry {run_id}")
@@ -31,10 +40,15 @@ async def main(run_id: int, configuration: RunnerConfiguration, log_dir: str) ->
     add_handlers()
     ice_commander = ICECommander(configuration=configuration)
 
+    MqttClient.log_uploader = LogUploader(MqttClient.client, run_id)
+    MqttClient.tail_service = TailService(MqttClient.client, run_id, get_run_files)
+    MqttClient.run_summary = CanNode.run_summary
+
     mqtt_task = asyncio.create_task(MqttClient.start())
     ice_task = asyncio.create_task(ice_commander.run())
+    upload_task = asyncio.create_task(MqttClient.log_uploader.run())
 
-    background_tasks = {mqtt_task, ice_task}
+    background_tasks = {mqtt_task, ice_task, upload_task}
 
     ice_task.add_done_callback(ice_commander.on_keyboard_interrupt)
     mqtt_task.add_done_callback(MqttClient.on_keyboard_interrupt)
@@ -45,6 +59,7 @@ async def main(run_id: int, configuration: RunnerConfiguration, log_dir: str) ->
         await asyncio.sleep(0.5)
         mqtt_task.cancel()
         ice_task.cancel()
+        upload_task.cancel()
         await ice_task
         await mqtt_task
         # Ensure all tasks are cleaned up before closing loop
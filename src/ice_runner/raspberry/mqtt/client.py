@@ -7,12 +7,31 @@
 import json
 import sys
 import logging
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, Tuple
 from paho.mqtt.client import MQTTv311, Client, MQTTMessageInfo
 from paho.mqtt.enums import CallbackAPIVersion
 from raspberry.RunnerConfiguration import RunnerConfiguration
+from raspberry.LogUploader import LogUploader
+from raspberry.RunSummary import RunSummary
+from raspberry.TailService import TailService
 from common.RunnerState import RunnerState
 
+STALE_PUBLISH_TIMEOUT = 30 # sec, publishes without acknowledgement are forgotten after it
+
+def on_publish(client: Client, userdata: Any, mid: int, reason_code, properties) -> None:
+    """The callback measures latency of tracked publishes. The network thread may
+        acknowledge the publish before it is tracked, the time of such acknowledgement
+        is kept for publish_tracked"""
+    del client, userdata, reason_code, properties
+    with MqttClient.publish_lock:
+        publish_time = MqttClient.publish_times.pop(mid, None)
+        if publish_time is None:
+            MqttClient.early_acks[mid] = time.time()
+            return
+        MqttClient.publish_latency = time.time() - publish_time
+
 class MqttClient:
     """The class is used to connect Raspberry Pi to MQTT broker"""
     client: Client = Client(callback_api_version = CallbackAPIVersion.VERSION2,
@@ -29,6 +48,15 @@ class MqttClient:
     configuration: RunnerConfiguration
     state: RunnerState = -1
     run_logs: Dict[str, str] = {}
+    log_uploader: LogUploader | None = None
+    tail_service: TailService | None = None
+    run_summary: RunSummary | None = None
+    publish_times: Dict[int, float] = {}
+    early_acks: Dict[int, float] = {}
+    publish_failures: int = 0
+    publish_latency: float = 0
+    publish_lock: threading.Lock = threading.Lock()
+    client.on_publish = on_publish
 
     @classmethod
     def connect(cls, runner_id: int, server_ip: str, port: int = 1883) -> None:
@@ -38,12 +66,51 @@ class MqttClient:
         logging.info("Connecting to %s: %s\n runner id: %d", server_ip, port, runner_id)
         cls.client.connect(server_ip, port, 60)
 
+    @classmethod
+    def publish_tracked(cls, topic: str, payload: Any) -> MQTTMessageInfo:
+        """The function publishes telemetry message and tracks it until acknowledgement,
+            so the uplink latency and queue depth can be measured. Publishes failed
+            to be queued, e.g. while disconnected, are counted as failures"""
+        publish_time = time.time()
+        mes_info: MQTTMessageInfo = cls.client.publish(topic, payload)
+        with cls.publish_lock:
+            if mes_info.rc != 0:
+                cls.publish_failures += 1
+            elif mes_info.mid in cls.early_acks:
+                cls.publish_latency = cls.early_acks.pop(mes_info.mid) - publish_time
+            else:
+                cls.publish_times[mes_info.mid] = publish_time
+        return mes_info
+
+    @classmethod
+    def get_link_measurements(cls) -> Tuple[float, int, int]:
+        """The function returns publish latency, number of publishes waiting for
+            acknowledgement and number of failed publishes since the last call.
+            The latency is the largest of the last acknowledged publish latency
+            and the age of waiting publishes, publishes older than STALE_PUBLISH_TIMEOUT
+            are forgotten"""
+        crnt_time = time.time()
+        with cls.publish_lock:
+            latency = cls.publish_latency
+            for mid, publish_time in list(cls.publish_times.items()):
+                if crnt_time - publish_time > STALE_PUBLISH_TIMEOUT:
+                    cls.publish_times.pop(mid, None)
+                    continue
+                latency = max(latency, crnt_time - publish_time)
+            # acknowledgements of the publishes which are not tracked
+            for mid, ack_time in list(cls.early_acks.items()):
+                if crnt_time - ack_time > STALE_PUBLISH_TIMEOUT:
+                    cls.early_acks.pop(mid, None)
+            failures = cls.publish_failures
+            cls.publish_failures = 0
+            return latency, len(cls.publish_times), failures
+
     @classmethod
     def publish_messages(cls, messages: Dict[str, Any]) -> None:
         """The function publishes dronecan messages to appropriate MQTT topic"""
         for dronecan_type in messages.keys():
-            cls.client.publish(f"ice_runner/raspberry_pi/{cls.run_id}/dronecan/{dronecan_type}",
-                                json.dumps(messages[dronecan_type]))
+            cls.publish_tracked(f"ice_runner/raspberry_pi/{cls.run_id}/dronecan/{dronecan_type}",
+                                 json.dumps(messages[dronecan_type]))
         logging.debug("PUBLISH\t-\tdronecan messages")
 
     @classmethod
@@ -52,7 +119,8 @@ class MqttClient:
         logging.debug("PUBLISH\t-\tstatus")
         MqttClient.status = status
         assert isinstance(status, dict)
-        cls.client.publish(f"ice_runner/raspberry_pi/{cls.run_id}/status", json.dumps(status).encode('utf8'))
+        cls.publish_tracked(f"ice_runner/raspberry_pi/{cls.run_id}/status",
+                            json.dumps(status).encode('utf8'))
 
     @classmethod
     def publish_state(cls, state: RunnerState) -> None:
@@ -68,11 +136,21 @@ class MqttClient:
                 logging.info("The client is not currently connected.")
                 cls.client.reconnect()
 
+    @classmethod
+    def publish_heartbeat(cls, seq: str) -> None:
+        """The function replies to the server heartbeat with its sequence number"""
+        cls.client.publish(f"ice_runner/raspberry_pi/{cls.run_id}/heartbeat", seq)
+
     @classmethod
     def publish_log(cls) -> None:
-        """This function should be called anytime the runner changes its log"""
+        """This function should be called anytime the runner changes its log.
+            The log files are uploaded to the server if the uploader is started,
+            otherwise only their paths are published"""
         logging.debug("PUBLISH\t-\tlog")
         logging.debug("PUBLISH\t-\tlogs: %s", cls.run_logs)
+        if cls.log_uploader is not None:
+            cls.log_uploader.add(cls.run_logs)
+            return
         mes_info:MQTTMessageInfo = MqttClient.client.publish(
             f"ice_runner/raspberry_pi/{cls.run_id}/log",json.dumps(MqttClient.run_logs))
         mes_info.wait_for_publish(timeout=5)
@@ -88,8 +166,14 @@ class MqttClient:
 
     @classmethod
     def publish_stop_reason(cls, reason: str) -> None:
-        """The function should be called anytime the runner changes its state to STOPPED"""
+        """The function should be called anytime the runner changes its state to STOPPED.
+            The summary of the run is published before the stop reason once, the runner
+            stopped without starting the engine has no run to summarize"""
         logging.info("PUBLISH\t-\tstop reason: %s", reason)
+        if cls.run_summary is not None and cls.run_summary.get_active_time() > 0:
+            cls.client.publish(f"ice_runner/raspberry_pi/{cls.run_id}/run_summary",
+                               json.dumps(cls.run_summary.to_dict()))
+            cls.run_summary.reset()
         mes_info:MQTTMessageInfo = cls.client.publish(
                                 f"ice_runner/raspberry_pi/{cls.run_id}/stop_reason", reason)
         mes_info.wait_for_publish(timeout=5)
@@ -4,6 +4,7 @@
 # Copyright (c) 2024 Anastasiia Stepanova.
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
+import json
 import time
 import logging
 
@@ -71,11 +72,39 @@ def handle_who_alive(client, userdata, message):
     logging.info("RECEIVED\t-\tWHO ALIVE")
     MqttClient.publish_state(MqttClient.state)
 
+def handle_heartbeat(client, userdata, message):
+    """Handler of the heartbeat broadcasted by the server. RPi replies with its sequence number"""
+    del userdata, client
+    logging.debug("RECEIVED\t-\theartbeat")
+    MqttClient.last_message_receive_time = time.time()
+    MqttClient.publish_heartbeat(message.payload.decode())
+
+def handle_log_ack(client, userdata, message):
+    """Handler of the server acknowledgement of the log file transfer"""
+    del userdata, client
+    transfer_id = message.topic.split("/")[-2]
+    logging.debug("RECEIVED\t-\tlog transfer %s ack", transfer_id)
+    if MqttClient.log_uploader is not None:
+        MqttClient.log_uploader.on_ack(transfer_id, json.loads(message.payload.decode()))
+
+def handle_tail(client, userdata, message):
+    """Handler of the request to read the tail of the current run log file"""
+    del userdata, client
+    logging.debug("RECEIVED\t-\ttail request")
+    if MqttClient.tail_service is not None:
+        MqttClient.tail_service.on_request(json.loads(message.payload.decode()))
+
 def add_handlers() -> None:
     """The function adds handlers to the MQTT client"""
     MqttClient.client.message_callback_add(
         f"ice_runner/server/rp_commander/{MqttClient.run_id}/command", handle_command)
     MqttClient.client.message_callback_add(
         "ice_runner/server/rp_commander/who_alive", handle_who_alive)
+    MqttClient.client.message_callback_add(
+        "ice_runner/server/rp_commander/heartbeat", handle_heartbeat)
     MqttClient.client.message_callback_add(
         f"ice_runner/server/rp_commander/{MqttClient.run_id}/change_config/#", handle_change_config)
+    MqttClient.client.message_callback_add(
+        f"ice_runner/server/rp_commander/{MqttClient.run_id}/log_transfer/+/ack", handle_log_ack)
+    MqttClient.client.message_callback_add(
+        f"ice_runner/server/rp_commander/{MqttClient.run_id}/tail", handle_tail)
@@ -0,0 +1,163 @@
+"""The module defines history of the engines built from the summaries of their runs"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import math
+import sqlite3
+from typing import Any, Dict, List
+
+ACTIVE_STATES = ("STARTING", "RUNNING")
+BASELINE_RUNS = 5 # first runs of the engine, the later runs are compared with them
+MIN_BASELINE_RUNS = 3
+DRIFT_SIGMAS = 3
+THROTTLE_TOLERANCE = 5 # %, the temperature is compared with runs at the same gas throttle
+# metric of the run: the smallest drift flagged, relative to the baseline mean
+DRIFT_METRICS: Dict[str, float] = {
+    "starter_engagements":  0.5,
+    "max_temperature":      0.02,
+    "max_vibration":        0.2,
+    "rpm_instability":      0.2,
+}
+RUN_COLUMNS = ["duration", "active_time", "starter_engagements", "start_attempts",
+               "max_temperature", "max_vibration", "rpm_mean", "rpm_instability",
+               "throttle_mean"]
+
+def get_run_metrics(summary: Dict[str, Any]) -> Dict[str, float | None]:
+    """The function returns metrics of the run from the summary of the Raspberry Pi,
+        metrics of the channels which were not received are None"""
+    channels = summary.get("channels", {})
+    def get(channel: str, key: str) -> float | None:
+        if channels.get(channel, {}).get("count", 0) == 0:
+            return None
+        return channels[channel][key]
+    rpm_mean = get("rpm", "mean")
+    rpm_std = get("rpm", "std")
+    return {
+        "duration": summary.get("duration", 0),
+        "active_time": sum(summary.get("state_time", {}).get(state, 0)
+                           for state in ACTIVE_STATES),
+        "starter_engagements": summary.get("starter_engagements", 0),
+        "start_attempts": summary.get("start_attempts", 0),
+        "max_temperature": get("temp", "max"),
+        "max_vibration": get("vibration", "max"),
+        "rpm_mean": rpm_mean,
+        "rpm_instability": rpm_std / rpm_mean if rpm_mean and rpm_std is not None else None,
+        "throttle_mean": get("gas_throttle", "mean"),
+    }
+
+class EngineHistory:
+    """The class keeps the history of every engine in SQLite database: a row per run
+        clustered by engine and time, so the runs of the engine in the time range are read
+        by one index range scan, and the totals of the engine updated with every run.
+        The engine is identified by the runner it is mounted on. A new run is compared
+        with the first BASELINE_RUNS runs of the engine to find drifting metrics"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"""CREATE TABLE IF NOT EXISTS runs (
+                                    engine INTEGER NOT NULL,
+                                    time REAL NOT NULL,
+                                    {", ".join(f"{column} REAL" for column in RUN_COLUMNS)},
+                                    PRIMARY KEY (engine, time)
+                                ) WITHOUT ROWID""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS engines (
+                                    engine INTEGER PRIMARY KEY,
+                                    runs INTEGER NOT NULL,
+                                    active_time REAL NOT NULL,
+                                    engaged_time REAL,
+                                    starter_engagements INTEGER NOT NULL,
+                                    start_attempts INTEGER NOT NULL,
+                                    max_temperature REAL,
+                                    max_vibration REAL
+                                )""")
+        self.connection.commit()
+
+    def add_run(self, engine: int, end_time: float,
+                summary: Dict[str, Any]) -> Dict[str, Any] | None:
+        """The function appends the run to the history of the engine and returns the totals
+            of the engine with the drifts of the run. The summary of the runner stopped
+            without the engine starting is not a run, it is skipped and None is returned"""
+        metrics = get_run_metrics(summary)
+        if metrics["active_time"] <= 0:
+            return None
+        baseline = self.get_runs(engine, limit=BASELINE_RUNS)
+        with self.connection:
+            self.connection.execute(
+                f"""INSERT OR REPLACE INTO runs (engine, time, {", ".join(RUN_COLUMNS)})
+                    VALUES (?, ?, {", ".join("?" for _ in RUN_COLUMNS)})""",
+                [engine, end_time] + [metrics[column] for column in RUN_COLUMNS])
+            self.connection.execute(
+                """INSERT INTO engines (engine, runs, active_time, engaged_time,
+                                        starter_engagements, start_attempts,
+                                        max_temperature, max_vibration)
+                   VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (engine) DO UPDATE SET
+                        runs = runs + 1,
+                        active_time = active_time + excluded.active_time,
+                        engaged_time = COALESCE(excluded.engaged_time, engaged_time),
+                        starter_engagements = starter_engagements + excluded.starter_engagements,
+                        start_attempts = start_attempts + excluded.start_attempts,
+                        max_temperature = MAX(COALESCE(max_temperature, excluded.max_temperature),
+                                              COALESCE(excluded.max_temperature, max_temperature)),
+                        max_vibration = MAX(COALESCE(max_vibration, excluded.max_vibration),
+                                            COALESCE(excluded.max_vibration, max_vibration))""",
+                (engine, metrics["active_time"], summary.get("engaged_time"),
+                 metrics["starter_engagements"], metrics["start_attempts"],
+                 metrics["max_temperature"], metrics["max_vibration"]))
+        history = self.get_engine(engine)
+        history["drifts"] = get_drifts(metrics, baseline)
+        return history
+
+    def get_engine(self, engine: int) -> Dict[str, Any]:
+        """The function returns the totals of the engine, engaged hours are reported
+            by the engine or counted by the runs of the history"""
+        row = self.connection.execute("SELECT * FROM engines WHERE engine = ?",
+                                      (engine,)).fetchone()
+        if row is None:
+            return {"engine": engine, "runs": 0}
+        history = dict(row)
+        engaged_time = history["engaged_time"] or history["active_time"]
+        history["engaged_hours"] = engaged_time / 60 / 60
+        history["start_attempts_per_run"] = history["start_attempts"] / history["runs"]
+        return history
+
+    def get_runs(self, engine: int, start: float = 0, end: float = math.inf,
+                 limit: int = -1) -> List[Dict[str, Any]]:
+        """The function returns the runs of the engine finished in the time range"""
+        cursor = self.connection.execute(
+            """SELECT * FROM runs WHERE engine = ? AND time BETWEEN ? AND ?
+               ORDER BY time LIMIT ?""", (engine, start, end, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        """The function closes the database"""
+        self.connection.close()
+
+def get_drifts(metrics: Dict[str, float | None],
+               baseline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The function returns the metrics of the run exceeding the mean of the baseline runs
+        by more than DRIFT_SIGMAS deviations and the minimal relative drift. The temperature
+        is compared only with the baseline runs at the same gas throttle"""
+    drifts = []
+    for name, min_drift in DRIFT_METRICS.items():
+        value = metrics[name]
+        if value is None:
+            continue
+        runs = baseline
+        if name == "max_temperature" and metrics["throttle_mean"] is not None:
+            runs = [run for run in baseline if run["throttle_mean"] is not None and
+                    abs(run["throttle_mean"] - metrics["throttle_mean"]) <= THROTTLE_TOLERANCE]
+        values = [run[name] for run in runs if run[name] is not None]
+        if len(values) < MIN_BASELINE_RUNS:
+            continue
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((item - mean) ** 2 for item in values) / (len(values) - 1))
+        limit = mean + max(DRIFT_SIGMAS * std, min_drift * abs(mean))
+        if value > limit:
+            drifts.append({"metric": name, "value": value, "baseline": mean, "limit": limit})
+    return drifts
@@ -0,0 +1,106 @@
+"""The module defines the table of last known states of all Raspberry Pis"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+from typing import Any, Dict, List, Set
+from common.algorithms import get_config_hash
+
+FLEET_METRICS = ("RPM", "TEMP", "FUEL level", "Time left")
+
+class RunnerRecord:
+    """The class stores last known state of the Raspberry Pi"""
+    def __init__(self, rp_id: int) -> None:
+        self.rp_id = rp_id
+        self.state: int | None = None
+        self.status: Dict[str, Any] | None = None
+        self.config_hash: str | None = None
+        self.online: bool = False
+        self.timestamp: float = 0
+
+    def to_dict(self, crnt_time: float | None = None) -> Dict[str, Any]:
+        """The function returns the full record, the age of the record is added
+            if the current time is specified"""
+        record = {"id": self.rp_id,
+                  "state": self.state,
+                  "status": self.status,
+                  "config_hash": self.config_hash,
+                  "online": self.online,
+                  "timestamp": self.timestamp}
+        if crnt_time is not None:
+            record["age"] = round(crnt_time - self.timestamp, 1)
+        return record
+
+    def to_fleet_dict(self, crnt_time: float) -> Dict[str, Any]:
+        """The function returns compact record with key metrics and age of the record"""
+        metrics = {}
+        if self.status is not None:
+            metrics = {name: self.status[name] for name in FLEET_METRICS if name in self.status}
+        return {"state": self.state,
+                "online": self.online,
+                "config_hash": self.config_hash,
+                "age": round(crnt_time - self.timestamp, 1),
+                "metrics": metrics}
+
+class FleetTable:
+    """The class stores records of all Raspberry Pis ever connected to the server.
+        Update functions return True if the record was changed and mark it dirty until
+        the next publish, so any number of updates between publishes is coalesced.
+        Timestamp of the record is the time of the last received change,
+        so the age shows staleness of the record"""
+    def __init__(self) -> None:
+        self.records: Dict[int, RunnerRecord] = {}
+        self.dirty: Set[int] = set()
+
+    def get(self, rp_id: int) -> RunnerRecord:
+        """The function returns the record of the Raspberry Pi, creates it if needed"""
+        if rp_id not in self.records:
+            self.records[rp_id] = RunnerRecord(rp_id)
+        return self.records[rp_id]
+
+    def update_state(self, rp_id: int, state: int, crnt_time: float) -> bool:
+        record = self.get(rp_id)
+        if record.state == state:
+            return False
+        record.state = state
+        record.timestamp = crnt_time
+        self.dirty.add(rp_id)
+        return True
+
+    def update_status(self, rp_id: int, status: Dict[str, Any], crnt_time: float) -> bool:
+        record = self.get(rp_id)
+        record.status = status
+        record.timestamp = crnt_time
+        self.dirty.add(rp_id)
+        return True
+
+    def update_configuration(self, rp_id: int, configuration: str, crnt_time: float) -> bool:
+        record = self.get(rp_id)
+        config_hash = get_config_hash(configuration)
+        if record.config_hash == config_hash:
+            return False
+        record.config_hash = config_hash
+        record.timestamp = crnt_time
+        self.dirty.add(rp_id)
+        return True
+
+    def set_online(self, rp_id: int, online: bool) -> bool:
+        record = self.get(rp_id)
+        if record.online == online:
+            return False
+        record.online = online
+        self.dirty.add(rp_id)
+        return True
+
+    def pop_dirty(self) -> List[int]:
+        """The function returns ids of records changed since the last call"""
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        return dirty
+
+    def get_fleet(self, crnt_time: float) -> Dict[str, Any]:
+        """The function returns compact snapshot of all records"""
+        return {"timestamp": crnt_time,
+                "runners": {rp_id: record.to_fleet_dict(crnt_time)
+                            for rp_id, record in self.records.items()}}
@@ -0,0 +1,53 @@
+"""The module defines liveness tracker of the Raspberry Pis connected to the server"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import heapq
+from typing import Dict, List, Tuple
+
+HEARTBEAT_PERIOD = 1 # sec
+LIVENESS_TIMEOUT = 3.5 # sec, three missed heartbeats
+
+class LivenessTracker:
+    """The class tracks runners liveness with min-heap of their deadlines.
+        Every heartbeat pushes the new deadline of the runner, deadlines replaced
+        by later ones stay in the heap and are skipped when popped,
+        so both heartbeat and expiration cost O(log n)"""
+    def __init__(self, timeout: float = LIVENESS_TIMEOUT) -> None:
+        self.timeout = timeout
+        self.deadlines: Dict[int, float] = {}
+        self.last_seq: Dict[int, int] = {}
+        self.heap: List[Tuple[float, int]] = []
+
+    def touch(self, runner_id: int, crnt_time: float, seq: int | None = None) -> bool:
+        """The function prolongs the runner deadline, returns True if the runner
+            was offline before"""
+        if seq is not None:
+            if seq < self.last_seq.get(runner_id, -1):
+                return False
+            self.last_seq[runner_id] = seq
+        became_online = runner_id not in self.deadlines
+        deadline = crnt_time + self.timeout
+        self.deadlines[runner_id] = deadline
+        heapq.heappush(self.heap, (deadline, runner_id))
+        return became_online
+
+    def expire(self, crnt_time: float) -> List[int]:
+        """The function returns runners which missed their deadlines and marks them offline"""
+        offline = []
+        while self.heap and self.heap[0][0] <= crnt_time:
+            deadline, runner_id = heapq.heappop(self.heap)
+            if self.deadlines.get(runner_id) == deadline:
+                del self.deadlines[runner_id]
+                offline.append(runner_id)
+        return offline
+
+    def is_online(self, runner_id: int) -> bool:
+        """The function checks if the runner has not missed its deadline"""
+        return runner_id in self.deadlines
+
+    def get_online(self) -> List[int]:
+        """The function returns ids of all online runners"""
+        return list(self.deadlines.keys())
@@ -0,0 +1,174 @@
+"""The module defines receiver of log files transferred by Raspberry Pis"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Tuple
+from common.log_transfer import CHUNK_SIZE, LOG_WINDOW, get_file_sha256, unpack_chunk
+
+MAX_COMPLETED_BUNDLES = 1000 # completed bundles remembered to answer repeated offers
+
+class Transfer:
+    """The class stores state of the single file transfer"""
+    def __init__(self, rp_id: int, transfer_id: str, offer: Dict[str, Any], path: str) -> None:
+        self.rp_id = rp_id
+        self.transfer_id = transfer_id
+        self.name: str = offer["name"]
+        self.size: int = offer["size"]
+        self.sha256: str = offer["sha256"]
+        self.bundle: str = offer["bundle"]
+        self.path = path
+        self.part_path = path + ".part"
+        self.offset: int = 0
+        self.hasher = hashlib.sha256()
+        self.done = False
+        self.file: BinaryIO | None = None
+
+    def close(self) -> None:
+        """The function closes the .part file kept open while the chunks are received"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class LogReceiver:
+    """The class assembles offered files from chunks in the storage directory.
+        Data is appended to the .part file only at its current end, so the size of the
+        .part file is the offset the transfer is resumed from. Completed files are
+        renamed and grouped in bundles, the bundle is completed with its last file.
+        The .part file is kept open for the whole transfer. Transfers of the completed
+        bundle are forgotten, repeated offers of its files are answered from the disk.
+        The functions do blocking file I/O, the server calls them from its log worker
+        thread"""
+    def __init__(self, storage_dir: str, window: int = LOG_WINDOW) -> None:
+        self.storage_dir = storage_dir
+        self.window = window
+        self.transfers: Dict[Tuple[int, str], Transfer] = {}
+        self.bundles: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self.completed: List[Tuple[int, Dict[str, str]]] = []
+        self.completed_bundles: OrderedDict[Tuple[int, str], None] = OrderedDict()
+
+    def get_ack(self, transfer: Transfer) -> Dict[str, Any]:
+        """The function returns acknowledgement of the transfer"""
+        return {"offset": transfer.offset, "window": self.window, "done": transfer.done}
+
+    def offer(self, rp_id: int, transfer_id: str, offer: Dict[str, Any]) -> Dict[str, Any]:
+        """The function starts or resumes the transfer of the offered file"""
+        directory = os.path.join(self.storage_dir, str(rp_id))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(offer["file"]))
+        transfer = self.transfers.get((rp_id, transfer_id))
+        if transfer is None and (rp_id, offer["bundle"]) in self.completed_bundles:
+            # the acknowledgement of the last chunk was lost, the file is already stored
+            transfer = Transfer(rp_id, transfer_id, offer, path)
+            if self.is_stored(transfer):
+                transfer.offset = transfer.size
+                transfer.done = True
+                return self.get_ack(transfer)
+        if transfer is None or transfer.sha256 != offer["sha256"]:
+            if transfer is not None:
+                transfer.close()
+            transfer = Transfer(rp_id, transfer_id, offer, path)
+            self.transfers[(rp_id, transfer_id)] = transfer
+            self.resume(transfer)
+            if not transfer.done and transfer.offset == transfer.size:
+                self.finish(transfer)
+        else:
+            transfer.bundle = offer["bundle"]
+            transfer.name = offer["name"]
+        bundle = self.bundles.setdefault((rp_id, offer["bundle"]),
+                                         {"size": offer["bundle_size"], "files": {}})
+        bundle["files"][transfer.name] = transfer
+        if transfer.done:
+            self.check_bundle(rp_id, transfer.bundle)
+        return self.get_ack(transfer)
+
+    def is_stored(self, transfer: Transfer) -> bool:
+        """The function checks if the file of the transfer is already received"""
+        return os.path.exists(transfer.path) and \
+            os.path.getsize(transfer.path) == transfer.size and \
+            get_file_sha256(transfer.path, transfer.size) == transfer.sha256
+
+    def resume(self, transfer: Transfer) -> None:
+        """The function restores the transfer from the files stored before"""
+        if self.is_stored(transfer):
+            transfer.offset = transfer.size
+            transfer.done = True
+            return
+        if os.path.exists(transfer.part_path):
+            with open(transfer.part_path, "rb+") as file:
+                if os.path.getsize(transfer.part_path) > transfer.size:
+                    file.truncate(0)
+                while data := file.read(CHUNK_SIZE):
+                    transfer.hasher.update(data)
+                    transfer.offset += len(data)
+            logging.info("Resumed\t| %s from %d", transfer.path, transfer.offset)
+        transfer.file = open(transfer.part_path, "ab")
+
+    def chunk(self, rp_id: int, transfer_id: str, payload: bytes) -> Dict[str, Any] | None:
+        """The function appends the chunk if it starts at the current end of the file,
+            returns acknowledgement or None if the transfer is unknown"""
+        transfer = self.transfers.get((rp_id, transfer_id))
+        if transfer is None:
+            return None
+        try:
+            offset, data = unpack_chunk(payload)
+        except ValueError as e:
+            logging.warning("Dropped\t| %s: %s", transfer.path, e)
+            return self.get_ack(transfer)
+        if transfer.done or offset != transfer.offset:
+            return self.get_ack(transfer)
+        data = data[:transfer.size - transfer.offset]
+        transfer.file.write(data)
+        # the acknowledged offset is on disk, so the transfer is resumed from it
+        transfer.file.flush()
+        transfer.hasher.update(data)
+        transfer.offset += len(data)
+        if transfer.offset == transfer.size:
+            self.finish(transfer)
+        return self.get_ack(transfer)
+
+    def finish(self, transfer: Transfer) -> None:
+        """The function checks sha256 of the received file, the transfer
+            is started again if the file is broken"""
+        transfer.close()
+        if transfer.hasher.hexdigest() != transfer.sha256:
+            logging.error("Broken\t| %s sha256 mismatch, restarting", transfer.path)
+            transfer.file = open(transfer.part_path, "wb")
+            transfer.offset = 0
+            transfer.hasher = hashlib.sha256()
+            return
+        os.replace(transfer.part_path, transfer.path)
+        transfer.done = True
+        logging.info("Received\t| %s", transfer.path)
+        self.check_bundle(transfer.rp_id, transfer.bundle)
+
+    def check_bundle(self, rp_id: int, bundle_id: str) -> None:
+        """The function completes the bundle if all its files are received"""
+        bundle = self.bundles.get((rp_id, bundle_id))
+        if bundle is None or len(bundle["files"]) < bundle["size"]:
+            return
+        if not all(transfer.done for transfer in bundle["files"].values()):
+            return
+        self.bundles.pop((rp_id, bundle_id))
+        for transfer in bundle["files"].values():
+            self.transfers.pop((rp_id, transfer.transfer_id), None)
+        self.completed_bundles[(rp_id, bundle_id)] = None
+        if len(self.completed_bundles) > MAX_COMPLETED_BUNDLES:
+            self.completed_bundles.popitem(last=False)
+        self.completed.append((rp_id, {name: transfer.path
+                                       for name, transfer in bundle["files"].items()}))
+
+    def close(self) -> None:
+        """The function closes files of the unfinished transfers"""
+        for transfer in self.transfers.values():
+            transfer.close()
+
+    def pop_completed(self) -> List[Tuple[int, Dict[str, str]]]:
+        """The function returns logs of bundles completed since the last call"""
+        completed, self.completed = self.completed, []
+        return completed
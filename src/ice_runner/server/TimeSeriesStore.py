@@ -0,0 +1,134 @@
+"""The module defines embedded time-series store of Raspberry Pis telemetry"""
+
+# This software is distributed under the terms of the MIT License.
+# Copyright (c) 2024 Anastasiia Stepanova.
+# Author: Anastasiia Stepanova <asiiapine@gmail.com>
+
+import sqlite3
+import threading
+from typing import Any, Dict, List, Tuple
+from common.algorithms import is_float
+
+RAW_RESOLUTION = 0
+# sec, resolution of the series: retention of its buckets
+RETENTION: Dict[int, float] = {RAW_RESOLUTION: 60 * 60,
+                               1: 24 * 60 * 60,
+                               10: 7 * 24 * 60 * 60,
+                               60: 90 * 24 * 60 * 60}
+RAW_PERIOD = 0.5 # sec, the shortest report period of the runners
+MAX_QUERY_POINTS = 1000
+
+def get_numeric_fields(message: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """The function flattens dronecan message dictionary to channels with numeric values"""
+    fields = {}
+    items = message.items() if isinstance(message, dict) else enumerate(message)
+    for name, value in items:
+        channel = f"{prefix}.{name}" if prefix else str(name)
+        if isinstance(value, (dict, list)):
+            fields.update(get_numeric_fields(value, channel))
+        elif not isinstance(value, bool) and is_float(value):
+            fields[channel] = float(value)
+    return fields
+
+class TimeSeriesStore:
+    """The class stores samples of runners channels in SQLite database in WAL mode.
+        Every sample is written as raw point and merged into 1 sec, 10 sec and 1 min buckets,
+        rows are clustered by runner and channel, so range queries read continuous pages.
+        Samples are added from the event loop and written in batches by flush,
+        which is expected to be called from single worker thread"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.pending: List[Tuple[int, str, float, float]] = []
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS samples (
+                                    runner INTEGER NOT NULL,
+                                    channel TEXT NOT NULL,
+                                    resolution INTEGER NOT NULL,
+                                    bucket REAL NOT NULL,
+                                    count INTEGER NOT NULL,
+                                    sum REAL NOT NULL,
+                                    min REAL NOT NULL,
+                                    max REAL NOT NULL,
+                                    last REAL NOT NULL,
+                                    PRIMARY KEY (runner, channel, resolution, bucket)
+                                ) WITHOUT ROWID""")
+        self.connection.commit()
+
+    def add(self, runner_id: int, channel: str, timestamp: float, value: float) -> None:
+        """The function adds sample to the batch waiting for flush"""
+        with self.lock:
+            self.pending.append((runner_id, channel, timestamp, value))
+
+    def add_message(self, runner_id: int, message_type: str,
+                    message: Dict[str, Any], timestamp: float) -> None:
+        """The function adds all numeric fields of the dronecan message as separate channels"""
+        for field, value in get_numeric_fields(message).items():
+            self.add(runner_id, f"{message_type}.{field}", timestamp, value)
+
+    def flush(self) -> int:
+        """The function writes pending samples with all rollups in single transaction,
+            returns number of written samples"""
+        with self.lock:
+            samples, self.pending = self.pending, []
+        if not samples:
+            return 0
+        rows = []
+        for runner_id, channel, timestamp, value in samples:
+            for resolution in RETENTION:
+                bucket = timestamp if resolution == RAW_RESOLUTION\
+                                   else timestamp - timestamp % resolution
+                rows.append((runner_id, channel, resolution, bucket,
+                             value, value, value, value))
+        with self.connection:
+            self.connection.executemany(
+                """INSERT INTO samples (runner, channel, resolution, bucket,
+                                        count, sum, min, max, last)
+                   VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+                   ON CONFLICT (runner, channel, resolution, bucket) DO UPDATE SET
+                        count = count + 1,
+                        sum = sum + excluded.sum,
+                        min = MIN(min, excluded.min),
+                        max = MAX(max, excluded.max),
+                        last = excluded.last""", rows)
+        return len(samples)
+
+    def prune(self, crnt_time: float) -> None:
+        """The function removes buckets older than retention of their resolution"""
+        with self.connection:
+            for resolution, retention in RETENTION.items():
+                self.connection.execute(
+                    "DELETE FROM samples WHERE resolution = ? AND bucket < ?",
+                    (resolution, crnt_time - retention))
+
+    def choose_resolution(self, start: float, end: float, crnt_time: float) -> int:
+        """The function returns the finest resolution which still keeps the start of
+            the range and gives no more than MAX_QUERY_POINTS buckets"""
+        for resolution, retention in RETENTION.items():
+            if crnt_time - retention > start:
+                continue
+            if (end - start) / max(resolution, RAW_PERIOD) <= MAX_QUERY_POINTS:
+                return resolution
+        return max(RETENTION)
+
+    def query(self, runner_id: int, channel: str, start: float, end: float,
+              resolution: int) -> List[List[float]]:
+        """The function returns [time, mean, min, max, last] points of the channel in range"""
+        cursor = self.connection.execute(
+            """SELECT bucket, sum / count, min, max, last FROM samples
+               WHERE runner = ? AND channel = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+               ORDER BY bucket""", (runner_id, channel, resolution, start, end))
+        return [list(row) for row in cursor.fetchall()]
+
+    def get_channels(self, runner_id: int) -> List[str]:
+        """The function returns names of all stored channels of the runner"""
+        cursor = self.connection.execute(
+            "SELECT DISTINCT channel FROM samples WHERE runner = ? AND resolution = ?",
+            (runner_id, max(RETENTION)))
+        return [row[0] for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        """The function closes the database"""
+        self.connection.close()
@@ -7,50 +7,66 @@
 
 import asyncio
 import os
-import time
 import logging
 
 import argparse
 from dotenv import load_dotenv
 from server.mqtt.handlers import ServerMqttClient
+from server.mqtt.client import FLEET_PERIOD
+from server.LivenessTracker import HEARTBEAT_PERIOD
 from common import logging_configurator
 
-last_keep_alive = 0
-async def ping_rpis() -> None:
-    """The function sends ping messages to all Raspberry Pis"""
-    global last_keep_alive
-    if time.time() - last_keep_alive > 0.5:
-        for i in ServerMqttClient.rp_status:
-            ServerMqttClient.client.publish(
-                                f"ice_runner/server/rp_commander/{i}/command", "keep alive")
-        last_keep_alive = time.time()
-
-async def main() -> None:
+async def send_heartbeats() -> None:
+    """The function broadcasts heartbeat to all Raspberry Pis and marks
+        the ones which stopped replying offline"""
+    while True:
+        ServerMqttClient.publish_heartbeat()
+        ServerMqttClient.check_liveness()
+        await asyncio.sleep(HEARTBEAT_PERIOD)
+
+async def main(fleet_period: float = FLEET_PERIOD, tsdb_path: str | None = None,
+               log_storage: str | None = None, history_path: str | None = None) -> None:
     """The function starts the server"""
     os.environ.clear()
     load_dotenv()
     server_ip = os.getenv("SERVER_IP")
     server_port = int(os.getenv("SERVER_PORT"))
-    ServerMqttClient.connect(server_ip, server_port)
-    await ServerMqttClient.start()
+    await ServerMqttClient.start(server_ip, server_port, fleet_period, tsdb_path,
+                                 log_storage, history_path)
     logging.info("Started")
 
-    while True:
-        try:
-            await ping_rpis()
-            await asyncio.sleep(1)
-        except RuntimeError as e:
-            logging.error(e)
-            ServerMqttClient.connect(server_ip, server_port)
-            await ServerMqttClient.start()
-            logging.info("Reconnected")
+    try:
+        await send_heartbeats()
+    finally:
+        ServerMqttClient.stop()
 
 def start(log_dir: str, args: list['str'] = None) -> None:
     parser = argparse.ArgumentParser()
-    # Should just trip on non-empty arg and do nothing otherwise
-    parser.parse_args(args)
+    parser.add_argument("--fleet_period", type=float, default=FLEET_PERIOD,
+                        help="Period of the fleet snapshot publishing to the bot, sec")
+    parser.add_argument("--tsdb", default=None,
+                        help="Path of the telemetry time-series database, "
+                             "by default it is stored in the server log directory")
+    parser.add_argument("--no_tsdb", action="store_true",
+                        help="Do not store telemetry history")
+    parser.add_argument("--log_storage", default=None,
+                        help="Directory for log files uploaded by Raspberry Pis, "
+                             "by default it is in the server log directory")
+    parser.add_argument("--engine_history", default=None,
+                        help="Path of the engine history database, "
+                             "by default it is stored in the server log directory")
+    parsed = parser.parse_args(args)
     logging_configurator.get_logger(__file__, log_dir)
-    asyncio.run(main())
+    tsdb_path = parsed.tsdb
+    if tsdb_path is None and not parsed.no_tsdb:
+        tsdb_path = os.path.join(log_dir, "server", "timeseries.sqlite")
+    log_storage = parsed.log_storage
+    if log_storage is None:
+        log_storage = os.path.join(log_dir, "server", "runner_logs")
+    history_path = parsed.engine_history
+    if history_path is None:
+        history_path = os.path.join(log_dir, "server", "engine_history.sqlite")
+    asyncio.run(main(parsed.fleet_period, tsdb_path, log_storage, history_path))
 
 if __name__ == "__main__":
     start(os.getcwd())
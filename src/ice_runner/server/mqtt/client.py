@@ -4,69 +4,160 @@
 # Copyright (c) 2024 Anastasiia Stepanova.
 # Author: Anastasiia Stepanova <asiiapine@gmail.com>
 
+import asyncio
+import json
 import logging
-from typing import Any, Dict
-from paho.mqtt.client import MQTTv311, Client
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict, List, Set, Tuple
+from paho.mqtt.client import MQTTv311, Client, MQTTMessage, topic_matches_sub
+from paho.mqtt.enums import CallbackAPIVersion
+from common.mqtt_asyncio import AsyncioHelper
+from server.LivenessTracker import LivenessTracker
+from server.FleetTable import FleetTable
+from server.EngineHistory import EngineHistory
+from server.TimeSeriesStore import TimeSeriesStore
+from server.LogReceiver import LogReceiver
 
-def on_disconnect(client: Client, userdata: Any, rc: int) -> None:
+KEEPALIVE = 60 # sec
+ROUTE_QUEUE_SIZE = 100
+STATS_PERIOD = 10 # sec
+FLEET_PERIOD = 1 # sec
+TSDB_FLUSH_PERIOD = 1 # sec
+TSDB_PRUNE_PERIOD = 60 # sec
+REQUEST_TIMEOUT = 10 # sec, bot requests without reply are forgotten
+MIN_RECONNECT_DELAY = 1 # sec
+MAX_RECONNECT_DELAY = 30 # sec
+
+class Route:
+    """The class binds topic filter to its handler. Received messages wait for the handler
+        in bounded queue, when the queue is full the oldest message is dropped"""
+    def __init__(self, topic_filter: str, handler: Callable, maxsize: int) -> None:
+        self.topic_filter = topic_filter
+        self.handler = handler
+        self.maxsize = maxsize
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.handled: int = 0
+        self.dropped: int = 0
+        self.max_depth: int = 0
+        self.total_latency: float = 0
+        self.max_latency: float = 0
+        self.max_wait: float = 0
+
+    def start(self, client: Client) -> None:
+        """The function creates the queue and the worker processing it"""
+        self.queue = asyncio.Queue(self.maxsize)
+        self.task = asyncio.create_task(self.work(client))
+
+    def put(self, msg: MQTTMessage) -> None:
+        """The function puts message to the queue, drops the oldest one if the queue is full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            logging.warning("Dropped\t| %s queue is full", self.topic_filter)
+        self.queue.put_nowait((time.time(), msg))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def work(self, client: Client) -> None:
+        """The function calls the handler for every message from the queue"""
+        while True:
+            receive_time, msg = await self.queue.get()
+            start_time = time.time()
+            try:
+                self.handler(client, None, msg)
+            except Exception as e:
+                logging.error(f"{msg.topic}: {e}\n{traceback.format_exc()}")
+            latency = time.time() - start_time
+            self.handled += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.max_wait = max(self.max_wait, start_time - receive_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """The function returns route statistics, maximums are reset after each call"""
+        stats = {"handled": self.handled,
+                 "dropped": self.dropped,
+                 "depth": self.queue.qsize() if self.queue is not None else 0,
+                 "max_depth": self.max_depth,
+                 "mean_latency": self.total_latency / self.handled if self.handled else 0,
+                 "max_latency": self.max_latency,
+                 "max_wait": self.max_wait}
+        self.max_depth = 0
+        self.max_latency = 0
+        self.max_wait = 0
+        return stats
+
+def on_connect(client: Client, userdata: Any, flags, reason_code, properties) -> None:
+    """The callback subscribes to the topics and sends ready message
+        to both raspberry pi and bot"""
+    del userdata, flags, properties
+    if reason_code.is_failure:
+        logging.error("Connection refused: %s", reason_code)
+        return
+    ServerMqttClient.reconnect_delay = MIN_RECONNECT_DELAY
+    client.subscribe("ice_runner/raspberry_pi/#")
+    client.subscribe("ice_runner/bot/#")
+    client.publish("ice_runner/server/raspberry_pi_commander", "ready")
+    client.publish("ice_runner/server/bot_commander", "ready")
+    logging.info("started server")
+
+def on_disconnect(client: Client, userdata: Any, flags, reason_code, properties) -> None:
     """The callback for mqtt client disconnection"""
-    del userdata, client
-    logging.error("Disconnected")
-    if rc != 0:
-        logging.error("Unexpected MQTT disconnection. Will auto-reconnect")
+    del userdata, client, flags, properties
+    logging.error("Disconnected: %s", reason_code)
+    ServerMqttClient.disconnected.set()
+
+def on_message(client: Client, userdata: Any, msg: MQTTMessage) -> None:
+    """The callback passes the message to the queues of all matching routes"""
+    del client, userdata
+    for route in ServerMqttClient.routes:
+        if topic_matches_sub(route.topic_filter, msg.topic):
+            route.put(msg)
 
 class ServerMqttClient:
-    """The class for server mqtt client"""
-    client: Client = Client(client_id="server",clean_session=False,
+    """The class for server mqtt client. Network traffic and message handlers
+        are processed in the asyncio event loop"""
+    client: Client = Client(callback_api_version=CallbackAPIVersion.VERSION2,
+                            client_id="server", clean_session=False,
                             userdata=None, protocol=MQTTv311, reconnect_on_failure=True)
     rp_messages: Dict[int, Dict[str, Dict[str, Any]]] = {}
-    rp_status: Dict[int, str] = {}
     rp_states: Dict[int, str] = {}
     rp_cur_setpoint: Dict[int, float] = {}
     rp_logs: Dict[int, Dict[str, str]] = {}
     rp_stop_reason: Dict[int, str] = {}
     rp_configuration: Dict[int, str] = {}
-    client.disconnect_callback = on_disconnect
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
     rp_full_configuration: Dict[int, Dict[str, Any]] = {}
+    routes: List[Route] = []
+    tasks: List[asyncio.Task] = []
+    disconnected: asyncio.Event
+    reconnect_delay: float = MIN_RECONNECT_DELAY
+    server_ip: str = "localhost"
+    port: int = 1883
+    liveness: LivenessTracker = LivenessTracker()
+    heartbeat_seq: int = 0
+    fleet: FleetTable = FleetTable()
+    fleet_period: float = FLEET_PERIOD
+    tsdb: TimeSeriesStore | None = None
+    tsdb_executor: ThreadPoolExecutor | None = None
+    log_receiver: LogReceiver | None = None
+    log_executor: ThreadPoolExecutor | None = None
+    history: EngineHistory | None = None
+    history_executor: ThreadPoolExecutor | None = None
+    background_tasks: Set[asyncio.Task] = set()
+    requests: Dict[Tuple[int, str], Dict[str, float]] = {}
 
     @classmethod
-    def connect(cls, server_ip: str = "localhost", port: int = 1883) -> None:
-        """The function connects to the server, sends ready message to both raspberry pi and bot"""
-        cls.client.connect(server_ip, port, 60)
-        cls.client.publish("ice_runner/server/raspberry_pi_commander", "ready")
-        cls.client.publish("ice_runner/server/bot_commander", "ready")
-
-        logging.info("started server")
-
-    @classmethod
-    def publish_rp_state(cls, rp_id: int) -> None:
-        """The function publishes the state of the Raspberry Pi to the bot"""
-        if rp_id not in cls.rp_status:
-            logging.debug(f"Published\t| Raspberry Pi %d is not connected ", rp_id)
-            return
-        if cls.rp_status[rp_id] is None:
-            logging.debug("Published\t| Raspberry Pi %d no state set", rp_id)
-            return
-        cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/state",
-                           cls.rp_states[rp_id])
-
-    @classmethod
-    def publish_rp_status(cls, rp_id: int) -> None:
-        """The function publishes the status of the Raspberry Pi to the bot"""
-        if rp_id not in cls.rp_status:
-            logging.debug("Published\t| Raspberry Pi is not connected")
-            return
-        status = cls.rp_status[rp_id]
-        cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/status", status)
-        logging.debug("Published\t| Raspberry Pi %d status", rp_id)
-        cls.rp_status[rp_id] = None
-
-    @classmethod
-    def publish_rp_states(cls) -> None:
-        """The function publishes state and status of all Raspberry Pis to the bot"""
-        for rp_id in cls.rp_status:
-            cls.publish_rp_state(rp_id)
-            cls.publish_rp_status(rp_id)
+    def route(cls, topic_filter: str, maxsize: int = ROUTE_QUEUE_SIZE) -> Callable:
+        """The decorator registers handler of messages matching the topic filter"""
+        def decorator(handler: Callable) -> Callable:
+            cls.routes.append(Route(topic_filter, handler, maxsize))
+            return handler
+        return decorator
 
     @classmethod
     def publish_full_configuration(cls, rp_id: int) -> None:
@@ -79,9 +170,253 @@ class ServerMqttClient:
                            str(cls.rp_full_configuration[rp_id]))
 
     @classmethod
-    async def start(cls) -> None:
-        """The function starts the server mqtt client and subscribes to the topics"""
+    def add_request(cls, rp_id: int, kind: str, req_id: str, crnt_time: float) -> None:
+        """The function stores id of the bot request waiting for the Raspberry Pi reply
+            of the kind, requests older than REQUEST_TIMEOUT are forgotten"""
+        pending = cls.requests.setdefault((rp_id, kind), {})
+        for old_id in [old_id for old_id, request_time in pending.items()
+                       if crnt_time - request_time > REQUEST_TIMEOUT]:
+            del pending[old_id]
+        pending[req_id] = crnt_time
+
+    @classmethod
+    def publish_replies(cls, rp_id: int, kind: str, data: Any) -> None:
+        """The function echoes ids of all bot requests waiting for the Raspberry Pi reply
+            of the kind together with the reply"""
+        for req_id in cls.requests.pop((rp_id, kind), {}):
+            cls.publish_reply(req_id, rp_id, data)
+
+    @classmethod
+    def publish_reply(cls, req_id: str, rp_id: int | None, data: Any) -> None:
+        """The function publishes reply to the bot request with its id"""
+        cls.client.publish(f"ice_runner/server/bot_commander/reply/{req_id}",
+                           json.dumps({"req_id": req_id, "rp_id": rp_id, "data": data}))
+        logging.debug("Published\t| Reply %s", req_id)
+
+    @classmethod
+    def publish_heartbeat(cls) -> None:
+        """The function broadcasts single sequenced heartbeat to all Raspberry Pis"""
+        cls.heartbeat_seq += 1
+        cls.client.publish("ice_runner/server/rp_commander/heartbeat", str(cls.heartbeat_seq))
+
+    @classmethod
+    def publish_liveness(cls, rp_id: int, online: bool) -> None:
+        """The function publishes online/offline transition of the Raspberry Pi to the bot"""
+        liveness = "online" if online else "offline"
+        logging.info("Published\t| Raspberry Pi %d %s", rp_id, liveness)
+        cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/liveness",
+                           liveness)
+        cls.fleet.set_online(rp_id, online)
+
+    @classmethod
+    def publish_snapshot(cls, rp_id: int) -> None:
+        """The function publishes retained last known state of the Raspberry Pi,
+            so any (re)subscribed bot receives the state of the whole fleet instantly"""
+        cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/snapshot",
+                           json.dumps(cls.fleet.get(rp_id).to_dict(time.time())), retain=True)
+        logging.debug("Published\t| Raspberry Pi %d snapshot", rp_id)
+
+    @classmethod
+    def publish_fleet(cls) -> None:
+        """The function publishes snapshots of runners changed since the previous call
+            and retained compact snapshot of the whole fleet"""
+        for rp_id in cls.fleet.pop_dirty():
+            cls.publish_snapshot(rp_id)
+        cls.client.publish("ice_runner/server/bot_commander/fleet",
+                           json.dumps(cls.fleet.get_fleet(time.time())), retain=True)
+
+    @classmethod
+    async def report_fleet(cls) -> None:
+        """The function publishes the fleet snapshot with constant rate,
+            so the bot load does not depend on the runners reports rate"""
+        while True:
+            await asyncio.sleep(cls.fleet_period)
+            cls.publish_fleet()
+
+    @classmethod
+    def run_task(cls, coroutine: Coroutine) -> asyncio.Task:
+        """The function runs the coroutine started by a handler in the background,
+            the task is kept until it is done and its exception is logged"""
+        task = asyncio.create_task(coroutine)
+        cls.background_tasks.add(task)
+        task.add_done_callback(cls.on_task_done)
+        return task
+
+    @classmethod
+    def on_task_done(cls, task: asyncio.Task) -> None:
+        cls.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            exception = task.exception()
+            logging.error("Task failed: %s\n%s", exception,
+                          "".join(traceback.format_exception(exception)))
+
+    @classmethod
+    async def forward_run_summary(cls, rp_id: int, summary: Dict[str, Any]) -> None:
+        """The function adds the run to the history of the engine in its worker thread
+            and sends the summary with the totals and drifts of the engine to the bot.
+            Summaries without the engine running are not added to the history"""
+        if cls.history is not None:
+            loop = asyncio.get_running_loop()
+            history = await loop.run_in_executor(cls.history_executor, cls.history.add_run,
+                                                 rp_id, time.time(), summary)
+            if history is not None:
+                summary["history"] = history
+                for drift in history["drifts"]:
+                    logging.warning("Drift\t| Raspberry Pi %d %s %.2f, baseline %.2f", rp_id,
+                                    drift["metric"], drift["value"], drift["baseline"])
+        cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/run_summary",
+                           json.dumps(summary))
+
+    @classmethod
+    async def store_timeseries(cls) -> None:
+        """The function periodically writes collected samples to the time-series store
+            and removes outdated ones, database is accessed only from its worker thread"""
+        loop = asyncio.get_running_loop()
+        prev_prune_time = 0
+        while True:
+            await asyncio.sleep(TSDB_FLUSH_PERIOD)
+            await loop.run_in_executor(cls.tsdb_executor, cls.tsdb.flush)
+            if time.time() - prev_prune_time > TSDB_PRUNE_PERIOD:
+                prev_prune_time = time.time()
+                await loop.run_in_executor(cls.tsdb_executor, cls.tsdb.prune, prev_prune_time)
+
+    @classmethod
+    async def answer_query(cls, request: Dict[str, Any]) -> None:
+        """The function answers time-series query. The request contains req_id, rp_id and
+            channel, the range is set by start and end timestamps or by last seconds,
+            the resolution is chosen automatically if not specified. The error of the query
+            is sent in the reply, so the bot does not wait for it"""
+        req_id = request["req_id"]
+        reply: Dict[str, Any] = {"req_id": req_id}
+        if cls.tsdb is None:
+            reply["error"] = "time-series store is disabled"
+        else:
+            try:
+                rp_id = int(request["rp_id"])
+                crnt_time = time.time()
+                end = request.get("end", crnt_time)
+                start = request.get("start", end - request.get("last", 60 * 60))
+                resolution = request.get("resolution",
+                                         cls.tsdb.choose_resolution(start, end, crnt_time))
+                loop = asyncio.get_running_loop()
+                if "channel" not in request:
+                    reply["channels"] = await loop.run_in_executor(
+                                                cls.tsdb_executor, cls.tsdb.get_channels, rp_id)
+                else:
+                    reply["resolution"] = resolution
+                    reply["points"] = await loop.run_in_executor(
+                                                cls.tsdb_executor, cls.tsdb.query, rp_id,
+                                                request["channel"], start, end, resolution)
+            except Exception as e:
+                logging.error("Time-series query %s failed: %s", req_id, e)
+                reply = {"req_id": req_id, "error": str(e)}
+        cls.client.publish(f"ice_runner/server/bot_commander/tsdb/{req_id}", json.dumps(reply))
+        logging.debug("Published\t| Time-series reply %s", req_id)
+
+    @classmethod
+    def receive_log(cls, rp_id: int, transfer_id: str, method: Callable, *args) -> None:
+        """The function passes the offer or the chunk of the log file to the log receiver
+            in its worker thread. The work is submitted at once, so the chunks are written
+            in the order of receiving, the acknowledgement is published when it is done"""
+        future = asyncio.get_running_loop().run_in_executor(cls.log_executor, method, *args)
+        async def publish_ack() -> None:
+            cls.publish_log_ack(rp_id, transfer_id, await future)
+        cls.run_task(publish_ack())
+
+    @classmethod
+    def publish_log_ack(cls, rp_id: int, transfer_id: str, ack: Dict[str, Any] | None) -> None:
+        """The function acknowledges received part of the log file and publishes
+            server paths of the logs to the bot when all files of the run are received"""
+        if ack is not None:
+            cls.client.publish(
+                f"ice_runner/server/rp_commander/{rp_id}/log_transfer/{transfer_id}/ack",
+                json.dumps(ack))
+        for completed_rp_id, logs in cls.log_receiver.pop_completed():
+            cls.rp_logs[completed_rp_id] = logs
+            cls.client.publish(f"ice_runner/server/bot_commander/rp_states/{completed_rp_id}/log",
+                               json.dumps(logs))
+            logging.info("Published\t| Raspberry Pi %d logs", completed_rp_id)
+
+    @classmethod
+    def check_liveness(cls) -> None:
+        """The function marks runners which missed their heartbeat deadline offline"""
+        for rp_id in cls.liveness.expire(time.time()):
+            cls.publish_liveness(rp_id, False)
+
+    @classmethod
+    async def keep_connected(cls) -> None:
+        """The function connects to the MQTT broker and reconnects with exponential backoff
+            after the connection is lost or failed"""
+        while True:
+            cls.disconnected.clear()
+            try:
+                cls.client.connect(cls.server_ip, cls.port, KEEPALIVE)
+                await cls.disconnected.wait()
+            except OSError as e:
+                logging.error("Connection to %s:%d failed: %s", cls.server_ip, cls.port, e)
+            logging.info("Reconnecting in %d sec", cls.reconnect_delay)
+            await asyncio.sleep(cls.reconnect_delay)
+            cls.reconnect_delay = min(MAX_RECONNECT_DELAY, cls.reconnect_delay * 2)
+
+    @classmethod
+    async def report_stats(cls) -> None:
+        """The function periodically publishes handlers latency and queues depth"""
+        while True:
+            await asyncio.sleep(STATS_PERIOD)
+            stats = {route.topic_filter: route.get_stats() for route in cls.routes}
+            logging.debug("Stats\t| %s", stats)
+            cls.client.publish("ice_runner/server/stats", json.dumps(stats))
+
+    @classmethod
+    async def start(cls, server_ip: str = "localhost", port: int = 1883,
+                    fleet_period: float = FLEET_PERIOD, tsdb_path: str | None = None,
+                    log_storage: str | None = None, history_path: str | None = None) -> None:
+        """The function starts the server mqtt client, workers of its routes
+            and the connection supervisor in the running event loop.
+            The time-series store, the log files storage and the engine history
+            are used only if their paths are specified"""
         logging.info("Started")
-        cls.client.subscribe("ice_runner/raspberry_pi/#")
-        cls.client.subscribe("ice_runner/bot/#")
-        cls.client.loop_start()
+        cls.server_ip = server_ip
+        cls.port = port
+        cls.fleet_period = fleet_period
+        cls.disconnected = asyncio.Event()
+        AsyncioHelper(asyncio.get_running_loop(), cls.client)
+        for route in cls.routes:
+            route.start(cls.client)
+        cls.tasks = [asyncio.create_task(cls.keep_connected()),
+                     asyncio.create_task(cls.report_stats()),
+                     asyncio.create_task(cls.report_fleet())]
+        if tsdb_path is not None:
+            cls.tsdb_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tsdb")
+            cls.tsdb = cls.tsdb_executor.submit(TimeSeriesStore, tsdb_path).result()
+            cls.tasks.append(asyncio.create_task(cls.store_timeseries()))
+        if log_storage is not None:
+            cls.log_receiver = LogReceiver(log_storage)
+            cls.log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="logs")
+        if history_path is not None:
+            cls.history_executor = ThreadPoolExecutor(max_workers=1,
+                                                      thread_name_prefix="history")
+            cls.history = cls.history_executor.submit(EngineHistory, history_path).result()
+
+    @classmethod
+    def stop(cls) -> None:
+        """The function stops all server tasks and disconnects from the broker"""
+        for task in cls.tasks + [route.task for route in cls.routes]:
+            if task is not None:
+                task.cancel()
+        if cls.tsdb is not None:
+            cls.tsdb_executor.submit(cls.tsdb.flush)
+            cls.tsdb_executor.submit(cls.tsdb.close)
+            cls.tsdb_executor.shutdown(wait=True)
+            cls.tsdb = None
+        for task in cls.background_tasks:
+            task.cancel()
+        if cls.log_receiver is not None:
+            cls.log_executor.submit(cls.log_receiver.close)
+            cls.log_executor.shutdown(wait=True)
+            cls.log_receiver = None
+        if cls.history is not None:
+            cls.history_executor.submit(cls.history.close)
+            cls.history_executor.shutdown(wait=True)
+            cls.history = None
+        cls.client.disconnect()
@@ -6,12 +6,22 @@
 
 import json
 import logging
+import time
+from typing import Tuple
 
 from server.mqtt.client import ServerMqttClient
-from paho.mqtt.client import Client
+from paho.mqtt.client import Client, MQTTMessage
 
+def get_request(msg: MQTTMessage) -> Tuple[int, str | None]:
+    """The function returns Raspberry Pi id and id of the bot request from JSON payload
+        {"rp_id": 1, "req_id": "..."}, plain Raspberry Pi id without request id is accepted"""
+    request = json.loads(msg.payload.decode())
+    if isinstance(request, dict):
+        return int(request["rp_id"]), request.get("req_id")
+    return int(request), None
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/dronecan/#")
+
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/dronecan/#")
 def handle_raspberry_pi_dronecan_message(client: Client, userdata,  msg):
     """The function handles dronecan messages from Raspberry Pi and stores them in dictionary"""
     del userdata, client
@@ -21,26 +31,41 @@ def handle_raspberry_pi_dronecan_message(client: Client, userdata,  msg):
     if rp_id not in ServerMqttClient.rp_messages:
         ServerMqttClient.rp_messages[rp_id] = {}
     ServerMqttClient.rp_messages[rp_id][message_type] = json.loads(msg.payload.decode())
+    if ServerMqttClient.tsdb is not None:
+        ServerMqttClient.tsdb.add_message(rp_id, message_type,
+                                          ServerMqttClient.rp_messages[rp_id][message_type],
+                                          time.time())
+
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/heartbeat")
+def handle_raspberry_pi_heartbeat(client: Client, userdata,  msg):
+    """The function tracks liveness of Raspberry Pi by its heartbeat replies"""
+    del userdata, client
+    rp_id = int(msg.topic.split("/")[2])
+    seq = int(msg.payload.decode())
+    if ServerMqttClient.liveness.touch(rp_id, time.time(), seq):
+        ServerMqttClient.publish_liveness(rp_id, True)
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/status")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/status")
 def handle_raspberry_pi_status(client: Client, userdata,  msg):
-    """The function transmit status messages from Raspberry Pi to Bot"""
-    del userdata
+    """The function stores status messages from Raspberry Pi in the fleet table,
+        the Bot receives them with the next fleet snapshot"""
+    del userdata, client
     rp_id = int(msg.topic.split("/")[2])
     logging.debug("Recieved\t| Raspberry Pi %d status", rp_id)
-    ServerMqttClient.rp_status[rp_id] = msg.payload.decode()
-    client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/status",
-                   ServerMqttClient.rp_status[rp_id])
+    status = json.loads(msg.payload.decode())
+    ServerMqttClient.fleet.update_status(rp_id, status, time.time())
+    ServerMqttClient.publish_replies(rp_id, "status", status)
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/state")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/state")
 def handle_raspberry_pi_state(client: Client, userdata,  msg):
-    """The function transmit state messages from Raspberry Pi to Bot"""
-    del userdata
+    """The function stores state messages from Raspberry Pi in the fleet table,
+        the Bot receives them with the next fleet snapshot"""
+    del userdata, client
     rp_id = int(msg.topic.split("/")[2])
     logging.debug("Recieved\t| Raspberry Pi %d state", rp_id)
-    client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/state", msg.payload.decode())
+    ServerMqttClient.fleet.update_state(rp_id, int(msg.payload.decode()), time.time())
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/config")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/config")
 def handle_raspberry_pi_configuration(client: Client, userdata,  msg):
     """The function transmit configuration messages from Raspberry Pi to Bot"""
     del userdata
@@ -48,9 +73,11 @@ def handle_raspberry_pi_configuration(client: Client, userdata,  msg):
     rp_id = int(msg.topic.split("/")[2])
     logging.info("Received\t| Raspberry Pi %d configuration", rp_id)
     ServerMqttClient.rp_configuration[rp_id] = config
+    ServerMqttClient.fleet.update_configuration(rp_id, config, time.time())
     client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/config", config)
+    ServerMqttClient.publish_replies(rp_id, "config", json.loads(config))
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/full_config")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/full_config")
 def handle_raspberry_pi_full_config(client: Client, userdata,  msg):
     """The function transmit full configuration messages from Raspberry Pi to Bot"""
     del userdata
@@ -59,11 +86,13 @@ def handle_raspberry_pi_full_config(client: Client, userdata,  msg):
     logging.info("Received\t| Raspberry Pi %d full configuration", rp_id)
     ServerMqttClient.rp_full_configuration[rp_id] = config
     client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/full_config", config)
+    ServerMqttClient.publish_replies(rp_id, "full_config", json.loads(config))
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/log")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/log")
 def handle_raspberry_pi_log(client: Client, userdata,  msg):
     """The function handles log messages with log filename from Raspberry Pi to Bot.
-        Can be used if bot is running on same machine. Otherwise, send the whole log file to Bot"""
+        Can be used if bot is running on same machine as Raspberry Pi,
+        otherwise the log files are uploaded to the server by log_transfer messages"""
     del userdata
     rp_id = int(msg.topic.split("/")[2])
     logging.info("Received\t| Raspberry Pi %d log", rp_id)
@@ -71,7 +100,42 @@ def handle_raspberry_pi_log(client: Client, userdata,  msg):
     client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/log",
                    msg.payload.decode())
 
-@ServerMqttClient.client.topic_callback("ice_runner/raspberry_pi/+/stop_reason")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/log_transfer/+/offer")
+def handle_raspberry_pi_log_offer(client: Client, userdata,  msg):
+    """The function starts or resumes transfer of the log file offered by Raspberry Pi"""
+    del userdata, client
+    rp_id = int(msg.topic.split("/")[2])
+    transfer_id = msg.topic.split("/")[4]
+    if ServerMqttClient.log_receiver is None:
+        logging.warning("Recieved\t| Raspberry Pi %d log offer, log storage is disabled", rp_id)
+        return
+    offer = json.loads(msg.payload.decode())
+    logging.info("Recieved\t| Raspberry Pi %d log %s offer", rp_id, offer["file"])
+    ServerMqttClient.receive_log(rp_id, transfer_id, ServerMqttClient.log_receiver.offer,
+                                 rp_id, transfer_id, offer)
+
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/log_transfer/+/chunk")
+def handle_raspberry_pi_log_chunk(client: Client, userdata,  msg):
+    """The function stores chunk of the log file transferred by Raspberry Pi"""
+    del userdata, client
+    rp_id = int(msg.topic.split("/")[2])
+    transfer_id = msg.topic.split("/")[4]
+    if ServerMqttClient.log_receiver is None:
+        return
+    ServerMqttClient.receive_log(rp_id, transfer_id, ServerMqttClient.log_receiver.chunk,
+                                 rp_id, transfer_id, msg.payload)
+
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/tail/+")
+def handle_raspberry_pi_tail(client: Client, userdata,  msg):
+    """The function transmit replies to the log tail requests from Raspberry Pi to Bot"""
+    del userdata
+    rp_id = int(msg.topic.split("/")[2])
+    req_id = msg.topic.split("/")[-1]
+    logging.debug("Recieved\t| Raspberry Pi %d tail %s", rp_id, req_id)
+    client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/tail/{req_id}",
+                   msg.payload)
+
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/stop_reason")
 def handle_raspberry_pi_stop_reason(client: Client, userdata,  msg):
     """The function transmit stop reason messages from Raspberry Pi to Bot"""
     del userdata
@@ -81,47 +145,72 @@ def handle_raspberry_pi_stop_reason(client: Client, userdata,  msg):
     client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/stop_reason",
                    msg.payload.decode())
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/log")
+@ServerMqttClient.route("ice_runner/raspberry_pi/+/run_summary")
+def handle_raspberry_pi_run_summary(client: Client, userdata,  msg):
+    """The function transmit summary of the finished run from Raspberry Pi to Bot.
+        The run is added to the history of the engine, its totals and drifts are sent
+        with the summary when the history is written"""
+    del userdata
+    rp_id = int(msg.topic.split("/")[2])
+    logging.info("Received\t| Raspberry Pi %d run summary", rp_id)
+    if ServerMqttClient.history is None:
+        client.publish(f"ice_runner/server/bot_commander/rp_states/{rp_id}/run_summary",
+                       msg.payload)
+        return
+    ServerMqttClient.run_task(ServerMqttClient.forward_run_summary(
+        rp_id, json.loads(msg.payload.decode())))
+
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/log")
 def handle_bot_usr_cmd_log(client: Client, userdata,  msg):
     """The function transmit log command from Bot, so the Raspberry Pi log file name will be sent"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, _ = get_request(msg)
     logging.info("Recieved\t| Bot command %d log", rp_id)
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command", "log")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/state")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/+/tail")
+def handle_bot_usr_cmd_tail(client: Client, userdata,  msg):
+    """The function transmit log tail request from Bot to Raspberry Pi specified in topic"""
+    del userdata
+    rp_id = int(msg.topic.split("/")[-2])
+    logging.info("Recieved\t| Bot command %d tail", rp_id)
+    client.publish(f"ice_runner/server/rp_commander/{rp_id}/tail", msg.payload)
+
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/state")
 def handle_bot_usr_cmd_state(client: Client, userdata,  msg):
     """The function transmit state messages from Bot to Raspberry Pi specified by id in message"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, _ = get_request(msg)
     logging.info("Recieved\t| Bot command %d state", rp_id)
     client.publish("ice_runner/server/rp_commander/state", str(rp_id))
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/stop")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/stop")
 def handle_bot_usr_cmd_stop(client: Client, userdata,  msg):
     """The function transmit stop messages from Bot to Raspberry Pi specified by id in message"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, _ = get_request(msg)
     logging.info("Recieved\t| Bot command %d stop", rp_id)
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command", "stop")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/start")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/start")
 def handle_bot_usr_cmd_start(client: Client, userdata,  msg):
     """The function transmit start messages from Bot to Raspberry Pi specified by id in message"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, _ = get_request(msg)
     logging.info("Recieved\t| Bot command %d start", rp_id)
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command", "start")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/status")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/status")
 def handle_bot_usr_cmd_status(client: Client, userdata,  msg):
     """The function transmit status messages from Bot to Raspberry Pi specified by id in message"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, req_id = get_request(msg)
     logging.info("Recieved\t| Bot command %d status", rp_id)
+    if req_id is not None:
+        ServerMqttClient.add_request(rp_id, "status", req_id, time.time())
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command", "status")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/who_alive")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/who_alive")
 def handle_bot_who_alive(client: Client, userdata,  msg):
     """The function sends who_alive message to all Raspberry Pis,
         so when a Raspberry Pi is connected, it will send state message to Bot"""
@@ -129,15 +218,17 @@ def handle_bot_who_alive(client: Client, userdata,  msg):
     logging.debug("Recieved\t| Bot command who_alive")
     client.publish("ice_runner/server/rp_commander/who_alive", "who_alive")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/config")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/config")
 def handle_bot_config(client: Client, userdata,  msg):
     """The function transmit bot command /config to Raspberry Pi"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, req_id = get_request(msg)
     logging.info("Recieved\t| Bot command configuration for %d", rp_id)
+    if req_id is not None:
+        ServerMqttClient.add_request(rp_id, "config", req_id, time.time())
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command", "config")
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/+/change_config/#")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/+/change_config/#")
 def handle_bot_change_config(client: Client, userdata,  msg):
     """The function handles bot command /config"""
     del userdata
@@ -147,18 +238,35 @@ def handle_bot_change_config(client: Client, userdata,  msg):
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/change_config/{param_name}",
                    msg.payload.decode())
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/full_config")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/full_config")
 def handle_bot_full_config(client: Client, userdata,  msg):
     """The function handles bot command /config"""
     del userdata
-    rp_id = int(msg.payload.decode())
+    rp_id, req_id = get_request(msg)
+    if req_id is not None:
+        ServerMqttClient.add_request(rp_id, "full_config", req_id, time.time())
     client.publish(f"ice_runner/server/rp_commander/{rp_id}/command",
                    "full_config")
     logging.info("Received\t| Full config cmd for Raspberry Pi %d", rp_id)
 
-@ServerMqttClient.client.topic_callback("ice_runner/bot/usr_cmd/server")
+@ServerMqttClient.route("ice_runner/bot/usr_cmd/server")
 def handle_bot_server(client: Client, userdata,  msg):
-    """The function handles bot command /server"""
-    del userdata, msg
+    """The function handles bot command /server, the request id is echoed if present"""
+    del userdata
     logging.info("Recieved\t| Bot command server")
     client.publish("ice_runner/server/bot_commander/server", "server")
+    try:
+        request = json.loads(msg.payload.decode())
+    except ValueError:
+        return
+    if isinstance(request, dict) and "req_id" in request:
+        ServerMqttClient.publish_reply(request["req_id"], None, "server")
+
+@ServerMqttClient.route("ice_runner/bot/tsdb/query")
+def handle_bot_tsdb_query(client: Client, userdata,  msg):
+    """The function handles time-series query, the reply is published
+        when the store answers it"""
+    del userdata, client
+    request = json.loads(msg.payload.decode())
+    logging.info("Recieved\t| Time-series query %s", request.get("req_id"))
+    ServerMqttClient.run_task(ServerMqttClient.answer_query(request))
@@ -0,0 +1,118 @@
+import csv
+import logging
+import os
+
+import dronecan
+import pytest
+from dronecan.transport import Transfer
+from analysis.candump_decoder import decode, get_segments, parse_line
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+STATUS = "uavcan.equipment.ice.reciprocating.Status"
+NODE_STATUS = "uavcan.protocol.NodeStatus"
+
+class BaseTest():
+    def write_candump(self, path, n_transfers, second_cylinder_from=None):
+        """Frames of the multi-frame status and the single-frame node status are interleaved,
+            the status has the second cylinder from the transfer second_cylinder_from"""
+        lines = []
+        timestamp = 1700000000.0
+        for i in range(n_transfers):
+            status = dronecan.uavcan.equipment.ice.reciprocating.Status(
+                state=2, engine_speed_rpm=4000 + i, oil_temperature=350.5,
+                cylinder_status=[dronecan.uavcan.equipment.ice.reciprocating.CylinderStatus(
+                    ignition_timing_deg=1.5 + j) for j in range(
+                        2 if second_cylinder_from is not None and i >= second_cylinder_from
+                        else 1)])
+            node_status = dronecan.uavcan.protocol.NodeStatus(uptime_sec=i)
+            status_frames = Transfer(transfer_id=i % 32, source_node_id=42,
+                                     payload=status).to_frames()
+            node_frames = Transfer(transfer_id=i % 32, source_node_id=43,
+                                   payload=node_status).to_frames()
+            frames = []
+            while status_frames or node_frames:
+                if status_frames:
+                    frames.append(status_frames.pop(0))
+                if node_frames:
+                    frames.append(node_frames.pop(0))
+            for frame in frames:
+                timestamp += 0.001
+                lines.append(f"({timestamp:.6f}) can0 "
+                             f"{frame.message_id:08X}#{bytes(frame.bytes).hex().upper()}\n")
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+        return str(path)
+
+    def read_table(self, directory, type_name):
+        with open(os.path.join(directory, f"{type_name}.csv"), "r", encoding="utf-8") as file:
+            return list(csv.DictReader(file))
+
+class TestParseLine(BaseTest):
+    def test_extended_frame(self):
+        assert parse_line(b"(1700000000.500000) can0 1F04602A#AB5A8000\n") == \
+            (1700000000.5, 0x1F04602A, b"\xab\x5a\x80\x00", False)
+
+    def test_canfd_frame(self):
+        assert parse_line(b"(1.0) can0 1F04602A##10102") == (1.0, 0x1F04602A, b"\x01\x02", True)
+
+    def test_other_lines(self):
+        assert parse_line(b"(1.0) can0 123#0102\n") is None
+        assert parse_line(b"\n") is None
+        assert parse_line(b"(1.0) can0 1F04602A#XY\n") is None
+
+class TestDecode(BaseTest):
+    def test_tables(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log", 100)
+        stats = decode(log, str(tmp_path / "tables"), workers=1)
+        assert stats[STATUS] == 100
+        assert stats[NODE_STATUS] == 100
+        assert stats["errors"] == 0
+        rows = self.read_table(tmp_path / "tables", STATUS)
+        assert [int(row["engine_speed_rpm"]) for row in rows] == list(range(4000, 4100))
+        assert float(rows[0]["oil_temperature"]) == 350.5
+        assert float(rows[0]["cylinder_status_0_ignition_timing_deg"]) == 1.5
+        assert rows[0]["source_node_id"] == "42"
+
+    def test_segments_match_single_pass(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log", 300)
+        # small segments cut the multi-frame transfers
+        assert len(get_segments(log, 1000)) > 10
+        single = decode(log, str(tmp_path / "single"), workers=1)
+        segmented = decode(log, str(tmp_path / "segmented"), workers=3, segment_size=1000)
+        assert single == segmented
+        for type_name in (STATUS, NODE_STATUS):
+            assert self.read_table(tmp_path / "single", type_name) == \
+                self.read_table(tmp_path / "segmented", type_name)
+
+    def test_new_fields_kept(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log", 300, second_cylinder_from=150)
+        single = decode(log, str(tmp_path / "single"), workers=1)
+        segmented = decode(log, str(tmp_path / "segmented"), workers=3, segment_size=1000)
+        assert single == segmented
+        for directory in ("single", "segmented"):
+            rows = self.read_table(tmp_path / directory, STATUS)
+            assert len(rows) == 300
+            assert rows[0]["cylinder_status_1_ignition_timing_deg"] == ""
+            assert float(rows[-1]["cylinder_status_1_ignition_timing_deg"]) == 2.5
+            assert float(rows[-1]["cylinder_status_0_ignition_timing_deg"]) == 1.5
+        assert self.read_table(tmp_path / "single", STATUS) == \
+            self.read_table(tmp_path / "segmented", STATUS)
+
+    def test_types_filter(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log", 10)
+        stats = decode(log, str(tmp_path / "tables"), workers=1, types={NODE_STATUS})
+        assert stats[NODE_STATUS] == 10
+        assert STATUS not in stats
+        assert os.listdir(tmp_path / "tables") == [f"{NODE_STATUS}.csv"]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import logging
+import os
+
+import numpy as np
+import pytest
+from analysis.engine_identification import LagFit, get_basis, identify, start
+from ice_sim import simple_sim
+from ice_sim.EngineModel import EngineModel
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+THROTTLE_POINTS = np.array([0, 10, 20, 30, 50, 100])
+AIR_POINTS = np.array([0, 100])
+TEMPERATURE_RPM_POINTS = np.array([0, 2000, 4000, 6000, 8000])
+MODEL = EngineModel(THROTTLE_POINTS, [[1200, 1500], [2000, 2600], [3000, 4100],
+                                      [3800, 5000], [5000, 6500], [6000, 7800]],
+                    1.2, 0.3, AIR_POINTS, TEMPERATURE_RPM_POINTS, [290, 310, 340, 370, 400], 90)
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+class BaseTest():
+    def write_run(self, directory, seed, model=MODEL, period=0.1, duration=300):
+        """The function writes the status log of the engine following the model
+            with random throttle steps"""
+        rng = np.random.default_rng(seed)
+        size = int(duration / period)
+        gas = np.repeat(rng.uniform(5, 60, size // 50 + 1), 50)[:size]
+        air = np.repeat(rng.uniform(0, 100, size // 200 + 1), 200)[:size]
+        states = np.full(size, 2)
+        states[:50] = 0
+        states[-100:] = 0
+        delay = int(round(model.delay / period))
+        rpm, temperature = 0.0, 295.0
+        path = os.path.join(directory,
+                            f"uavcan.equipment.ice.reciprocating.Status_{seed}.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("state,engine_speed_rpm,oil_temperature,engine_load_percent,"
+                       "throttle_position_percent,t\n")
+            for k in range(size):
+                file.write(f"{states[k]},{rpm + rng.normal(0, 5):.0f},{temperature:.2f},"
+                           f"{gas[k]:.0f},{air[k]:.0f},{1700000000 + k * period:.3f}\n")
+                if states[k] == 2:
+                    rpm = model.step(rpm, gas[max(k - delay, 0)], period, air[max(k - delay, 0)])
+                else:
+                    rpm = 0.0
+                temperature = model.step_temperature(temperature, rpm, period)
+        return path
+
+class TestLagFit(BaseTest):
+    def test_basis(self):
+        values = np.array([[0, 0], [5, 50], [40, 100], [120, -10]], dtype=np.float64)
+        basis = get_basis([THROTTLE_POINTS, AIR_POINTS], [values[:, 0], values[:, 1]])
+        assert np.allclose(basis.sum(axis=1), 1)
+        assert np.allclose(basis @ MODEL.rpm_points.ravel(),
+                           MODEL.get_steady_rpm(values[:, 0], values[:, 1]))
+
+    def test_lag(self):
+        period, a = 0.1, np.exp(-0.1 / 2)
+        values = [0.0]
+        inputs = np.repeat([10.0, 60.0, 30.0], 100)
+        for value in inputs[:-1]:
+            values.append(a * values[-1] + (1 - a) * (1000 + 50 * value))
+        fit = LagFit([np.array([0, 100])], period)
+        fit.add(np.array(values), [inputs], np.ones(len(inputs) - 1, dtype=bool))
+        table, time_constant, rms = fit.solve(smoothness=0)
+        assert np.allclose(table, [1000, 6000])
+        assert time_constant == pytest.approx(2)
+        assert rms < 1e-6
+
+    def test_no_samples(self):
+        with pytest.raises(ValueError):
+            LagFit([np.array([0, 100])], 0.1).solve()
+
+class TestIdentification(BaseTest):
+    def test_model(self, tmp_path):
+        paths = [self.write_run(tmp_path, seed) for seed in range(3)]
+        model, stats = identify(paths, THROTTLE_POINTS, AIR_POINTS, TEMPERATURE_RPM_POINTS,
+                                workers=2)
+        assert stats["runs"] == 3
+        assert model.delay == pytest.approx(MODEL.delay)
+        assert model.time_constant == pytest.approx(MODEL.time_constant, rel=0.05)
+        assert model.temperature_time_constant == pytest.approx(90, rel=0.05)
+        # the throttles of the runs are within 5-60%
+        assert np.allclose(model.rpm_points[1:5], MODEL.rpm_points[1:5], rtol=0.03)
+        assert np.allclose(model.temperature_points[1:4], MODEL.temperature_points[1:4],
+                           atol=2)
+
+    def test_cli(self, tmp_path, capsys):
+        path = self.write_run(tmp_path, 0)
+        output = os.path.join(tmp_path, "engine_model.json")
+        start([path, os.path.join(tmp_path, "other.csv"), "--output", output,
+               "--air_points", "none", "--workers", "1"])
+        assert "Runs: 1" in capsys.readouterr().out
+        model = EngineModel.from_file(output)
+        assert model.air_points is None
+        assert model.rpm_points.shape == THROTTLE_POINTS.shape
+
+class TestSimulator(BaseTest):
+    def setup_method(self, test_method):
+        self.time = simple_sim.time
+        simple_sim.time = FakeTime()
+
+    def teardown_method(self, test_method):
+        simple_sim.time = self.time
+
+    def test_engine_follows_model(self):
+        engine = simple_sim.Engine(model=MODEL)
+        command = int(30 * 8191 / 100)
+        for _ in range(300):
+            simple_sim.time.now += 0.05
+            engine.update(command, 2000)
+        assert engine.state == simple_sim.EngineState.STARTER_WAITING
+        assert engine.rpm == pytest.approx(MODEL.get_steady_rpm(30, 100), rel=1e-3)
+        assert engine.temperature > 295
+        engine.update(0, 2000)
+        assert engine.state == simple_sim.EngineState.STOPPED
+        assert engine.rpm == 0
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
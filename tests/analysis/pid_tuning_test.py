@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+from analysis.pid_tuning import (CONTROL_PERIOD, MAX_COMMAND, get_gain_grid, simulate, start,
+                                 tune)
+from ice_sim.EngineModel import EngineModel
+from raspberry.RunnerConfiguration import RunnerConfiguration
+from raspberry.can_control import modes
+from raspberry.can_control.modes import PIDController
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+CONFIGURATION_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "ice_configuration.yml")
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.model = EngineModel()
+        self.time = modes.time
+
+    def teardown_method(self, test_method):
+        modes.time = self.time
+
+    def simulate_controller(self, gains, target, start_command, min_command, max_command,
+                            steps):
+        """The reference: PIDController of the runner on the virtual clock, the engine
+            responds to the command sent delay before"""
+        clock = FakeTime()
+        modes.time = clock
+        controller = PIDController(target, gains, max_command, min_command)
+        rpm = self.model.get_steady_rpm(start_command * 100 / MAX_COMMAND)
+        controller.prev_error = target - rpm
+        controller.prev_command = start_command
+        controller.prev_time = clock.now
+        delay_steps = int(round(self.model.delay / CONTROL_PERIOD))
+        sent = [int(start_command)] * delay_steps
+        trajectory = []
+        for _ in range(steps):
+            clock.now += CONTROL_PERIOD
+            sent.append(int(controller.get_pid_command(rpm)))
+            rpm = self.model.step(rpm, sent.pop(0) * 100 / MAX_COMMAND, CONTROL_PERIOD)
+            trajectory.append(rpm)
+        return np.array(trajectory)
+
+class TestEngineModel(BaseTest):
+    def test_step(self):
+        rpm = 0
+        for _ in range(300):
+            rpm = self.model.step(rpm, 30, 0.1)
+        assert rpm == pytest.approx(self.model.get_steady_rpm(30))
+        rpm = self.model.step(np.zeros(3), np.array([0, 30, 100]), self.model.time_constant)
+        assert np.allclose(rpm, self.model.get_steady_rpm(np.array([0, 30, 100])) *
+                           (1 - np.exp(-1)))
+
+    def test_file(self, tmp_path):
+        path = os.path.join(tmp_path, "model.json")
+        EngineModel([0, 100], [1000, 8000], 0.5, 0.4).to_file(path)
+        model = EngineModel.from_file(path)
+        assert model.get_steady_rpm(50) == 4500
+        assert model.to_dict()["rpm_points"] == [1000, 8000]
+        assert model.time_constant == 0.5
+        assert model.delay == 0.4
+
+class TestSimulation(BaseTest):
+    @pytest.mark.parametrize("gains", [(0.1, 0, 0.02), (0.05, 0.02, 0), (0.3, 0.1, 0.05)])
+    def test_reference(self, gains):
+        target, start_command = 4000, 1228
+        min_command, max_command = 1228, 2457
+        steps = 100
+        trajectory = self.simulate_controller(gains, target, start_command, min_command,
+                                              max_command, steps)
+        results = simulate(self.model, np.array([gains]), target, start_command, min_command,
+                           max_command, steps * CONTROL_PERIOD)
+        overshoot = max(0, trajectory.max() - target) * 100 / target
+        assert results["overshoot"][0] == pytest.approx(overshoot)
+        unsettled = np.nonzero(np.abs(trajectory - target) > target * 0.02)[0]
+        settling_time = (unsettled[-1] + 1) * CONTROL_PERIOD if len(unsettled) else 0
+        if len(unsettled) and unsettled[-1] == steps - 1:
+            settling_time = np.inf
+        assert results["settling_time"][0] == pytest.approx(settling_time)
+
+    def test_not_settled(self):
+        results = simulate(self.model, np.array([[0, 0, 0], [0.1, 0, 0.02]]), 4000, 1228,
+                           1228, 2457)
+        assert results["settling_time"][0] == np.inf
+        assert results["effort"][0] == 0
+        assert np.isfinite(results["settling_time"][1])
+
+    def test_unstable_gains(self):
+        results = simulate(self.model, np.array([[1e6, 1e6, 1e6]]), 4000, 1228, 1228, 2457)
+        assert not np.isfinite(results["settling_time"][0])
+
+    def test_speed(self):
+        grids = {name: np.linspace(0, 0.3, 22) for name in ("p", "i", "d")}
+        gains = get_gain_grid(grids)
+        assert len(gains) > 10000
+        start_time = time.time()
+        simulate(self.model, gains, 4000, 1228, 1228, 2457)
+        assert time.time() - start_time < 5
+
+class TestTuning(BaseTest):
+    def test_best_gains(self):
+        configuration = RunnerConfiguration(file_path=CONFIGURATION_PATH)
+        grids = {"control_pid_p": np.linspace(0, 0.3, 10),
+                 "control_pid_i": np.linspace(0, 0.2, 10),
+                 "control_pid_d": np.linspace(0, 0.05, 10)}
+        rows = tune(self.model, configuration, grids, top=5)
+        assert len(rows) == 5
+        assert [row["cost"] for row in rows] == sorted(row["cost"] for row in rows)
+        assert rows[0]["settling_time"] < 10
+        assert rows[0]["control_pid_p"] > 0
+
+    def test_air_throttle(self):
+        model = EngineModel([0, 50, 100], [[1000, 2000, 3000], [2000, 4000, 6000],
+                                           [3000, 6000, 8000]], air_points=[0, 50, 100])
+        assert model.get_steady_rpm(50) == 6000
+        configuration = RunnerConfiguration(file_path=CONFIGURATION_PATH)
+        configuration.gas_throttle_pct = 50
+        configuration.min_gas_throttle_pct = 0
+        configuration.max_gas_throttle_pct = 100
+        configuration.air_throttle_pct = 30
+        # the engine is at the target from the start only at the air throttle of the run
+        configuration.rpm = float(model.get_steady_rpm(50, 30))
+        grids = {"control_pid_p": [0.0], "control_pid_i": [0.0], "control_pid_d": [0.0]}
+        rows = tune(model, configuration, grids, duration=5)
+        assert rows[0]["settling_time"] == 0
+        assert rows[0]["overshoot"] == 0
+        results = simulate(model, np.zeros((1, 3)), configuration.rpm, MAX_COMMAND / 2, 0,
+                           MAX_COMMAND, 5)
+        assert np.isinf(results["settling_time"][0])
+
+    def test_write(self, tmp_path, capsys):
+        path = os.path.join(tmp_path, "ice_configuration.yml")
+        shutil.copy(CONFIGURATION_PATH, path)
+        start(["--config", path, "--control_pid_p", "0.1", "--control_pid_i", "0,0.01",
+               "--control_pid_d", "0.02", "--write", "--json"])
+        rows = json.loads(capsys.readouterr().out)
+        configuration = RunnerConfiguration(file_path=path)
+        assert configuration.control_pid_p == 0.1
+        assert configuration.control_pid_i == rows[0]["control_pid_i"]
+        assert configuration.control_pid_d == 0.02
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
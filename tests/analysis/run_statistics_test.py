@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+from analysis.run_statistics import (STATUS_LOG, QuantileSketch, RunStatistics, analyze_run,
+                                     get_thresholds, read_chunks)
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def write_status_log(self, path, states, rpm, period=0.1):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("state,engine_speed_rpm,oil_temperature,cylinder_status_0,t\n")
+            for i, (state, value) in enumerate(zip(states, rpm)):
+                file.write(f"{state},{value},350,\"{{'ignition_timing_deg': '0'}}\","
+                           f"{1700000000 + i * period:.3f}\n")
+        return str(path)
+
+class TestQuantileSketch(BaseTest):
+    def test_relative_error(self):
+        values = np.random.default_rng(1).lognormal(8, 1, 100000)
+        sketch = QuantileSketch(0.01)
+        for chunk in np.array_split(values, 10):
+            sketch.add(chunk)
+        for q in (0.05, 0.5, 0.95, 0.99):
+            assert sketch.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.02)
+        assert len(sketch.positive) < 1000
+
+    def test_negative_and_zero(self):
+        sketch = QuantileSketch()
+        sketch.add(np.array([-100.0, -10.0, 0, 0, 0, 10.0, 100.0]))
+        assert sketch.quantile(0) == pytest.approx(-100, rel=0.01)
+        assert sketch.quantile(0.5) == 0
+        assert sketch.quantile(1) == pytest.approx(100, rel=0.01)
+
+    def test_merge(self):
+        first, second = QuantileSketch(), QuantileSketch()
+        first.add(np.arange(1, 501, dtype=np.float64))
+        second.add(np.arange(501, 1001, dtype=np.float64))
+        first.merge(second)
+        assert first.count == 1000
+        assert first.quantile(0.5) == pytest.approx(500, rel=0.01)
+
+class TestRunStatistics(BaseTest):
+    def test_chunks_match_whole_file(self, tmp_path):
+        states = [0] * 10 + [1] * 5 + [2] * 20 + [1] * 5 + [2] * 50 + [0] * 10
+        rpm = [0] * 15 + [4000] * 20 + [0] * 5 + [4600] * 50 + [0] * 10
+        path = self.write_status_log(tmp_path / "status.csv", states, rpm)
+        results = [analyze_run({STATUS_LOG: path}, {"engine_speed_rpm": 4500}, chunk_rows)
+                   for chunk_rows in (7, 1000)]
+        assert results[0].to_dict() == results[1].to_dict()
+        statistics = results[0]
+        assert statistics.duration == pytest.approx(9.9)
+        assert statistics.start_attempts == 2
+        assert statistics.state_time["STOPPED"] == pytest.approx(1.9)
+        assert statistics.state_time["STARTER_RUNNING"] == pytest.approx(1.0)
+        assert statistics.state_time["STARTER_WAITING"] == pytest.approx(7.0)
+        assert statistics.threshold_time["engine_speed_rpm"] == pytest.approx(5.0)
+        rpm_statistics = statistics.channels[STATUS_LOG]["engine_speed_rpm"]
+        assert (rpm_statistics.min, rpm_statistics.max) == (0, 4600)
+        assert rpm_statistics.get_mean() == pytest.approx(np.mean(rpm))
+        assert "cylinder_status_0" not in statistics.channels[STATUS_LOG]
+        json.dumps(statistics.to_dict())
+        summary = statistics.format()
+        assert "Попыток запуска: 2" in summary
+        assert "Выше порога: RPM 5.0 сек" in summary
+        assert "TEMP, °C: min 77" in summary
+
+    def test_broken_values(self, tmp_path):
+        path = tmp_path / "status.csv"
+        path.write_text("engine_speed_rpm,t\n100,1\nnan_value,2\n,3\n300,4\nshort\n")
+        chunks = list(read_chunks(str(path)))
+        assert np.array_equal(chunks[0]["t"], [1, 2, 3, 4])
+        assert np.isnan(chunks[0]["engine_speed_rpm"][1:3]).all()
+        statistics = RunStatistics()
+        statistics.update("log", chunks[0])
+        assert statistics.channels["log"]["engine_speed_rpm"].get_mean() == 200
+
+    def test_constant_memory(self, tmp_path):
+        peaks = []
+        for n_rows in (50000, 200000):
+            path = self.write_status_log(tmp_path / f"status_{n_rows}.csv", [2] * n_rows,
+                                         np.random.default_rng(2).integers(3000, 5000, n_rows))
+            tracemalloc.start()
+            analyze_run({STATUS_LOG: path}, chunk_rows=10000)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        assert peaks[1] < peaks[0] * 1.2
+
+    def test_thresholds(self):
+        assert get_thresholds({"max_rpm": 5000, "max_temperature": 0, "rpm": 4500}) == \
+            {"engine_speed_rpm": 5000.0}
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
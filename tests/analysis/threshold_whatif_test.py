@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pytest
+from analysis.threshold_whatif import (RunTelemetry, evaluate, get_runs, get_stop_times,
+                                       load_run, parse_grid, range_min, start, summarize)
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+def get_stop_time(times, values, threshold, latched=False, debounce=2):
+    """The reference: the exceeding starts at the sample above the threshold and lasts
+        till the next sample not above it"""
+    exceeding_start = None
+    for i, value in enumerate(values):
+        if value > threshold:
+            if latched:
+                return times[i] + debounce
+            if exceeding_start is None:
+                exceeding_start = times[i]
+        else:
+            exceeding_start = None
+        if exceeding_start is not None and i + 1 < len(times) and \
+                times[i + 1] - exceeding_start > debounce:
+            return exceeding_start + debounce
+    return np.nan
+
+class BaseTest():
+    def make_series(self, n=2000, seed=0):
+        rng = np.random.default_rng(seed)
+        times = np.cumsum(rng.uniform(0.05, 0.3, n))
+        values = 380 + np.cumsum(rng.normal(0, 1, n))
+        return times, values
+
+    def write_run(self, directory, name, states, temperatures, period=0.1):
+        path = os.path.join(directory, f"uavcan.equipment.ice.reciprocating.Status_{name}.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("state,engine_speed_rpm,oil_temperature,t\n")
+            for i, (state, temperature) in enumerate(zip(states, temperatures)):
+                file.write(f"{state},4000,{temperature},{1700000000 + i * period:.3f}\n")
+        return path
+
+class TestStopTimes(BaseTest):
+    def test_range_min(self):
+        values = np.random.default_rng(1).normal(size=1000)
+        start_indices = np.random.default_rng(2).integers(0, 1000, 500)
+        end_indices = np.minimum(start_indices + np.random.default_rng(3).integers(0, 300, 500),
+                                 999)
+        expected = [values[s:e + 1].min() for s, e in zip(start_indices, end_indices)]
+        assert np.array_equal(range_min(values, start_indices, end_indices), expected)
+
+    @pytest.mark.parametrize("latched", [False, True])
+    def test_reference(self, latched):
+        times, values = self.make_series()
+        grid = np.linspace(values.min() - 1, values.max() + 1, 50)
+        expected = [get_stop_time(times, values, threshold, latched) for threshold in grid]
+        assert np.allclose(get_stop_times(times, values, grid, latched), expected,
+                           equal_nan=True)
+
+    def test_debounce(self):
+        times = np.arange(0, 10, 0.5)
+        values = np.zeros(len(times))
+        values[4:8] = 10 # held from 2 to 4 sec, not longer than the debounce
+        values[10:15] = 10 # held from 5 to 7.5 sec
+        assert get_stop_times(times, values, np.array([5]))[0] == 7
+        assert np.isnan(get_stop_times(times, values, np.array([10]))[0])
+
+class TestEvaluate(BaseTest):
+    def test_runs(self, tmp_path):
+        # the first run is overheated while the engine is active, the second run when stopped
+        temperatures = [350] * 50 + [400] * 50
+        self.write_run(tmp_path, "1", [0] * 10 + [2] * 90, temperatures)
+        self.write_run(tmp_path, "2", [2] * 50 + [0] * 50, temperatures)
+        runs = [load_run(name, files) for name, files in sorted(get_runs(
+            [str(path) for path in tmp_path.iterdir()]).items())]
+        grid = np.array([0, 360, 390, 400])
+        stop_times = evaluate(runs, {"max_temperature": grid})["max_temperature"]
+        # the time is counted from the first active sample, zero threshold disables the check
+        assert np.isnan(stop_times[:, 0]).all()
+        assert stop_times[0, 1:3] == pytest.approx([4 + 2, 4 + 2])
+        assert np.isnan(stop_times[0, 3])
+        assert np.isnan(stop_times[1]).all()
+        rows = summarize(grid, stop_times)
+        assert [row["stopped"] for row in rows] == [0, 1, 1, 0]
+
+    def test_grid_speed(self):
+        runs = []
+        for i in range(300):
+            run = RunTelemetry(str(i))
+            times, values = self.make_series(20000, i)
+            run.start_time = times[0]
+            run.add_channel("max_temperature", times, values)
+            run.add_channel("max_rpm", times, values * 10)
+            runs.append(run)
+        grids = {"max_temperature": np.linspace(300, 500, 100),
+                 "max_rpm": np.linspace(3000, 5000, 100)}
+        start_time = time.perf_counter()
+        results = evaluate(runs, grids)
+        assert time.perf_counter() - start_time < 5
+        assert results["max_temperature"].shape == (300, 100)
+
+    def test_cli(self, tmp_path, capsys):
+        path = self.write_run(tmp_path, "1", [2] * 100, [350] * 50 + [400] * 50)
+        start([path, "--max_temperature", "380:420:3", "--max_rpm", "5000", "--json"])
+        output = json.loads(capsys.readouterr().out)
+        assert output["runs"] == 1
+        assert [row["stopped"] for row in output["results"]["max_temperature"]] == [1, 0, 0]
+        assert output["results"]["max_rpm"][0]["stopped"] == 0
+
+    def test_parse_grid(self):
+        assert list(parse_grid("1,2.5")) == [1, 2.5]
+        assert list(parse_grid("0:10:3")) == [0, 5, 10]
+        assert len(parse_grid("0:10")) == 100
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pytest
+from bot.telegram.charts import STATUS_LOG, lttb, read_columns, render_run_chart
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def write_status_log(self, path, n_rows):
+        t = 1700000000 + np.arange(n_rows) * 0.1
+        rpm = 4000 + 500 * np.sin(np.arange(n_rows) / 300)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("state,engine_speed_rpm,oil_temperature,engine_load_percent,"
+                       "throttle_position_percent,cylinder_status_0,t\n")
+            for i in range(n_rows):
+                file.write(f"2,{rpm[i]:.0f},{350 + i / n_rows:.2f},40,60,"
+                           f"\"{{'ignition_timing_deg': '0'}}\",{t[i]:.3f}\n")
+        return str(path)
+
+class TestLttb(BaseTest):
+    def test_peaks_kept(self):
+        x = np.arange(10000, dtype=np.float64)
+        y = np.zeros(10000)
+        y[1234] = 10
+        y[8765] = -10
+        x_out, y_out = lttb(x, y, 100)
+        assert len(x_out) == 100
+        assert x_out[0] == 0 and x_out[-1] == 9999
+        assert 1234 in x_out and 8765 in x_out
+        assert np.all(np.diff(x_out) > 0)
+
+    def test_short_line(self):
+        x = np.arange(5, dtype=np.float64)
+        x_out, y_out = lttb(x, x, 10)
+        assert np.array_equal(x_out, x) and np.array_equal(y_out, x)
+
+class TestRunChart(BaseTest):
+    def test_read_columns(self, tmp_path):
+        path = self.write_status_log(tmp_path / "status.csv", 10)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("broken,row\n")
+        data = read_columns(path, ["t", "engine_speed_rpm", "unknown"])
+        assert sorted(data) == ["engine_speed_rpm", "t"]
+        assert len(data["t"]) == 10
+
+    def test_hour_long_run(self, tmp_path):
+        path = self.write_status_log(tmp_path / "status.csv", 36000)
+        start = time.time()
+        image = render_run_chart({STATUS_LOG: path, "candump": "candump.log"})
+        logging.info("Chart of 36000 rows rendered in %.2f sec", time.time() - start)
+        assert image.startswith(b"\x89PNG")
+
+    def test_no_status_log(self, tmp_path):
+        assert render_run_chart({"candump": "candump.log"}) is None
+        assert render_run_chart({STATUS_LOG: str(tmp_path / "missing.csv")}) is None
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+
+import pytest
+from bot.mqtt.client import MqttClient
+from bot.mqtt.handlers import handle_commander_fleet, handle_commander_snapshot
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class FakeMessage:
+    def __init__(self, topic, payload) -> None:
+        self.topic = topic
+        self.payload = json.dumps(payload).encode()
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.saved = (MqttClient.fleet, MqttClient.rp_states, MqttClient.rp_online,
+                      MqttClient.rp_updated, MqttClient.rp_config_hash, MqttClient.rp_status)
+        MqttClient.fleet = {}
+        MqttClient.rp_states = {}
+        MqttClient.rp_online = {}
+        MqttClient.rp_updated = {}
+        MqttClient.rp_config_hash = {}
+        MqttClient.rp_status = {}
+
+    def teardown_method(self, test_method):
+        (MqttClient.fleet, MqttClient.rp_states, MqttClient.rp_online,
+         MqttClient.rp_updated, MqttClient.rp_config_hash, MqttClient.rp_status) = self.saved
+
+class TestFleet(BaseTest):
+    def test_age_with_server_clock_skew(self, mocker):
+        mocker.patch("time.time", return_value=1000.0)
+        # the clock of the server is an hour ahead
+        handle_commander_fleet(None, None, FakeMessage(
+            "ice_runner/server/bot_commander/fleet",
+            {"timestamp": 4600.0, "runners": {"1": {"state": None, "config_hash": None,
+                                                    "online": True, "age": 5.0}}}))
+        assert MqttClient.get_age(1) == 5.0
+        mocker.patch("time.time", return_value=1010.0)
+        assert MqttClient.get_age(1) == 15.0
+
+    def test_snapshot_age_with_server_clock_skew(self, mocker):
+        mocker.patch("time.time", return_value=1000.0)
+        handle_commander_snapshot(None, None, FakeMessage(
+            "ice_runner/server/bot_commander/rp_states/1/snapshot",
+            {"id": 1, "state": None, "status": {"RPM": "4500"}, "config_hash": None,
+             "online": True, "timestamp": 4595.0, "age": 5.0}))
+        assert MqttClient.get_age(1) == 5.0
+        assert MqttClient.rp_status[1] == {"RPM": "4500"}
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
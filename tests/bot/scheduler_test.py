@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+
+import pytest
+from bot.mqtt.client import MqttClient
+from bot.telegram.scheduler import Scheduler
+from bot.telegram.uploader import TelegramUploader
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.messages = []
+
+    async def send_message(self, chat_id, text):
+        self.messages.append(text)
+
+    async def send_photo(self, chat_id, photo, caption):
+        self.messages.append((photo.data[:8], caption))
+
+class FakeChat:
+    id = 1
+
+class FakeMessage:
+    def __init__(self, text) -> None:
+        self.text = text
+        self.chat = FakeChat()
+        self.message_id = id(self)
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+    async def delete(self):
+        pass
+
+class UploadBot(FakeBot):
+    async def send_message(self, chat_id, text):
+        await super().send_message(chat_id, text)
+        return FakeMessage(text)
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.bot = FakeBot()
+        self.saved = (Scheduler.events, MqttClient.rp_logs, MqttClient.rp_stop_handlers,
+                      MqttClient.rp_run_summary)
+        Scheduler.events = asyncio.Queue()
+        MqttClient.rp_logs = {}
+        MqttClient.rp_stop_handlers = {}
+        MqttClient.rp_run_summary = {}
+        self.sent_logs = []
+
+    def teardown_method(self, test_method):
+        (Scheduler.events, MqttClient.rp_logs, MqttClient.rp_stop_handlers,
+         MqttClient.rp_run_summary) = self.saved
+
+    async def send_logs(self, runner_id, log_files):
+        self.sent_logs.append(log_files)
+
+class TestScheduler(BaseTest):
+    @pytest.mark.asyncio
+    async def test_results_sent_on_events(self, mocker):
+        mocker.patch.object(Scheduler, "_send_logs", self.send_logs)
+        mocker.patch("bot.telegram.scheduler.LOGS_TIMEOUT", 0)
+        task = asyncio.create_task(Scheduler.start(self.bot, 1))
+        MqttClient.rp_stop_handlers[1] = "Run finished"
+        Scheduler.notify(1)
+        await asyncio.sleep(0.01)
+        assert self.bot.messages == ["Остановлено по причине: Run finished"]
+        MqttClient.rp_logs[1] = {"candump": "candump_1.log"}
+        Scheduler.notify(1)
+        Scheduler.notify(1)
+        await asyncio.sleep(0.01)
+        assert self.sent_logs == [{"candump": "candump_1.log"}]
+        assert len(self.bot.messages) == 1
+        assert 1 not in MqttClient.rp_logs
+        task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_logs_sent_before_stop_reason(self, mocker):
+        order = []
+        async def send_logs(runner_id, log_files):
+            order.append("logs")
+        async def send_stop_reason(runner_id):
+            order.append("stop_reason")
+        mocker.patch.object(Scheduler, "_send_logs", send_logs)
+        mocker.patch.object(Scheduler, "send_stop_reason", send_stop_reason)
+        MqttClient.rp_logs[2] = {"candump": "candump_2.log"}
+        MqttClient.rp_stop_handlers[2] = "Run finished"
+        await Scheduler.check_rp_state(2)
+        assert order == ["logs", "stop_reason"]
+
+    @pytest.mark.asyncio
+    async def test_stop_reason_waits_for_logs(self, mocker):
+        order = []
+        async def send_logs(runner_id, log_files):
+            order.append("logs")
+        async def send_stop_reason(runner_id):
+            order.append("stop_reason")
+            MqttClient.rp_stop_handlers.pop(runner_id)
+        mocker.patch.object(Scheduler, "_send_logs", send_logs)
+        mocker.patch.object(Scheduler, "send_stop_reason", send_stop_reason)
+        task = asyncio.create_task(Scheduler.start(self.bot, 1))
+        MqttClient.rp_stop_handlers[7] = "Run finished"
+        Scheduler.notify(7)
+        await asyncio.sleep(0.01)
+        assert order == []
+        MqttClient.rp_logs[7] = {"candump": "candump_7.log"}
+        MqttClient.store.notify(7)
+        Scheduler.notify(7)
+        await asyncio.sleep(0.01)
+        assert order == ["logs", "stop_reason"]
+        task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_stop_reason_sent_after_failed_upload(self, mocker, tmp_path):
+        async def send_files(*args, **kwargs):
+            raise TimeoutError("Upload failed")
+        mocker.patch.object(TelegramUploader, "send_files", send_files)
+        log = tmp_path / "candump_8.log"
+        log.write_text("(1.0) can0 1F04602A#00\n")
+        Scheduler.bot = UploadBot()
+        MqttClient.rp_logs[8] = {"candump": str(log)}
+        MqttClient.rp_stop_handlers[8] = "Run finished"
+        await asyncio.wait_for(Scheduler.check_rp_state(8), 1)
+        messages = Scheduler.bot.messages
+        assert messages[1] == "Не удалось отправить логи обкатчика 8: Upload failed\n" \
+                              f"Логи на сервере:\n{log}"
+        assert messages[-1] == "Остановлено по причине: Run finished"
+        assert 8 not in MqttClient.rp_stop_handlers
+
+    @pytest.mark.asyncio
+    async def test_chart_sent_with_stop_reason(self, mocker, tmp_path):
+        mocker.patch.object(Scheduler, "_send_logs", self.send_logs)
+        status_log = tmp_path / "status.csv"
+        status_log.write_text("t,engine_speed_rpm,oil_temperature\n" +
+                              "".join(f"{i},{i * 100},300\n" for i in range(100)))
+        Scheduler.bot = self.bot
+        MqttClient.rp_stop_handlers[3] = "Run finished"
+        check = asyncio.create_task(Scheduler.check_rp_state(3))
+        await asyncio.sleep(0.01)
+        assert self.bot.messages == []
+        MqttClient.rp_logs[3] = {"uavcan.equipment.ice.reciprocating.Status": str(status_log)}
+        MqttClient.store.notify(3)
+        await check
+        assert len(self.bot.messages) == 1
+        image, caption = self.bot.messages[0]
+        assert image == b"\x89PNG\r\n\x1a\n"
+        assert caption.startswith("Остановлено по причине: Run finished\n\nСводка обкатки (1.6 мин)")
+        assert "RPM: min 0 / mean 4950" in caption
+        assert 3 not in Scheduler.charts
+
+    @pytest.mark.asyncio
+    async def test_runner_summary_sent_at_once(self):
+        Scheduler.bot = self.bot
+        MqttClient.rp_stop_handlers[4] = "Run finished"
+        MqttClient.rp_run_summary[4] = {
+            "duration": 600, "state_time": {"RUNNING": 540, "STARTING": 60},
+            "starter_engagements": 2, "start_attempts": 1,
+            "channels": {"rpm": {"count": 6000, "mean": 4500, "std": 50, "min": 0, "max": 4700},
+                         "temp": {"count": 6000, "mean": 373.15, "std": 5,
+                                  "min": 293.15, "max": 383.15}}}
+        await asyncio.wait_for(Scheduler.check_rp_state(4), 1)
+        assert self.bot.messages == ["Остановлено по причине: Run finished\n\n"
+                                     "Сводка обкатки (10.0 мин):\n"
+                                     "RPM: min 0 / mean 4500 ± 50 / max 4700\n"
+                                     "TEMP, °C: min 20 / mean 100 ± 5 / max 110\n"
+                                     "Состояния: RUNNING 9.0 мин, STARTING 1.0 мин\n"
+                                     "Включений стартера: 2, попыток запуска: 1"]
+        assert 4 not in MqttClient.rp_run_summary
+
+    @pytest.mark.asyncio
+    async def test_runner_summary_ends_wait(self):
+        Scheduler.bot = self.bot
+        MqttClient.rp_stop_handlers[6] = "Run finished"
+        check = asyncio.create_task(Scheduler.check_rp_state(6))
+        await asyncio.sleep(0.01)
+        assert self.bot.messages == []
+        MqttClient.rp_run_summary[6] = {"duration": 60, "state_time": {},
+                                        "starter_engagements": 1, "start_attempts": 1,
+                                        "channels": {}}
+        MqttClient.store.notify(6)
+        await asyncio.wait_for(check, 1)
+        assert self.bot.messages[0].startswith("Остановлено по причине: Run finished\n\n"
+                                               "Сводка обкатки (1.0 мин)")
+
+    @pytest.mark.asyncio
+    async def test_engine_history_appended(self):
+        Scheduler.bot = self.bot
+        MqttClient.rp_stop_handlers[5] = "Run finished"
+        MqttClient.rp_run_summary[5] = {
+            "duration": 60, "state_time": {}, "starter_engagements": 4, "start_attempts": 1,
+            "channels": {},
+            "history": {"runs": 6, "engaged_hours": 1.5, "start_attempts_per_run": 1.2,
+                        "drifts": [{"metric": "max_temperature", "value": 393.15,
+                                    "baseline": 373.15, "limit": 380.6}]}}
+        await asyncio.wait_for(Scheduler.check_rp_state(5), 1)
+        assert self.bot.messages[0].endswith(
+            "Включений стартера: 4, попыток запуска: 1\n"
+            "Двигатель: обкаток 6, наработка 1.5 ч, попыток запуска за обкатку 1.2\n"
+            "Отклонение: макс. TEMP, °C 120.00, в первых обкатках 100.00")
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
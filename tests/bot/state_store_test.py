@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+import threading
+
+import pytest
+from paho.mqtt.client import MQTTMessage
+from bot.StateStore import StateStore
+from bot.mqtt.client import MqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.store = StateStore()
+
+class TestStateStore(BaseTest):
+    def test_versions(self):
+        assert self.store.get_version(1) == 0
+        assert self.store.notify(1) == 1
+        assert self.store.notify(1) == 2
+        self.store.forget(1)
+        assert self.store.get_version(1) == 0
+
+    @pytest.mark.asyncio
+    async def test_wait_change(self):
+        asyncio.get_running_loop().call_later(0.05, self.store.notify, 1)
+        assert await self.store.wait_change(1, 0, 1)
+        assert not await self.store.wait_change(1, 1, 0.05)
+
+    @pytest.mark.asyncio
+    async def test_wait_for(self):
+        values = {}
+        def change(value):
+            values[1] = value
+            self.store.notify(1)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, change, "STARTING")
+        loop.call_later(0.04, change, "RUNNING")
+        assert await self.store.wait_for(1, lambda: values.get(1) == "RUNNING", 1)
+        assert not await self.store.wait_for(1, lambda: values.get(1) == "STOPPED", 0.05)
+
+class TestRoute(BaseTest):
+    def setup_method(self, test_method):
+        super().setup_method(test_method)
+        self.routes = list(MqttClient.routes)
+
+    def teardown_method(self, test_method):
+        MqttClient.client.message_callback_remove("test/+/topic")
+        MqttClient.routes = self.routes
+
+    @pytest.mark.asyncio
+    async def test_handled_in_loop(self):
+        handled = []
+        @MqttClient.route("test/+/topic")
+        def handler(client, userdata, message):
+            handled.append((message.payload, threading.current_thread()))
+            raise ValueError("broken message")
+        MqttClient.loop = asyncio.get_running_loop()
+        msg = MQTTMessage(topic=b"test/1/topic")
+        msg.payload = b"1"
+        thread = threading.Thread(target=MqttClient.client._handle_on_message, args=(msg,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.05)
+        assert handled == [(b"1", threading.current_thread())]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from bot.telegram.throttler import MessageEditor, RateLimiter, TokenBucket
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class FakeChat:
+    def __init__(self, chat_id: int) -> None:
+        self.id = chat_id
+
+class FakeMessage:
+    """The message records its edits, every edit takes the token of the chat bucket"""
+    def __init__(self, chat_id: int = 1, message_id: int = 1) -> None:
+        self.chat = FakeChat(chat_id)
+        self.message_id = message_id
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        await RateLimiter.get_bucket(self.chat.id).acquire()
+        self.edits.append(text)
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.chat_buckets = RateLimiter.chat_buckets
+        self.global_bucket = RateLimiter.global_bucket
+        RateLimiter.chat_buckets = {}
+        RateLimiter.global_bucket = TokenBucket(1000, 1000)
+        MessageEditor.texts = {}
+        MessageEditor.pending = {}
+        MessageEditor.tasks = {}
+
+    def teardown_method(self, test_method):
+        RateLimiter.chat_buckets = self.chat_buckets
+        RateLimiter.global_bucket = self.global_bucket
+
+class TestTokenBucket(BaseTest):
+    @pytest.mark.asyncio
+    async def test_rate(self):
+        bucket = TokenBucket(20, 2)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        # 2 tokens are available at once, others are refilled with 20 per second
+        assert 0.18 < time.monotonic() - start < 0.4
+
+    def test_block(self):
+        bucket = TokenBucket(10, 5)
+        bucket.block(1)
+        assert bucket.get_delay() == pytest.approx(1.1, abs=0.01)
+
+class TestRateLimiter(BaseTest):
+    @pytest.mark.asyncio
+    async def test_retry_after(self, mocker):
+        mocker.patch("bot.telegram.throttler.CHAT_RATE", 100)
+        method = SendMessage(chat_id=1, text="text")
+        replies = [TelegramRetryAfter(method, "Too Many Requests", 0.05), "ok"]
+        calls = []
+        async def make_request(bot, method):
+            calls.append(time.monotonic())
+            reply = replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        assert await RateLimiter()(make_request, None, method) == "ok"
+        assert calls[1] - calls[0] >= 0.05
+
+    @pytest.mark.asyncio
+    async def test_chats_limited_separately(self, mocker):
+        mocker.patch("bot.telegram.throttler.CHAT_RATE", 10)
+        mocker.patch("bot.telegram.throttler.CHAT_BURST", 1)
+        sent = []
+        async def make_request(bot, method):
+            sent.append(method.chat_id)
+        limiter = RateLimiter()
+        start = time.monotonic()
+        await asyncio.gather(*[limiter(make_request, None, SendMessage(chat_id=chat_id, text=""))
+                               for chat_id in (1, 1, 2, 2)])
+        assert sorted(sent) == [1, 1, 2, 2]
+        assert 0.09 < time.monotonic() - start < 0.2
+
+class TestMessageEditor(BaseTest):
+    @pytest.mark.asyncio
+    async def test_same_text_skipped(self):
+        message = FakeMessage()
+        await MessageEditor.edit(message, "1")
+        assert MessageEditor.edit(message, "1") is None
+        await MessageEditor.edit(message, "2")
+        assert message.edits == ["1", "2"]
+
+    @pytest.mark.asyncio
+    async def test_edits_coalesced(self, mocker):
+        mocker.patch("bot.telegram.throttler.CHAT_RATE", 10)
+        mocker.patch("bot.telegram.throttler.CHAT_BURST", 1)
+        message = FakeMessage()
+        task = None
+        for i in range(20):
+            task = MessageEditor.edit(message, str(i)) or task
+            await asyncio.sleep(0.01)
+        await task
+        assert message.edits[0] == "0"
+        assert message.edits[-1] == "19"
+        assert len(message.edits) < 5
+
+    @pytest.mark.asyncio
+    async def test_failed_edit(self):
+        message = FakeMessage()
+        async def edit_text(text, **kwargs):
+            raise RuntimeError("network")
+        message.edit_text = edit_text
+        await MessageEditor.edit(message, "1")
+        assert (1, 1) not in MessageEditor.texts
+        assert (1, 1) not in MessageEditor.tasks
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendDocument
+from bot.telegram.uploader import FilePart, Progress, TelegramUploader, split_files
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class FakeBot:
+    """The bot reads uploaded files as the session does, the first requests fail"""
+    def __init__(self, errors=()) -> None:
+        self.errors = list(errors)
+        self.documents = []
+        self.groups = []
+
+    async def read(self, part: FilePart) -> bytes:
+        return b"".join([chunk async for chunk in part.read(self)])
+
+    async def send_document(self, chat_id, document, caption=None):
+        data = await self.read(document)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.documents.append((document.filename, data, caption))
+
+    async def send_media_group(self, chat_id, media):
+        self.groups.append([(item.media.filename, await self.read(item.media), item.caption)
+                            for item in media])
+
+class BaseTest():
+    def write_files(self, directory, sizes):
+        files = {}
+        for i, size in enumerate(sizes):
+            files[f"log{i}"] = os.path.join(directory, f"log{i}.log")
+            with open(files[f"log{i}"], "wb") as file:
+                file.write(os.urandom(size))
+        return files
+
+class TestSplitFiles(BaseTest):
+    def test_large_file_split(self, tmp_path, mocker):
+        mocker.patch("bot.telegram.uploader.MAX_FILE_SIZE", 100)
+        mocker.patch("bot.telegram.uploader.MAX_GROUP_SIZE", 200)
+        files = self.write_files(tmp_path, [250, 10])
+        groups = split_files(files)
+        assert [[part.filename for part in group] for group in groups] == [
+            ["log0.log.part1of3", "log0.log.part2of3"], ["log0.log.part3of3", "log1.log"]]
+        assert [part.length for part in groups[0] + groups[1]] == [100, 100, 50, 10]
+
+    def test_files_limit(self, tmp_path):
+        files = self.write_files(tmp_path, [1] * 12)
+        assert [len(group) for group in split_files(files)] == [10, 2]
+
+class TestUploader(BaseTest):
+    @pytest.mark.asyncio
+    async def test_parts_streamed(self, tmp_path, mocker):
+        mocker.patch("bot.telegram.uploader.MAX_FILE_SIZE", 1000)
+        mocker.patch("bot.telegram.uploader.MAX_GROUP_SIZE", 1000)
+        files = self.write_files(tmp_path, [2500])
+        progress = Progress(2500)
+        bot = FakeBot()
+        await TelegramUploader.send_files(bot, 1, files, "Done", progress)
+        with open(files["log0"], "rb") as file:
+            data = file.read()
+        sent = sorted(bot.documents)
+        assert b"".join(part for _, part, _ in sent) == data
+        assert [caption for _, _, caption in sent] == ["Done (1/3)", "Done (2/3)", "Done (3/3)"]
+        assert progress.get_percent() == 100
+
+    @pytest.mark.asyncio
+    async def test_retry(self, tmp_path, mocker):
+        mocker.patch("bot.telegram.uploader.RETRY_DELAY", 0.01)
+        files = self.write_files(tmp_path, [100])
+        method = SendDocument(chat_id=1, document="file")
+        bot = FakeBot(errors=[TelegramServerError(method, "Bad Gateway"),
+                              TelegramServerError(method, "Bad Gateway")])
+        progress = Progress(100)
+        await TelegramUploader.send_files(bot, 1, files, "Done", progress)
+        assert len(bot.documents) == 1
+        assert progress.sent == 100
+
+    @pytest.mark.asyncio
+    async def test_flood_limit_not_retried(self, tmp_path):
+        files = self.write_files(tmp_path, [100])
+        method = SendDocument(chat_id=1, document="file")
+        bot = FakeBot(errors=[TelegramRetryAfter(method, "Too Many Requests", 0)])
+        # RateLimiter of the session has already retried the request
+        with pytest.raises(TelegramRetryAfter):
+            await TelegramUploader.send_files(bot, 1, files, "Done")
+        assert not bot.documents
+
+    @pytest.mark.asyncio
+    async def test_media_group(self, tmp_path):
+        files = self.write_files(tmp_path, [10, 20])
+        bot = FakeBot()
+        await TelegramUploader.send_files(bot, 1, files, "Done")
+        assert [(name, caption) for name, _, caption in bot.groups[0]] == [
+            ("log0.log", None), ("log1.log", "Done")]
+
+    @pytest.mark.asyncio
+    async def test_groups_in_order(self, tmp_path):
+        class SlowBot(FakeBot):
+            async def send_media_group(self, chat_id, media):
+                # the first group is the slowest, it is still sent first
+                await asyncio.sleep(0.01 * len(media))
+                await super().send_media_group(chat_id, media)
+        files = self.write_files(tmp_path, [1] * 12)
+        bot = SlowBot()
+        await TelegramUploader.send_files(bot, 1, files, "Done")
+        assert [group[-1][2] for group in bot.groups] == ["Done (1/2)", "Done (2/2)"]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
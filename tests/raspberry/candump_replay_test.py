@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import time
+
+import dronecan
+import pytest
+from dronecan.transport import Transfer
+from common.RunnerState import RunnerState
+from ice_sim.candump_replay import (CandumpReplay, VirtualClock, compare_commands,
+                                    get_run_times, use_clock)
+from raspberry.can_control import IceCommander
+from raspberry.can_control.EngineState import EngineState
+from raspberry.can_control.node import CanNode
+from raspberry.mqtt.handlers import MqttClient
+from raspberry.RunnerConfiguration import RunnerConfiguration
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+START_TIME = 1700000000.0
+RUN_TIME = 5 # sec from the log start, the recorded runner got the run command
+GAS_THROTTLE = int(50 * 8191 / 100)
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.client = MqttClient.client
+        self.to_run = MqttClient.to_run
+        self.node = CanNode.node
+        self.transport = CanNode.transport
+        self.make_config()
+
+    def teardown_method(self, test_method):
+        MqttClient.client = self.client
+        MqttClient.to_run = self.to_run
+        CanNode.node = self.node
+        CanNode.transport = self.transport
+
+    def make_config(self):
+        config = {}
+        for name in RunnerConfiguration.attribute_names:
+            config[name] = {}
+            for component in RunnerConfiguration.components:
+                config[name][component] = ""
+            config[name]["type"] = "int"
+            config[name]["value"] = 0
+        config["gas_throttle_pct"]["value"] = 50
+        config["time"]["value"] = 10
+        config["max_rpm"]["value"] = 7500
+        config["max_temperature"]["value"] = 1000
+        config["max_vibration"]["value"] = 1000
+        config["start_attemts"]["value"] = 3
+        config["report_period"]["value"] = 1
+        self.config = RunnerConfiguration(dict_conf=config)
+
+    def write_candump(self, path, duration=20):
+        """The engine is stopped until the run command, then the starter runs for 3 seconds.
+            The recorded runner commands the gas throttle since the run command"""
+        lines = []
+        for i in range(int(duration * 10)):
+            offset = i * 0.1
+            if offset < RUN_TIME:
+                state = EngineState.STOPPED
+            elif offset < RUN_TIME + 3:
+                state = EngineState.STARTER_RUNNING
+            else:
+                state = EngineState.STARTER_WAITING
+            status = dronecan.uavcan.equipment.ice.reciprocating.Status(
+                state=state.value, engine_speed_rpm=4000 if state.value else 0,
+                oil_temperature=350)
+            throttle = GAS_THROTTLE if offset >= RUN_TIME else -1
+            command = dronecan.uavcan.equipment.esc.RawCommand(cmd=[0] * 7 + [throttle])
+            for node_id, payload, timestamp in ((42, status, START_TIME + offset),
+                                                (100, command, START_TIME + offset + 0.05)):
+                for frame in Transfer(transfer_id=i % 32, source_node_id=node_id,
+                                      payload=payload).to_frames():
+                    lines.append(f"({timestamp:.6f}) can0 {frame.message_id:08X}#"
+                                 f"{bytes(frame.bytes).hex().upper()}\n")
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+        return str(path)
+
+class TestVirtualClock(BaseTest):
+    @pytest.mark.asyncio
+    async def test_speed(self):
+        clock = VirtualClock(START_TIME, speed=10)
+        start = time.monotonic()
+        for _ in range(10):
+            await clock.sleep(0.2)
+        assert clock.time() == pytest.approx(START_TIME + 2)
+        assert 0.18 < time.monotonic() - start < 0.3
+
+    def test_modules_use_clock(self):
+        clock = VirtualClock(START_TIME, speed=0)
+        with use_clock(clock):
+            assert IceCommander.time.time() == START_TIME
+            assert IceCommander.asyncio.sleep == clock.sleep
+        assert IceCommander.time is time
+        assert IceCommander.asyncio is asyncio
+
+class TestCommands(BaseTest):
+    def test_run_times(self):
+        commands = [(0, -1, 0), (1, 100, 0), (2, 100, 0), (3, -1, 0), (4, 0, 0), (5, 200, 0)]
+        assert get_run_times(commands) == [1, 5]
+
+    def test_compare(self):
+        recorded = [(1.0, 0, 0), (2.0, 100, 0), (3.0, 100, 0)]
+        replayed = [(0.5, 0, 0), (1.9, 100, 0), (2.9, 90, 0)]
+        assert compare_commands(recorded, replayed) == \
+            {"compared": 3, "mismatches": 1, "max_difference": 10}
+
+class TestCandumpReplay(BaseTest):
+    @pytest.mark.asyncio
+    async def test_commander_on_recorded_run(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log")
+        replay = CandumpReplay(log, self.config, speed=0, log_dir=str(tmp_path))
+        start = time.monotonic()
+        result = await replay.run()
+        assert time.monotonic() - start < result["duration"] / 4
+        # the status is sent in 6 frames
+        assert result["frames"] == 1200
+        assert len(result["recorded_commands"]) == 200
+        states = [state for _, state in result["state_changes"]]
+        assert states[0] == RunnerState.STOPPED.name
+        assert RunnerState.RUNNING.name in states
+        # the run is stopped by the time limit of the configuration exceeded for 2 seconds
+        assert len(result["stop_reasons"]) == 1
+        stop_time = result["stop_reasons"][0][0]
+        assert stop_time - START_TIME == pytest.approx(RUN_TIME + 10 + 2, abs=0.5)
+        throttles = [throttle for timestamp, throttle, _ in result["replayed_commands"]
+                     if RUN_TIME + 1 < timestamp - START_TIME < RUN_TIME + 9]
+        assert throttles and all(throttle == GAS_THROTTLE for throttle in throttles)
+        assert result["comparison"]["compared"] == 200
+        assert MqttClient.client is self.client
+        assert CanNode.transport is None
+
+    @pytest.mark.asyncio
+    async def test_recorded_timing(self, tmp_path):
+        log = self.write_candump(tmp_path / "candump.log", duration=2)
+        replay = CandumpReplay(log, self.config, speed=4, run_times=[], log_dir=str(tmp_path))
+        result = await replay.run()
+        assert result["duration"] == pytest.approx(2, abs=0.3)
+        assert result["elapsed"] == pytest.approx(0.5, abs=0.15)
+        assert all(throttle <= 0 for _, throttle, _ in result["replayed_commands"])
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
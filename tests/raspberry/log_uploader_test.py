@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+import os
+
+import pytest
+from common.log_transfer import CHUNK_SIZE
+from raspberry.LogUploader import LogUploader
+from server.LogReceiver import LogReceiver
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class LoopbackClient:
+    """The client passes uploader messages directly to the receiver,
+        every chunk with number from drop list is lost"""
+    def __init__(self, receiver: LogReceiver, drop=()) -> None:
+        self.receiver = receiver
+        self.uploader: LogUploader | None = None
+        self.drop = list(drop)
+        self.n_chunks = 0
+
+    def publish(self, topic: str, payload, qos: int = 0):
+        transfer_id = topic.split("/")[4]
+        if topic.endswith("offer"):
+            ack = self.receiver.offer(1, transfer_id, json.loads(payload))
+        else:
+            self.n_chunks += 1
+            if self.n_chunks in self.drop:
+                return
+            ack = self.receiver.chunk(1, transfer_id, payload)
+        if ack is not None:
+            self.uploader.on_ack(transfer_id, ack)
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.data = os.urandom(CHUNK_SIZE * 20 + 1)
+
+    def write_logs(self, directory):
+        logs = {}
+        for name in ("candump", "NodeStatus"):
+            logs[name] = os.path.join(directory, f"{name}_1.log")
+            with open(logs[name], "wb") as file:
+                file.write(self.data)
+        return logs
+
+    async def upload(self, tmp_path, drop=()):
+        receiver = LogReceiver(os.path.join(tmp_path, "server"))
+        client = LoopbackClient(receiver, drop)
+        uploader = LogUploader(client, 1)
+        client.uploader = uploader
+        task = asyncio.create_task(uploader.run())
+        uploader.add(self.write_logs(tmp_path))
+        completed = []
+        for _ in range(100):
+            await asyncio.sleep(0.1)
+            completed += receiver.pop_completed()
+            if completed:
+                break
+        task.cancel()
+        return completed
+
+class TestLogUploader(BaseTest):
+    @pytest.mark.asyncio
+    async def test_upload(self, tmp_path):
+        completed = await self.upload(tmp_path)
+        assert len(completed) == 1
+        for path in completed[0][1].values():
+            with open(path, "rb") as file:
+                assert file.read() == self.data
+
+    @pytest.mark.asyncio
+    async def test_upload_with_lost_chunks(self, tmp_path, mocker):
+        mocker.patch("raspberry.LogUploader.ACK_TIMEOUT", 0.2)
+        completed = await self.upload(tmp_path, drop=(3, 4, 30))
+        assert len(completed) == 1
+        for path in completed[0][1].values():
+            with open(path, "rb") as file:
+                assert file.read() == self.data
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
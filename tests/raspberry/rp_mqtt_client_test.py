@@ -138,6 +138,17 @@ class TestZeroConfiguration(BaseTest):
         flag_result = await self.wait_for_bool(flag_exp, timeout=3)
         assert flag_result, f"The callback was not called as expected."
 
+    def test_heartbeat(self):
+        callback_called = Event()
+        self.add_callback(callback_called,
+                          f"ice_runner/raspberry_pi/{MqttClient.run_id}/heartbeat", "42")
+        self.mqtt.client.loop_start()
+
+        self.mqtt.publish_message("ice_runner/server/rp_commander/heartbeat", "42")
+        # Wait for callback, with a timeout to avoid infinite wait
+        callback_result = callback_called.wait(timeout=3)
+        assert callback_result, f"The callback was not called as expected."
+
     def test_full_configuration(self):
         callback_called = Event()
         self.add_callback(callback_called, "ice_runner/raspberry_pi/+/full_config")
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pytest
+from common.RunnerState import RunnerState
+from raspberry.can_control.EngineState import EngineState, EngineStatus
+from raspberry.RunSummary import ChannelAccumulator, RunSummary
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.summary = RunSummary()
+        self.summary.reset(1000)
+        self.status = EngineStatus()
+
+class TestChannelAccumulator(BaseTest):
+    def test_welford(self):
+        values = np.random.default_rng(3).normal(4000, 300, 10000)
+        channel = ChannelAccumulator()
+        for value in values:
+            channel.add(value)
+        assert channel.mean == pytest.approx(values.mean())
+        assert channel.get_std() == pytest.approx(values.std(ddof=1))
+        assert (channel.min, channel.max) == (values.min(), values.max())
+
+class TestRunSummary(BaseTest):
+    def test_status_channels(self):
+        self.status.rpm = 4000
+        self.status.vibration = 2
+        self.summary.update_with_status("uavcan.equipment.ice.reciprocating.Status", self.status)
+        self.status.rpm = 5000
+        self.summary.update_with_status("uavcan.equipment.ice.reciprocating.Status", self.status)
+        self.summary.update_with_status("uavcan.protocol.NodeStatus", self.status)
+        channels = self.summary.to_dict(1010)["channels"]
+        assert channels["rpm"]["mean"] == 4500
+        assert channels["rpm"]["max"] == 5000
+        assert "vibration" not in channels
+
+    def test_states(self):
+        updates = [(1000, RunnerState.STARTING, EngineState.STOPPED, 0),
+                   (1001, RunnerState.STARTING, EngineState.STARTER_RUNNING, 0),
+                   (1005, RunnerState.STARTING, EngineState.STARTER_RUNNING, 1),
+                   (1010, RunnerState.RUNNING, EngineState.STARTER_WAITING, 1),
+                   (1070, RunnerState.STARTING, EngineState.STARTER_RUNNING, 1),
+                   (1080, RunnerState.RUNNING, EngineState.STARTER_WAITING, 1),
+                   (1100, RunnerState.STOPPING, EngineState.STOPPED, 1)]
+        for crnt_time, state, engine_state, start_attempts in updates:
+            self.summary.update_state(state, engine_state, start_attempts, crnt_time)
+        summary = self.summary.to_dict(1100)
+        assert summary["duration"] == 100
+        assert summary["state_time"] == {"STARTING": 20, "RUNNING": 80}
+        assert summary["starter_engagements"] == 2
+        assert summary["start_attempts"] == 1
+        assert self.summary.get_active_time() == 100
+        json.dumps(summary)
+
+    def test_idle_stop(self):
+        self.summary.update_state(RunnerState.STOPPED, EngineState.STOPPED, 0, 1000)
+        self.summary.update_state(RunnerState.STOPPED, EngineState.STOPPED, 0, 1050)
+        assert self.summary.get_active_time() == 0
+
+    def test_reset(self):
+        self.summary.update_state(RunnerState.RUNNING, EngineState.STARTER_RUNNING, 2, 1010)
+        self.summary.reset(1020)
+        summary = self.summary.to_dict(1020)
+        assert summary["starter_engagements"] == 0
+        assert summary["state_time"] == {}
+        assert summary["duration"] == 0
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import os
+
+import pytest
+from raspberry.TailService import (MAX_FOLLOWS, MAX_READ_SIZE, TailService, read_last_lines,
+                                   read_range)
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.replies = []
+
+    def publish(self, topic: str, payload: str):
+        self.replies.append((topic, json.loads(payload)))
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.lines = [f"{i},{i * 10},{i * 100}" for i in range(3000)]
+
+    def write_file(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(self.lines) + "\n")
+        return str(path)
+
+class TestReads(BaseTest):
+    def test_last_lines(self, tmp_path):
+        path = self.write_file(tmp_path / "log.csv")
+        offset, data, size = read_last_lines(path, 5)
+        assert data.decode().split("\n")[:-1] == self.lines[-5:]
+        assert offset + len(data) == size
+
+    def test_last_lines_of_short_file(self, tmp_path):
+        self.lines = self.lines[:3]
+        path = self.write_file(tmp_path / "log.csv")
+        offset, data, _ = read_last_lines(path, 10)
+        assert offset == 0
+        assert data.decode().split("\n")[:-1] == self.lines
+
+    def test_range(self, tmp_path):
+        path = self.write_file(tmp_path / "log.csv")
+        offset, data, size = read_range(path, -10, 100)
+        assert offset == size - 10
+        assert len(data) == 10
+        offset, data, _ = read_range(path, 0, 10 * MAX_READ_SIZE)
+        assert offset == 0
+        assert len(data) == MAX_READ_SIZE
+
+class TestTailService(BaseTest):
+    @pytest.mark.asyncio
+    async def test_lines_request(self, tmp_path):
+        path = self.write_file(tmp_path / "log.csv")
+        client = FakeClient()
+        service = TailService(client, 1, lambda: {"candump": path})
+        await service.handle_request({"req_id": "a", "file": "candump", "lines": 3})
+        topic, reply = client.replies[0]
+        assert topic == "ice_runner/raspberry_pi/1/tail/a"
+        assert reply["data"].split("\n")[:-1] == self.lines[-3:]
+        await service.handle_request({"req_id": "b", "file": "unknown"})
+        assert client.replies[1][1]["files"] == ["candump"]
+
+    @pytest.mark.asyncio
+    async def test_follow(self, tmp_path, mocker):
+        mocker.patch("raspberry.TailService.MIN_FOLLOW_PERIOD", 0.05)
+        path = self.write_file(tmp_path / "log.csv")
+        client = FakeClient()
+        service = TailService(client, 1, lambda: {"candump": path})
+        await service.handle_request({"req_id": "a", "mode": "follow", "lines": 1,
+                                      "period": 0.05})
+        with open(path, "a", encoding="utf-8") as file:
+            file.write("new line\n")
+        await asyncio.sleep(0.2)
+        assert client.replies[-1][1]["data"] == "new line\n"
+        await service.handle_request({"req_id": "a", "mode": "unfollow"})
+        await asyncio.sleep(0.1)
+        assert client.replies[-1][1]["done"]
+        assert not service.follows
+
+    @pytest.mark.asyncio
+    async def test_follows_limit(self, tmp_path):
+        path = self.write_file(tmp_path / "log.csv")
+        client = FakeClient()
+        service = TailService(client, 1, lambda: {"candump": path})
+        for i in range(MAX_FOLLOWS + 1):
+            service.on_request({"req_id": str(i), "mode": "follow", "lines": 1})
+        await asyncio.sleep(0.1)
+        assert not service.tasks
+        assert len(service.follows) == MAX_FOLLOWS
+        rejected = [reply for _, reply in client.replies if "error" in reply]
+        assert len(rejected) == 1
+        assert rejected[0]["done"]
+        # the running follow is renewed
+        await service.handle_request({"req_id": "0", "mode": "follow", "lines": 1})
+        assert "error" not in client.replies[-1][1]
+        for follow in list(service.follows.values()):
+            follow.task.cancel()
+        await asyncio.sleep(0.01)
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
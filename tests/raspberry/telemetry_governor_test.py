@@ -0,0 +1,181 @@
+import logging
+import os
+
+import pytest
+from paho.mqtt.client import MQTTMessageInfo
+from common.RunnerState import RunnerState
+from raspberry.can_control.EngineState import EngineStatus
+from raspberry.RunnerConfiguration import RunnerConfiguration
+from raspberry.TelemetryGovernor import (
+    MAX_REPORT_PERIOD, MIN_REPORT_PERIOD, TelemetryGovernor, is_fault_approaching)
+from raspberry.mqtt import client as mqtt_client
+from raspberry.mqtt.client import STALE_PUBLISH_TIMEOUT, MqttClient, on_publish
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.governor = TelemetryGovernor()
+        self.make_config()
+        self.config = RunnerConfiguration(dict_conf=self.config_dict)
+        self.status = EngineStatus()
+
+    def make_config(self):
+        config = {}
+        for name in RunnerConfiguration.attribute_names:
+            config[name] = {}
+            for component in RunnerConfiguration.components:
+                config[name][component] = ""
+            config[name]["type"] = "int"
+            config[name]["value"] = 0
+        config["report_period"]["value"] = 10
+        self.config_dict = config
+
+class TestRunnerState(BaseTest):
+    def test_running_uses_configured_period(self):
+        assert self.governor.get_period(10, RunnerState.RUNNING) == 10
+
+    def test_starting_is_faster(self):
+        assert self.governor.get_period(10, RunnerState.STARTING) < 10
+
+    def test_fault_approaching_is_faster(self):
+        assert self.governor.get_period(10, RunnerState.RUNNING, fault_approaching=True) < 10
+
+    def test_idle_is_slower(self):
+        assert self.governor.get_period(10, RunnerState.STOPPED) > 10
+        assert self.governor.get_period(10, RunnerState.NOT_CONNECTED) > 10
+
+    def test_period_borders(self):
+        assert self.governor.get_period(0, RunnerState.STARTING) == MIN_REPORT_PERIOD
+        assert self.governor.get_period(60, RunnerState.STOPPED) == MAX_REPORT_PERIOD
+
+class TestLinkBackoff(BaseTest):
+    def test_healthy_link(self):
+        self.governor.update_link(0.01, 0)
+        assert self.governor.backoff == 1
+        assert self.governor.get_period(10, RunnerState.RUNNING) == 10
+
+    def test_saturated_by_latency(self):
+        for _ in range(20):
+            self.governor.update_link(5, 0)
+        assert self.governor.backoff > 1
+        assert self.governor.get_period(10, RunnerState.RUNNING) > 10
+
+    def test_saturated_by_queue(self):
+        self.governor.update_link(0, 100)
+        assert self.governor.backoff > 1
+
+    def test_recovery(self):
+        self.governor.update_link(0, 100)
+        saturated_backoff = self.governor.backoff
+        self.governor.update_link(0, 0)
+        assert self.governor.backoff < saturated_backoff
+        for _ in range(100):
+            self.governor.update_link(0, 0)
+        assert self.governor.backoff == 1
+
+    def test_saturated_by_failures(self):
+        self.governor.update_link(0, 0, 3)
+        assert self.governor.backoff > 1
+
+class FakeClient:
+    """The client acknowledges publishes before returning from publish if ack_early"""
+    def __init__(self) -> None:
+        self.mid = 0
+        self.rc = 0
+        self.ack_early = False
+
+    def publish(self, topic, payload):
+        self.mid += 1
+        info = MQTTMessageInfo(self.mid)
+        info.rc = self.rc
+        if self.ack_early and self.rc == 0:
+            on_publish(self, None, self.mid, None, None)
+        return info
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+class TestLinkMeasurements(BaseTest):
+    def setup_method(self, test_method):
+        super().setup_method(test_method)
+        self.saved = (MqttClient.client, MqttClient.publish_times, MqttClient.early_acks,
+                      MqttClient.publish_failures, MqttClient.publish_latency, mqtt_client.time)
+        MqttClient.client = FakeClient()
+        MqttClient.publish_times = {}
+        MqttClient.early_acks = {}
+        MqttClient.publish_failures = 0
+        MqttClient.publish_latency = 0
+        mqtt_client.time = FakeTime()
+
+    def teardown_method(self, test_method):
+        (MqttClient.client, MqttClient.publish_times, MqttClient.early_acks,
+         MqttClient.publish_failures, MqttClient.publish_latency, mqtt_client.time) = self.saved
+
+    def test_acknowledged(self):
+        info = MqttClient.publish_tracked("topic", "payload")
+        mqtt_client.time.now += 0.2
+        assert MqttClient.get_link_measurements() == (pytest.approx(0.2), 1, 0)
+        on_publish(None, None, info.mid, None, None)
+        assert MqttClient.get_link_measurements() == (pytest.approx(0.2), 0, 0)
+
+    def test_early_ack(self):
+        MqttClient.client.ack_early = True
+        MqttClient.publish_tracked("topic", "payload")
+        assert MqttClient.publish_times == {}
+        assert MqttClient.early_acks == {}
+        assert MqttClient.get_link_measurements() == (0, 0, 0)
+
+    def test_stale_not_counted(self):
+        MqttClient.publish_tracked("topic", "payload")
+        mqtt_client.time.now += STALE_PUBLISH_TIMEOUT + 1
+        assert MqttClient.get_link_measurements() == (0, 0, 0)
+
+    def test_failures(self):
+        MqttClient.client.rc = 4
+        MqttClient.publish_tracked("topic", "payload")
+        MqttClient.publish_tracked("topic", "payload")
+        assert MqttClient.get_link_measurements() == (0, 0, 2)
+        assert MqttClient.get_link_measurements() == (0, 0, 0)
+
+class TestFaultApproaching(BaseTest):
+    def test_no_limits(self):
+        self.status.rpm = 10000
+        self.status.temp = 1000
+        assert not is_fault_approaching(self.status, self.config)
+
+    def test_rpm(self):
+        self.config.max_rpm = 7500
+        self.status.rpm = 5000
+        assert not is_fault_approaching(self.status, self.config)
+        self.status.rpm = 7000
+        assert is_fault_approaching(self.status, self.config)
+
+    def test_temperature(self):
+        self.config.max_temperature = 400
+        self.status.temp = 350
+        assert not is_fault_approaching(self.status, self.config)
+        self.status.temp = 395
+        assert is_fault_approaching(self.status, self.config)
+
+    def test_vibration_requires_imu(self):
+        self.config.max_vibration = 1000
+        self.status.vibration = 950
+        assert not is_fault_approaching(self.status, self.config)
+        self.status.rec_imu = True
+        assert is_fault_approaching(self.status, self.config)
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+
+import pytest
+from paho.mqtt.client import MQTTMessage
+from server.mqtt.client import REQUEST_TIMEOUT, ServerMqttClient
+from server.mqtt.handlers import get_request, handle_bot_config, handle_raspberry_pi_configuration
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+def make_message(topic: str, payload: str) -> MQTTMessage:
+    msg = MQTTMessage(topic=topic.encode())
+    msg.payload = payload.encode()
+    return msg
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.published = []
+
+    def publish(self, topic: str, payload=None, *args, **kwargs):
+        self.published.append((topic, payload))
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.client = FakeClient()
+        self.requests = ServerMqttClient.requests
+        ServerMqttClient.requests = {}
+
+    def teardown_method(self, test_method):
+        ServerMqttClient.requests = self.requests
+
+    def get_replies(self):
+        return [json.loads(payload) for topic, payload in self.client.published
+                if topic.startswith("ice_runner/server/bot_commander/reply/")]
+
+class TestGetRequest(BaseTest):
+    def test_plain_id(self):
+        assert get_request(make_message("ice_runner/bot/usr_cmd/config", "3")) == (3, None)
+
+    def test_json_request(self):
+        msg = make_message("ice_runner/bot/usr_cmd/config", '{"rp_id": 3, "req_id": "a"}')
+        assert get_request(msg) == (3, "a")
+
+class TestReplies(BaseTest):
+    def test_reply_echoes_request_id(self, mocker):
+        mocker.patch.object(ServerMqttClient, "client", self.client)
+        handle_bot_config(self.client, None,
+                          make_message("ice_runner/bot/usr_cmd/config",
+                                       '{"rp_id": 3, "req_id": "a"}'))
+        assert ("ice_runner/server/rp_commander/3/command", "config") in self.client.published
+        handle_raspberry_pi_configuration(self.client, None,
+                                          make_message("ice_runner/raspberry_pi/3/config",
+                                                       '{"rpm": 4500}'))
+        assert self.get_replies() == [{"req_id": "a", "rp_id": 3, "data": {"rpm": 4500}}]
+        assert (3, "config") not in ServerMqttClient.requests
+
+    def test_reply_of_other_runner_ignored(self, mocker):
+        mocker.patch.object(ServerMqttClient, "client", self.client)
+        ServerMqttClient.add_request(3, "config", "a", 0)
+        ServerMqttClient.publish_replies(4, "config", {})
+        assert self.get_replies() == []
+
+    def test_old_requests_forgotten(self, mocker):
+        mocker.patch.object(ServerMqttClient, "client", self.client)
+        ServerMqttClient.add_request(3, "status", "a", 0)
+        ServerMqttClient.add_request(3, "status", "b", REQUEST_TIMEOUT + 1)
+        ServerMqttClient.publish_replies(3, "status", {})
+        assert [reply["req_id"] for reply in self.get_replies()] == ["b"]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
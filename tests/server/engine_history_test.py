@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from server.EngineHistory import BASELINE_RUNS, EngineHistory, get_run_metrics
+from server.mqtt.client import ServerMqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+def make_summary(temp: float = 373.15, throttle: float = 50, starter_engagements: int = 1,
+                 vibration: float = 1.0, engaged_time: float | None = None):
+    return {"duration": 660, "state_time": {"STARTING": 60, "RUNNING": 540, "STOPPED": 60},
+            "starter_engagements": starter_engagements, "start_attempts": 1,
+            "engaged_time": engaged_time,
+            "channels": {"rpm": {"count": 100, "mean": 4500, "std": 45, "min": 0, "max": 4700},
+                         "temp": {"count": 100, "mean": temp - 10, "std": 5, "min": 293.15,
+                                  "max": temp},
+                         "vibration": {"count": 100, "mean": 0.5, "std": 0.1, "min": 0,
+                                       "max": vibration},
+                         "gas_throttle": {"count": 100, "mean": throttle, "std": 1,
+                                          "min": 0, "max": throttle + 5}}}
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.start_time = 1_000_000.0
+
+    @pytest.fixture
+    def history(self, tmp_path):
+        history = EngineHistory(os.path.join(tmp_path, "engine_history.sqlite"))
+        yield history
+        history.close()
+
+    def add_baseline(self, history, engine: int = 1):
+        for i in range(BASELINE_RUNS):
+            history.add_run(engine, self.start_time + i * 1000,
+                            make_summary(temp=373.15 + i % 2, vibration=1.0 + 0.01 * i))
+
+class TestRunMetrics(BaseTest):
+    def test_metrics(self):
+        metrics = get_run_metrics(make_summary())
+        assert metrics["active_time"] == 600
+        assert metrics["rpm_instability"] == pytest.approx(0.01)
+        assert metrics["max_temperature"] == 373.15
+        assert metrics["throttle_mean"] == 50
+
+    def test_missing_channels(self):
+        summary = make_summary()
+        summary["channels"] = {"temp": {"count": 0}}
+        metrics = get_run_metrics(summary)
+        assert metrics["max_temperature"] is None
+        assert metrics["rpm_instability"] is None
+
+class TestEngineHistory(BaseTest):
+    def test_totals(self, history):
+        self.add_baseline(history)
+        result = history.add_run(1, self.start_time + 10_000, make_summary(temp=380))
+        assert result["runs"] == BASELINE_RUNS + 1
+        assert result["engaged_hours"] == pytest.approx((BASELINE_RUNS + 1) * 600 / 3600)
+        assert result["start_attempts_per_run"] == 1
+        assert result["max_temperature"] == 380
+        assert history.get_engine(2) == {"engine": 2, "runs": 0}
+
+    def test_engaged_time_of_engine(self, history):
+        history.add_run(1, self.start_time, make_summary(engaged_time=7200))
+        assert history.get_engine(1)["engaged_hours"] == 2
+
+    def test_range_query(self, history):
+        self.add_baseline(history)
+        self.add_baseline(history, engine=2)
+        runs = history.get_runs(1, self.start_time + 1000, self.start_time + 3000)
+        assert [run["time"] for run in runs] == [self.start_time + 1000,
+                                                 self.start_time + 2000,
+                                                 self.start_time + 3000]
+        assert all(run["engine"] == 1 for run in runs)
+        assert len(history.get_runs(2, limit=2)) == 2
+
+    def test_no_drift(self, history):
+        self.add_baseline(history)
+        result = history.add_run(1, self.start_time + 10_000, make_summary(temp=374.15))
+        assert result["drifts"] == []
+
+    def test_drifts(self, history):
+        self.add_baseline(history)
+        result = history.add_run(1, self.start_time + 10_000,
+                                 make_summary(temp=393.15, starter_engagements=3))
+        assert sorted(drift["metric"] for drift in result["drifts"]) ==\
+                ["max_temperature", "starter_engagements"]
+
+    def test_temperature_at_other_throttle(self, history):
+        self.add_baseline(history)
+        result = history.add_run(1, self.start_time + 10_000,
+                                 make_summary(temp=393.15, throttle=80))
+        assert result["drifts"] == []
+
+    def test_short_baseline(self, history):
+        history.add_run(1, self.start_time, make_summary())
+        history.add_run(1, self.start_time + 1000, make_summary())
+        result = history.add_run(1, self.start_time + 2000, make_summary(temp=450))
+        assert result["drifts"] == []
+
+    def test_idle_stop_skipped(self, history):
+        summary = make_summary()
+        summary["state_time"] = {"STOPPED": 60}
+        assert history.add_run(1, self.start_time, summary) is None
+        assert history.get_engine(1) == {"engine": 1, "runs": 0}
+        assert history.get_runs(1) == []
+
+    def test_persistence(self, tmp_path):
+        path = os.path.join(tmp_path, "engine_history.sqlite")
+        history = EngineHistory(path)
+        history.add_run(3, self.start_time, make_summary())
+        history.close()
+        history = EngineHistory(path)
+        assert history.get_engine(3)["runs"] == 1
+        history.close()
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+class TestForwarding(BaseTest):
+    def setup_method(self, test_method):
+        super().setup_method(test_method)
+        self.saved = (ServerMqttClient.client, ServerMqttClient.history,
+                      ServerMqttClient.history_executor)
+        ServerMqttClient.client = FakeClient()
+
+    def teardown_method(self, test_method):
+        if ServerMqttClient.history_executor is not None:
+            ServerMqttClient.history_executor.shutdown(wait=True)
+        (ServerMqttClient.client, ServerMqttClient.history,
+         ServerMqttClient.history_executor) = self.saved
+
+    @pytest.mark.asyncio
+    async def test_forward_run_summary(self, history):
+        ServerMqttClient.history = history
+        ServerMqttClient.history_executor = ThreadPoolExecutor(max_workers=1)
+        task = ServerMqttClient.run_task(ServerMqttClient.forward_run_summary(2, make_summary()))
+        await asyncio.wait_for(task, 1)
+        topic, payload = ServerMqttClient.client.published[0]
+        assert topic == "ice_runner/server/bot_commander/rp_states/2/run_summary"
+        assert json.loads(payload)["history"]["runs"] == 1
+        assert task not in ServerMqttClient.background_tasks
+
+    @pytest.mark.asyncio
+    async def test_idle_summary_forwarded_without_history(self, history):
+        ServerMqttClient.history = history
+        ServerMqttClient.history_executor = ThreadPoolExecutor(max_workers=1)
+        summary = make_summary()
+        summary["state_time"] = {}
+        await ServerMqttClient.forward_run_summary(2, summary)
+        assert "history" not in json.loads(ServerMqttClient.client.published[0][1])
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+
+import pytest
+from paho.mqtt.client import MQTTMessage, topic_matches_sub
+from common.RunnerState import RunnerState
+from ice_sim.fleet_load import (FIRST_RUNNER_ID, Observer, VirtualRunner, get_percentiles,
+                                get_server_throughput, run_step)
+from ice_sim.traffic_replay import HandlerTarget
+from server.FleetTable import FleetTable
+from server.LivenessTracker import LivenessTracker
+from server.mqtt.client import ServerMqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class LoopbackBroker:
+    """The broker passes published messages in the process to the server handlers,
+        the virtual runners and the observer in the order of publishing"""
+    def __init__(self) -> None:
+        self.subscribers = []
+        self.queue = []
+        self.delivering = False
+
+    def subscribe(self, topic_filter, callback):
+        self.subscribers.append((topic_filter, callback))
+
+    def publish(self, topic, payload=None, retain=False):
+        del retain
+        msg = MQTTMessage(topic=topic.encode())
+        msg.payload = payload if isinstance(payload, bytes) else str(payload).encode()
+        self.queue.append(msg)
+        if self.delivering:
+            return
+        self.delivering = True
+        while self.queue:
+            msg = self.queue.pop(0)
+            for topic_filter, callback in self.subscribers:
+                if topic_matches_sub(topic_filter, msg.topic):
+                    callback(msg)
+        self.delivering = False
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.saved = (ServerMqttClient.client, ServerMqttClient.fleet,
+                      ServerMqttClient.rp_messages, ServerMqttClient.rp_configuration,
+                      ServerMqttClient.requests, ServerMqttClient.liveness)
+        self.broker = LoopbackBroker()
+        ServerMqttClient.client = self.broker
+        ServerMqttClient.fleet = FleetTable()
+        ServerMqttClient.rp_messages = {}
+        ServerMqttClient.rp_configuration = {}
+        ServerMqttClient.requests = {}
+        ServerMqttClient.liveness = LivenessTracker()
+        target = HandlerTarget("server")
+        self.broker.subscribe("ice_runner/raspberry_pi/#", target.publish)
+        self.broker.subscribe("ice_runner/bot/#", target.publish)
+        self.runners = [VirtualRunner(FIRST_RUNNER_ID + i, 0.01, {"rpm": 4500})
+                        for i in range(3)]
+        for runner in self.runners:
+            runner.client = self.broker
+            self.broker.subscribe("ice_runner/server/rp_commander/#",
+                                  lambda msg, runner=runner: runner.on_message(None, None, msg))
+        self.observer = Observer()
+        self.observer.client = self.broker
+        self.broker.subscribe("ice_runner/server/bot_commander/#",
+                              lambda msg: self.observer.on_message(None, None, msg))
+        self.broker.subscribe("ice_runner/server/stats",
+                              lambda msg: self.observer.on_message(None, None, msg))
+
+    def teardown_method(self, test_method):
+        (ServerMqttClient.client, ServerMqttClient.fleet, ServerMqttClient.rp_messages,
+         ServerMqttClient.rp_configuration, ServerMqttClient.requests,
+         ServerMqttClient.liveness) = self.saved
+
+    def get_stats(self, handled, dropped, max_depth):
+        return {"ice_runner/raspberry_pi/+/state": {"handled": handled, "dropped": dropped,
+                                                    "max_depth": max_depth},
+                "ice_runner/raspberry_pi/+/status": {"handled": handled, "dropped": 0,
+                                                     "max_depth": 0}}
+
+class TestReport(BaseTest):
+    def test_percentiles(self):
+        assert get_percentiles([]) == "-"
+        assert get_percentiles([i / 1000 for i in range(1, 101)]) == "50/95/99"
+
+    def test_server_throughput(self):
+        assert get_server_throughput([(0, self.get_stats(0, 0, 0))]) == \
+            {"handled": 0, "dropped": 0, "max_depth": 0}
+        stats = [(10, self.get_stats(100, 1, 5)), (15, self.get_stats(150, 1, 20)),
+                 (20, self.get_stats(300, 4, 7))]
+        assert get_server_throughput(stats) == {"handled": 40, "dropped": 3, "max_depth": 20}
+
+class TestFleet(BaseTest):
+    def test_reports_reach_observer(self):
+        for runner in self.runners:
+            runner.handle_command("start")
+            runner.report()
+        ServerMqttClient.publish_fleet()
+        assert len(self.observer.report_latencies) == len(self.runners)
+        assert all(0 <= latency < 1 for latency in self.observer.report_latencies)
+        record = ServerMqttClient.fleet.get(FIRST_RUNNER_ID)
+        assert record.state == RunnerState.STARTING.value
+        assert "uavcan.equipment.ice.reciprocating.Status" in \
+            ServerMqttClient.rp_messages[FIRST_RUNNER_ID]
+
+    def test_commands(self):
+        runner = self.runners[0]
+        self.broker.publish(f"ice_runner/server/rp_commander/{runner.run_id}/command", "start")
+        assert runner.state == RunnerState.STARTING
+        self.broker.publish("ice_runner/server/rp_commander/heartbeat", "7")
+        assert all(runner.published == 1 for runner in self.runners[1:])
+        assert ServerMqttClient.fleet.get(runner.run_id).online
+        self.broker.publish(f"ice_runner/server/rp_commander/{runner.run_id}/command", "stop")
+        assert runner.state == RunnerState.STOPPED
+
+    @pytest.mark.asyncio
+    async def test_step(self):
+        for runner in self.runners:
+            runner.report()
+        result = await run_step(self.runners, self.observer, 0.2, 50)
+        assert result["lost_requests"] == 0
+        assert len(self.observer.request_latencies) > 1
+        assert result["request_latency"] != "-"
+        # configuration replies of the runners pass the server to the observer
+        assert result["published"] > 0
+        assert result["received"] > 0
+        assert result["server"] == {"handled": 0, "dropped": 0, "max_depth": 0}
+
+    def test_server_stats_received(self):
+        self.broker.publish("ice_runner/server/stats", json.dumps(self.get_stats(10, 0, 1)))
+        self.observer.reset()
+        assert len(self.observer.server_stats) == 1
+        self.broker.publish("ice_runner/server/stats", json.dumps(self.get_stats(30, 2, 3)))
+        (_, first), (_, last) = self.observer.server_stats
+        assert first["ice_runner/raspberry_pi/+/state"]["handled"] == 10
+        assert last["ice_runner/raspberry_pi/+/state"]["dropped"] == 2
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import logging
+import os
+
+import pytest
+from common.algorithms import get_config_hash
+from server.FleetTable import FleetTable
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.fleet = FleetTable()
+
+class TestFleetTable(BaseTest):
+    def test_new_record(self):
+        record = self.fleet.get(1)
+        assert record.state is None
+        assert not record.online
+        assert record.to_dict()["id"] == 1
+
+    def test_state_change(self):
+        assert self.fleet.update_state(1, 2, 10)
+        assert not self.fleet.update_state(1, 2, 20)
+        assert self.fleet.get(1).timestamp == 10
+        assert self.fleet.update_state(1, 3, 30)
+        assert self.fleet.get(1).timestamp == 30
+        assert self.fleet.get(1).to_dict(42)["age"] == 12
+
+    def test_configuration_hash(self):
+        assert self.fleet.update_configuration(1, '{"a": 1, "b": 2}', 10)
+        assert not self.fleet.update_configuration(1, '{"b": 2, "a": 1}', 20)
+        assert self.fleet.get(1).config_hash == get_config_hash('{"a": 1, "b": 2}')
+        assert self.fleet.update_configuration(1, '{"a": 1, "b": 3}', 30)
+
+    def test_online(self):
+        self.fleet.update_state(1, 2, 10)
+        assert self.fleet.set_online(1, True)
+        assert not self.fleet.set_online(1, True)
+        assert self.fleet.set_online(1, False)
+        assert self.fleet.get(1).timestamp == 10
+
+class TestFleetSnapshot(BaseTest):
+    def test_updates_coalesced(self):
+        for i in range(10):
+            self.fleet.update_status(1, {"RPM": str(i)}, i)
+        self.fleet.update_state(2, 1, 5)
+        assert self.fleet.pop_dirty() == [1, 2]
+        assert self.fleet.pop_dirty() == []
+        assert not self.fleet.update_state(2, 1, 6)
+        assert self.fleet.pop_dirty() == []
+
+    def test_fleet(self):
+        self.fleet.update_status(1, {"RPM": "4500", "TEMP": "80 °C", "GAS/AIR": "50% 50%"}, 10)
+        self.fleet.update_state(1, 2, 12)
+        self.fleet.set_online(1, True)
+        fleet = self.fleet.get_fleet(15)
+        assert fleet["timestamp"] == 15
+        record = fleet["runners"][1]
+        assert record["state"] == 2
+        assert record["online"]
+        assert record["age"] == 3
+        assert record["metrics"] == {"RPM": "4500", "TEMP": "80 °C"}
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
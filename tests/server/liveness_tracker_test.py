@@ -0,0 +1,65 @@
+import logging
+import os
+
+import pytest
+from server.LivenessTracker import LivenessTracker
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.tracker = LivenessTracker(timeout=3)
+
+class TestTransitions(BaseTest):
+    def test_first_heartbeat_is_online_transition(self):
+        assert self.tracker.touch(1, 0)
+        assert not self.tracker.touch(1, 1)
+        assert self.tracker.is_online(1)
+
+    def test_expired(self):
+        self.tracker.touch(1, 0)
+        assert self.tracker.expire(2) == []
+        assert self.tracker.expire(3) == [1]
+        assert not self.tracker.is_online(1)
+        assert self.tracker.expire(10) == []
+
+    def test_heartbeat_prolongs_deadline(self):
+        self.tracker.touch(1, 0)
+        self.tracker.touch(1, 2)
+        assert self.tracker.expire(4) == []
+        assert self.tracker.expire(5) == [1]
+
+    def test_online_again(self):
+        self.tracker.touch(1, 0)
+        self.tracker.expire(5)
+        assert self.tracker.touch(1, 6)
+
+    def test_old_sequence_ignored(self):
+        self.tracker.touch(1, 0, seq=5)
+        assert not self.tracker.touch(1, 2, seq=4)
+        assert self.tracker.expire(3) == [1]
+
+class TestFleet(BaseTest):
+    def test_only_silent_runners_expire(self):
+        for runner_id in range(100):
+            self.tracker.touch(runner_id, 0)
+        for crnt_time in range(1, 10):
+            for runner_id in range(0, 100, 2):
+                self.tracker.touch(runner_id, crnt_time)
+            offline = self.tracker.expire(crnt_time)
+            if crnt_time == 3:
+                assert offline == list(range(1, 100, 2))
+            else:
+                assert offline == []
+        assert sorted(self.tracker.get_online()) == list(range(0, 100, 2))
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from common.log_transfer import CHUNK_SIZE, pack_chunk
+from server.LogReceiver import LogReceiver
+from server.mqtt.client import ServerMqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.data = os.urandom(CHUNK_SIZE * 2 + 100)
+
+    def get_offer(self, data: bytes, name: str = "candump", file: str = "candump_1.log",
+                  bundle: str = "1", bundle_size: int = 1):
+        return {"name": name, "file": file, "size": len(data),
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "bundle": bundle, "bundle_size": bundle_size}
+
+    def send(self, receiver: LogReceiver, data: bytes, transfer_id: str = "a", start: int = 0):
+        ack = None
+        for offset in range(start, len(data), CHUNK_SIZE):
+            ack = receiver.chunk(1, transfer_id, pack_chunk(offset, data[offset:offset + CHUNK_SIZE]))
+        return ack
+
+class TestLogReceiver(BaseTest):
+    def test_transfer(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        ack = receiver.offer(1, "a", self.get_offer(self.data))
+        assert ack["offset"] == 0
+        assert not ack["done"]
+        ack = self.send(receiver, self.data)
+        assert ack["done"]
+        assert ack["offset"] == len(self.data)
+        path = os.path.join(tmp_path, "1", "candump_1.log")
+        with open(path, "rb") as file:
+            assert file.read() == self.data
+        assert receiver.pop_completed() == [(1, {"candump": path})]
+        assert receiver.pop_completed() == []
+
+    def test_wrong_chunks_ignored(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        receiver.offer(1, "a", self.get_offer(self.data))
+        ack = receiver.chunk(1, "a", pack_chunk(CHUNK_SIZE, self.data[CHUNK_SIZE:2 * CHUNK_SIZE]))
+        assert ack["offset"] == 0
+        broken = bytearray(pack_chunk(0, self.data[:CHUNK_SIZE]))
+        broken[-1] ^= 0xFF
+        ack = receiver.chunk(1, "a", bytes(broken))
+        assert ack["offset"] == 0
+        assert receiver.chunk(1, "unknown", pack_chunk(0, self.data[:CHUNK_SIZE])) is None
+
+    def test_resume_after_restart(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        receiver.offer(1, "a", self.get_offer(self.data))
+        receiver.chunk(1, "a", pack_chunk(0, self.data[:CHUNK_SIZE]))
+        receiver = LogReceiver(str(tmp_path))
+        ack = receiver.offer(1, "a", self.get_offer(self.data))
+        assert ack["offset"] == CHUNK_SIZE
+        ack = self.send(receiver, self.data, start=CHUNK_SIZE)
+        assert ack["done"]
+        ack = LogReceiver(str(tmp_path)).offer(1, "a", self.get_offer(self.data))
+        assert ack["done"]
+
+    def test_bundle(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        receiver.offer(1, "a", self.get_offer(self.data, bundle_size=2))
+        self.send(receiver, self.data)
+        assert receiver.pop_completed() == []
+        empty_offer = self.get_offer(b"", name="NodeStatus", file="NodeStatus_1.csv",
+                                     bundle_size=2)
+        assert receiver.offer(1, "b", empty_offer)["done"]
+        completed = receiver.pop_completed()
+        assert len(completed) == 1
+        assert sorted(completed[0][1].keys()) == ["NodeStatus", "candump"]
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+class TestCompletedTransfers(BaseTest):
+    def test_forgotten_after_bundle(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        receiver.offer(1, "a", self.get_offer(self.data))
+        self.send(receiver, self.data)
+        assert len(receiver.pop_completed()) == 1
+        assert not receiver.transfers
+        assert not receiver.bundles
+
+    def test_repeated_offer(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        receiver.offer(1, "a", self.get_offer(self.data))
+        self.send(receiver, self.data)
+        receiver.pop_completed()
+        ack = receiver.offer(1, "a", self.get_offer(self.data))
+        assert ack["done"]
+        assert ack["offset"] == len(self.data)
+        assert receiver.chunk(1, "a", pack_chunk(0, self.data[:CHUNK_SIZE])) is None
+        assert not receiver.transfers
+        assert receiver.pop_completed() == []
+        assert not os.path.exists(os.path.join(tmp_path, "1", "candump_1.log.part"))
+
+class TestServerReceiving(BaseTest):
+    def setup_method(self, test_method):
+        super().setup_method(test_method)
+        self.saved = (ServerMqttClient.client, ServerMqttClient.log_receiver,
+                      ServerMqttClient.log_executor, ServerMqttClient.rp_logs)
+        ServerMqttClient.client = FakeClient()
+        ServerMqttClient.log_executor = ThreadPoolExecutor(max_workers=1)
+        ServerMqttClient.rp_logs = {}
+
+    def teardown_method(self, test_method):
+        ServerMqttClient.log_executor.shutdown(wait=True)
+        (ServerMqttClient.client, ServerMqttClient.log_receiver,
+         ServerMqttClient.log_executor, ServerMqttClient.rp_logs) = self.saved
+
+    @pytest.mark.asyncio
+    async def test_chunks_in_worker_thread(self, tmp_path):
+        receiver = LogReceiver(str(tmp_path))
+        ServerMqttClient.log_receiver = receiver
+        ServerMqttClient.receive_log(1, "a", receiver.offer, 1, "a", self.get_offer(self.data))
+        for offset in range(0, len(self.data), CHUNK_SIZE):
+            ServerMqttClient.receive_log(1, "a", receiver.chunk, 1, "a",
+                                         pack_chunk(offset, self.data[offset:offset + CHUNK_SIZE]))
+        for _ in range(100):
+            if ServerMqttClient.rp_logs:
+                break
+            await asyncio.sleep(0.01)
+        acks = [json.loads(payload) for topic, payload in ServerMqttClient.client.published
+                if topic.endswith("/ack")]
+        assert [ack["offset"] for ack in acks] == [0, CHUNK_SIZE, 2 * CHUNK_SIZE, len(self.data)]
+        assert ServerMqttClient.rp_logs[1] == {"candump": os.path.join(tmp_path, "1",
+                                                                       "candump_1.log")}
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+
+import pytest
+from paho.mqtt.client import MQTTMessage
+from server.mqtt.client import Route, ServerMqttClient, on_message
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+def make_message(topic: str, payload: str) -> MQTTMessage:
+    msg = MQTTMessage(topic=topic.encode())
+    msg.payload = payload.encode()
+    return msg
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.routes = ServerMqttClient.routes
+        ServerMqttClient.routes = []
+        self.handled = []
+
+    def teardown_method(self, test_method):
+        for route in ServerMqttClient.routes:
+            if route.task is not None:
+                route.task.cancel()
+        ServerMqttClient.routes = self.routes
+
+    def handler(self, client, userdata, msg):
+        del client, userdata
+        self.handled.append(msg.payload.decode())
+
+class TestRoute(BaseTest):
+    @pytest.mark.asyncio
+    async def test_handled_in_order(self):
+        route = Route("ice_runner/raspberry_pi/+/status", self.handler, 10)
+        route.start(None)
+        for i in range(5):
+            route.put(make_message("ice_runner/raspberry_pi/1/status", str(i)))
+        await asyncio.sleep(0.1)
+        assert self.handled == ["0", "1", "2", "3", "4"]
+        stats = route.get_stats()
+        assert stats["handled"] == 5
+        assert stats["dropped"] == 0
+        assert stats["max_depth"] == 5
+
+    @pytest.mark.asyncio
+    async def test_oldest_dropped(self):
+        route = Route("ice_runner/raspberry_pi/+/status", self.handler, 2)
+        route.start(None)
+        for i in range(5):
+            route.put(make_message("ice_runner/raspberry_pi/1/status", str(i)))
+        await asyncio.sleep(0.1)
+        assert self.handled == ["3", "4"]
+        assert route.get_stats()["dropped"] == 3
+
+    @pytest.mark.asyncio
+    async def test_handler_exception(self):
+        def failing_handler(client, userdata, msg):
+            raise ValueError(msg.payload.decode())
+        route = Route("ice_runner/bot/usr_cmd/stop", failing_handler, 10)
+        route.start(None)
+        route.put(make_message("ice_runner/bot/usr_cmd/stop", "1"))
+        await asyncio.sleep(0.1)
+        assert not route.task.done()
+        assert route.get_stats()["handled"] == 1
+
+class TestDispatch(BaseTest):
+    @pytest.mark.asyncio
+    async def test_matching_routes(self):
+        ServerMqttClient.route("ice_runner/raspberry_pi/+/status")(self.handler)
+        ServerMqttClient.route("ice_runner/raspberry_pi/#")(self.handler)
+        ServerMqttClient.route("ice_runner/bot/#")(self.handler)
+        for route in ServerMqttClient.routes:
+            route.start(None)
+        on_message(None, None, make_message("ice_runner/raspberry_pi/1/status", "status"))
+        await asyncio.sleep(0.1)
+        assert self.handled == ["status", "status"]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
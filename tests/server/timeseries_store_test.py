@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from server.TimeSeriesStore import (MAX_QUERY_POINTS, RAW_RESOLUTION, RETENTION,
+                                    TimeSeriesStore, get_numeric_fields)
+from server.mqtt.client import ServerMqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.start_time = 1_000_000.0
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = TimeSeriesStore(os.path.join(tmp_path, "timeseries.sqlite"))
+        yield store
+        store.close()
+
+class TestNumericFields(BaseTest):
+    def test_flatten(self):
+        message = {"engine_speed_rpm": "4500",
+                   "state": "2",
+                   "cylinder_status": [{"ignition_timing_deg": "1.5", "name": "first"}],
+                   "flags": True}
+        fields = get_numeric_fields(message)
+        assert fields == {"engine_speed_rpm": 4500.0,
+                          "state": 2.0,
+                          "cylinder_status.0.ignition_timing_deg": 1.5}
+
+class TestTimeSeriesStore(BaseTest):
+    def test_rollups(self, store):
+        for i in range(20):
+            store.add(3, "rpm", self.start_time + i * 0.5, float(i))
+        assert store.flush() == 20
+        assert store.flush() == 0
+        end = self.start_time + 20
+        raw = store.query(3, "rpm", self.start_time, end, RAW_RESOLUTION)
+        assert len(raw) == 20
+        second = store.query(3, "rpm", self.start_time, end, 1)
+        assert len(second) == 10
+        assert second[0] == [self.start_time, 0.5, 0, 1, 1]
+        minute = store.query(3, "rpm", self.start_time - 60, end, 60)
+        assert len(minute) == 1
+        assert minute[0][2:] == [0, 19, 19]
+        assert store.query(4, "rpm", self.start_time, end, 1) == []
+
+    def test_message_channels(self, store):
+        store.add_message(1, "uavcan.equipment.ice.reciprocating.Status",
+                          {"engine_speed_rpm": "4500", "oil_temperature": "350.0"},
+                          self.start_time)
+        store.flush()
+        assert sorted(store.get_channels(1)) ==\
+                ["uavcan.equipment.ice.reciprocating.Status.engine_speed_rpm",
+                 "uavcan.equipment.ice.reciprocating.Status.oil_temperature"]
+
+    def test_retention(self, store):
+        store.add(1, "rpm", self.start_time, 1)
+        store.flush()
+        store.prune(self.start_time + RETENTION[RAW_RESOLUTION] + 1)
+        assert store.query(1, "rpm", self.start_time - 60, self.start_time, RAW_RESOLUTION) == []
+        assert len(store.query(1, "rpm", self.start_time - 60, self.start_time, 60)) == 1
+
+    def test_choose_resolution(self, store):
+        crnt_time = self.start_time
+        assert store.choose_resolution(crnt_time - 60, crnt_time, crnt_time) == RAW_RESOLUTION
+        assert store.choose_resolution(crnt_time - 60 * 60, crnt_time, crnt_time) == 10
+        day_ago = crnt_time - 24 * 60 * 60
+        assert store.choose_resolution(day_ago - 10, day_ago + 100, crnt_time) == 10
+        assert store.choose_resolution(crnt_time - MAX_QUERY_POINTS * 100, crnt_time,
+                                       crnt_time) == 60
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+class TestQuery(BaseTest):
+    def setup_method(self, test_method):
+        super().setup_method(test_method)
+        self.saved = (ServerMqttClient.client, ServerMqttClient.tsdb,
+                      ServerMqttClient.tsdb_executor)
+        ServerMqttClient.client = FakeClient()
+        ServerMqttClient.tsdb_executor = ThreadPoolExecutor(max_workers=1)
+
+    def teardown_method(self, test_method):
+        ServerMqttClient.tsdb_executor.shutdown(wait=True)
+        (ServerMqttClient.client, ServerMqttClient.tsdb,
+         ServerMqttClient.tsdb_executor) = self.saved
+
+    @pytest.mark.asyncio
+    async def test_channels(self, store):
+        store.add(1, "rpm", self.start_time, 1)
+        store.flush()
+        ServerMqttClient.tsdb = store
+        task = ServerMqttClient.run_task(ServerMqttClient.answer_query({"req_id": "a",
+                                                                         "rp_id": 1}))
+        await asyncio.wait_for(task, 1)
+        topic, payload = ServerMqttClient.client.published[0]
+        assert topic == "ice_runner/server/bot_commander/tsdb/a"
+        assert json.loads(payload) == {"req_id": "a", "channels": ["rpm"]}
+        assert task not in ServerMqttClient.background_tasks
+
+    @pytest.mark.asyncio
+    async def test_failed_query_replied(self, store):
+        ServerMqttClient.tsdb = store
+        await ServerMqttClient.answer_query({"req_id": "b", "rp_id": "not a number"})
+        reply = json.loads(ServerMqttClient.client.published[0][1])
+        assert reply["req_id"] == "b"
+        assert "not a number" in reply["error"]
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import time
+
+import pytest
+from paho.mqtt.client import MQTTMessage
+from ice_sim.traffic_replay import HandlerTarget, TrafficWriter, read_traffic, replay
+from server.FleetTable import FleetTable
+from server.mqtt.client import ServerMqttClient
+
+logger = logging.getLogger()
+logger.level = logging.INFO
+
+def make_message(topic: str, payload: str, retain: bool = False) -> MQTTMessage:
+    msg = MQTTMessage(topic=topic.encode())
+    msg.payload = payload.encode()
+    msg.retain = retain
+    return msg
+
+class BaseTest():
+    def setup_method(self, test_method):
+        self.fleet = ServerMqttClient.fleet
+        ServerMqttClient.fleet = FleetTable()
+        self.messages = [
+            (0.0, make_message("ice_runner/raspberry_pi/5/state", "2")),
+            (0.1, make_message("ice_runner/raspberry_pi/5/status",
+                               json.dumps({"RPM": "4500 RPM"}))),
+            (0.2, make_message("ice_runner/raspberry_pi/5/state", "4")),
+            (0.3, make_message("ice_runner/server/bot_commander/fleet", "{}", retain=True)),
+        ]
+
+    def teardown_method(self, test_method):
+        ServerMqttClient.fleet = self.fleet
+
+    def write(self, path: str) -> str:
+        writer = TrafficWriter(path, start_time=100)
+        for offset, msg in self.messages:
+            writer.write(msg, 100 + offset)
+        writer.close()
+        return path
+
+class TestTrafficFile(BaseTest):
+    @pytest.mark.parametrize("name", ["capture.bin", "capture.bin.gz"])
+    def test_round_trip(self, tmp_path, name):
+        path = self.write(os.path.join(tmp_path, name))
+        messages = list(read_traffic(path))
+        assert len(messages) == len(self.messages)
+        for (offset, msg), (expected_offset, expected) in zip(messages, self.messages):
+            assert offset == pytest.approx(expected_offset)
+            assert msg.topic == expected.topic
+            assert msg.payload == expected.payload
+            assert msg.retain == expected.retain
+
+    def test_wrong_file(self, tmp_path):
+        path = os.path.join(tmp_path, "capture.bin")
+        with open(path, "wb") as file:
+            file.write(b"0" * 100)
+        with pytest.raises(ValueError):
+            list(read_traffic(path))
+
+class TestReplay(BaseTest):
+    @pytest.mark.asyncio
+    async def test_server_handlers(self, tmp_path):
+        path = self.write(os.path.join(tmp_path, "capture.bin"))
+        target = HandlerTarget("server")
+        result = await replay(read_traffic(path), target.publish, speed=0)
+        assert result["messages"] == len(self.messages)
+        record = ServerMqttClient.fleet.get(5)
+        assert record.state == 4
+        assert record.status == {"RPM": "4500 RPM"}
+        assert target.stats["handle_raspberry_pi_state"].calls == 2
+        assert "handle_raspberry_pi_status" in target.stats
+
+    @pytest.mark.asyncio
+    async def test_speed(self, tmp_path):
+        path = self.write(os.path.join(tmp_path, "capture.bin"))
+        published = []
+        start_time = time.time()
+        result = await replay(read_traffic(path), published.append, speed=3)
+        assert time.time() - start_time >= 0.1
+        assert result["messages"] == len(published) == len(self.messages)
+
+def main():
+    pytest_args = [
+        '--verbose',
+        '-W', 'ignore::DeprecationWarning',
+        os.path.abspath(__file__),
+    ]
+    pytest.main(pytest_args)
+if __name__ == "__main__":
+    main()